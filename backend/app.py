@@ -1,11 +1,14 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import Dict, List, Optional
 from datetime import datetime
 from fastapi.staticfiles import StaticFiles 
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 import logging
 import os
+import asyncio
 import json
 import firebase_admin
 from firebase_admin import credentials
@@ -13,12 +16,32 @@ import sys
 from pathlib import Path
 
 # --- IMPORT SERVICES ---
-from services.interaction_service import get_drug_analysis
+from services.med_report_service import med_reports
+from services.batch_analysis_service import screen_regimens
+from services.schemas import DrugAnalysis
+from services.serialization import dumps
 from services.chat_service import get_chat_response
 from services.calendar_service import calendar_service 
 from services.diagnostic_service import run_diagnosis
-
-app = FastAPI(title="MediBuddy & SafeDose API")
+from services.metrics import MetricsMiddleware, render_prometheus
+from services.upload_service import UploadLimitMiddleware, ingest_upload
+from services.job_service import job_queue, job_events, JobQueueFull
+from services.clients import get_state_store
+from services.http_cache import CompressionMiddleware, conditional_json
+from services.reminder_service import reminder_scheduler
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start the diagnosis worker pool and resume jobs left over from a restart
+    job_queue.start()
+    # Rebuild the in-memory reminder wheel from the reminders table
+    reminder_scheduler.start()
+    yield
+    reminder_scheduler.stop()
+    med_reports.stop()
+    job_queue.stop()
+
+app = FastAPI(title="MediBuddy & SafeDose API", lifespan=lifespan)
 
 # Add the current directory to sys.path so Vercel can find the 'services' folder
 sys.path.append(str(Path(__file__).parent))
@@ -57,12 +80,23 @@ origins = [
     "https://medicare-vision.vercel.app",
 ]
 
+# Reject oversized uploads before the multipart body is spooled
+app.add_middleware(UploadLimitMiddleware)
+
+# gzip/brotli for large complete responses (streams are left alone)
+app.add_middleware(CompressionMiddleware)
+
+# Per-route latency histograms, exposed at /metrics
+app.add_middleware(MetricsMiddleware)
+
+# Registered last so it is outermost: early 413s from the upload limit get CORS headers too
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag"],
 )
 
 # --- API MODELS ---
@@ -70,6 +104,14 @@ app.add_middleware(
 class AnalysisRequest(BaseModel):
     medication_list: List[str]
 
+class RegimenEntry(BaseModel):
+    patient_id: Optional[str] = None
+    # k drugs make k*(k-1)/2 pairs, so one oversized regimen could fan out into thousands of prompts
+    medication_list: List[str] = Field(..., max_length=int(os.getenv("MAX_REGIMEN_MEDICATIONS", "50")))
+
+class BatchAnalysisRequest(BaseModel):
+    regimens: List[RegimenEntry] = Field(..., max_length=int(os.getenv("MAX_BATCH_REGIMENS", "20000")))
+
 class ChatRequest(BaseModel):
     user_id: str
     query: str
@@ -95,17 +137,99 @@ class Appointment(BaseModel):
     whatsapp: Optional[str] = None
     googleCredentials: Optional[dict] = None
 
+    # Reminders and the calendar event both parse these, so reject other formats up front
+    @field_validator("date")
+    @classmethod
+    def _check_date(cls, value: str) -> str:
+        datetime.strptime(value, "%Y-%m-%d")
+        return value
+
+    @field_validator("time")
+    @classmethod
+    def _check_time(cls, value: str) -> str:
+        datetime.strptime(value, "%H:%M")
+        return value
+
 class CalendarTokenRequest(BaseModel):
     code: str
     userId: str
 
-# --- IN-MEMORY DATABASE (MOCK) ---
-doctors_db = []
-appointments_db = []
+# --- RESPONSE MODELS ---
+# Declaring these lets FastAPI serialize straight to JSON bytes in pydantic-core
+# (see benchmarks/bench_serialization.py) instead of jsonable_encoder + json.dumps.
+
+class ChatResponse(BaseModel):
+    text: str
+    role: str
+
+class DiagnosisResponse(BaseModel):
+    transcription: str
+    analysis: str
+    audio_url: Optional[str] = None
+
+class DiagnosisJobResponse(BaseModel):
+    job_id: str
+    status: str
+    transcription: Optional[str] = None
+    analysis: Optional[str] = None
+    audio_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+    status_url: Optional[str] = None
+    events_url: Optional[str] = None
+
+class MedicationEntry(BaseModel):
+    name: str
+    normalized_name: str
+    category: str
+
+class AnalysisResponse(DrugAnalysis):
+    medication_count: int
+    medications: List[MedicationEntry]
+
+class DoctorRecord(Doctor):
+    id: int
+
+class DoctorsResponse(BaseModel):
+    doctors: List[DoctorRecord]
+
+class AddDoctorResponse(BaseModel):
+    message: str
+    doctor: DoctorRecord
+
+class AppointmentRecord(Appointment):
+    id: int
+    createdAt: str
+    calendarEventId: Optional[str] = None
+    calendarEventLink: Optional[str] = None
+    calendarId: Optional[str] = None
+
+class BookingResponse(BaseModel):
+    message: str
+    appointment: AppointmentRecord
+    calendarResult: Optional[dict] = None
+
+class AppointmentsResponse(BaseModel):
+    appointments: List[AppointmentRecord]
+
+class CancelAppointmentResponse(BaseModel):
+    message: str
+    appointmentId: int
+    remindersCancelled: int
+    calendarResult: Optional[dict] = None
+
+class AuthUrlResponse(BaseModel):
+    auth_url: str
+    state: str
+
+class CalendarTokenResponse(BaseModel):
+    success: bool
+    credentials: dict
 
 # --- AI ASSISTANT ROUTES ---
 
-@app.post("/api/chat")
+@app.post("/api/chat", response_model=ChatResponse)
 async def chat_with_assistant(request: ChatRequest):
     """
     Main Chat Endpoint: Sends user query and profile context to Gemini.
@@ -125,7 +249,7 @@ async def chat_with_assistant(request: ChatRequest):
             detail=f"MediBuddy Service Error: {str(e)}"
         )
 
-@app.post("/api/diagnose")
+@app.post("/api/diagnose", response_model=DiagnosisResponse)
 async def analyze_health_packet(
     image: Optional[UploadFile] = File(None),
     audio: Optional[UploadFile] = File(None),
@@ -133,31 +257,83 @@ async def analyze_health_packet(
 ):
     """
     Multimodal Endpoint: Processes voice memos or symptoms images.
+    Uploads are validated and handed over in place (bytes or mmap), never read whole.
     """
+    image_upload = audio_upload = None
     try:
-        image_bytes = await image.read() if image else None
-        audio_bytes = await audio.read() if audio else None
-
+        # Inside the try, so an image already spooled is closed if the audio is rejected
+        image_upload = await ingest_upload(image, "image") if image else None
+        audio_upload = await ingest_upload(audio, "audio") if audio else None
         result = await run_diagnosis(
             user_id=user_id,
-            image_data=image_bytes,
-            audio_data=audio_bytes,
-            image_mime=image.content_type if image else None
+            image_data=image_upload,
+            audio_data=audio_upload,
+            image_mime=image_upload.content_type if image_upload else None
         )
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Diagnostic Error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to process medical data")
+    finally:
+        for upload in (image_upload, audio_upload):
+            if upload:
+                upload.close()
+
+@app.post("/api/diagnose/jobs", status_code=202, response_model=DiagnosisJobResponse)
+async def submit_diagnosis_job(
+    image: Optional[UploadFile] = File(None),
+    audio: Optional[UploadFile] = File(None),
+    user_id: str = Form(...)
+):
+    """
+    Async Multimodal Endpoint: Queues the diagnosis and returns a job ID right away.
+    Poll /api/diagnose/jobs/{job_id} or stream /api/diagnose/jobs/{job_id}/events.
+    """
+    image_upload = audio_upload = None
+    try:
+        image_upload = await ingest_upload(image, "image") if image else None
+        audio_upload = await ingest_upload(audio, "audio") if audio else None
+        job = await asyncio.to_thread(job_queue.submit, user_id, image_upload, audio_upload)
+    except JobQueueFull:
+        raise HTTPException(status_code=503, detail="Diagnosis queue is full, please retry shortly")
+    finally:
+        for upload in (image_upload, audio_upload):
+            if upload:
+                upload.close()
+
+    job["status_url"] = f"/api/diagnose/jobs/{job['job_id']}"
+    job["events_url"] = f"/api/diagnose/jobs/{job['job_id']}/events"
+    return job
+
+@app.get("/api/diagnose/jobs/{job_id}", response_model=DiagnosisJobResponse)
+async def get_diagnosis_job(job_id: str):
+    job = job_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/api/diagnose/jobs/{job_id}/events")
+async def stream_diagnosis_job(job_id: str):
+    if not job_queue.get(job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_events(job_queue, job_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 # --- MEDICATION ANALYSIS ROUTES ---
 
-@app.post("/api/analyze")
+@app.post("/api/analyze", response_model=AnalysisResponse)
 async def check_risk(request: AnalysisRequest):
     """
     SafeDose Interaction Checker: Analyzes drug-to-drug risks.
     """
     med_names = request.medication_list
-    ai_result = await get_drug_analysis(med_names)
+    # Served from the precomputed report when this med set was seen before
+    ai_result = await med_reports.analyze(med_names)
     
     structured_meds = [
         {"name": name, "normalized_name": name.lower().strip(), "category": "Medication"}
@@ -172,23 +348,51 @@ async def check_risk(request: AnalysisRequest):
         "medications": structured_meds 
     }
 
-# --- APPOINTMENT & DOCTOR ROUTES ---
+@app.post("/api/analyze/batch")
+async def check_risk_batch(request: BatchAnalysisRequest):
+    """
+    Population Screening: Analyzes many regimens at once, streamed back as NDJSON.
+    One line per patient (same shape as /api/analyze plus patient_id), then a summary line.
+    """
+    regimens = [
+        (entry.patient_id if entry.patient_id is not None else str(i), entry.medication_list)
+        for i, entry in enumerate(request.regimens)
+    ]
 
-@app.get("/doctors")
-async def get_doctors():
-    return {"doctors": doctors_db}
+    async def ndjson_lines():
+        async for record in screen_regimens(regimens):
+            yield dumps(record) + b"\n"
 
-@app.post("/doctors")
+    return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+
+# --- APPOINTMENT & DOCTOR ROUTES ---
+
+@app.get("/doctors", response_model=DoctorsResponse)
+async def get_doctors(request: Request, wait: float = Query(0, ge=0)):
+    """
+    Doctor list with a version ETag: If-None-Match gets a 304, and with
+    ?wait=N the request waits up to N seconds for a change (long-poll).
+    """
+    store = get_state_store()
+    # Rows were validated on insert, so conditional_json returns orjson bytes (rendered
+    # once per version) and response_model is only documentation here (see bench_serialization)
+    return await conditional_json(
+        request, "doctors", store.epoch,
+        lambda: store.version("doctors"),
+        lambda: {"doctors": store.all("doctors")},
+        wait,
+    )
+
+@app.post("/doctors", response_model=AddDoctorResponse)
 async def add_doctor(doctor: Doctor):
-    doctor_dict = doctor.model_dump()
-    doctor_dict["id"] = len(doctors_db) + 1
-    doctors_db.append(doctor_dict)
+    doctor_dict = get_state_store().add("doctors", doctor.model_dump())
     return {"message": "Doctor added successfully", "doctor": doctor_dict}
 
-@app.post("/appointments")
+@app.post("/appointments", response_model=BookingResponse)
 async def book_appointment(appointment: Appointment):
     appointment_dict = appointment.model_dump()
-    appointment_dict["id"] = len(appointments_db) + 1
+    # Shared counter, so ids stay unique across workers
+    appointment_dict["id"] = get_state_store().next_id("appointments")
     appointment_dict["createdAt"] = datetime.now().isoformat()
     
     calendar_result = None
@@ -200,22 +404,48 @@ async def book_appointment(appointment: Appointment):
         if calendar_result.get('success'):
             appointment_dict['calendarEventId'] = calendar_result.get('event_id')
             appointment_dict['calendarEventLink'] = calendar_result.get('event_link')
+            appointment_dict['calendarId'] = calendar_result.get('calendar_id')
     
-    appointments_db.append(appointment_dict)
+    get_state_store().add("appointments", appointment_dict, owner=appointment.userId)
+    reminder_scheduler.schedule_appointment(appointment_dict)
     
     response = {"message": "Appointment booked successfully", "appointment": appointment_dict}
     if calendar_result:
         response['calendarResult'] = calendar_result
     return response
 
-@app.get("/appointments/{user_id}")
-async def get_user_appointments(user_id: str):
-    user_appointments = [apt for apt in appointments_db if apt.get("userId") == user_id]
-    return {"appointments": user_appointments}
+@app.get("/appointments/{user_id}", response_model=AppointmentsResponse)
+async def get_user_appointments(request: Request, user_id: str, wait: float = Query(0, ge=0)):
+    """Same conditional GET / long-poll contract as GET /doctors, versioned per user."""
+    store = get_state_store()
+    return await conditional_json(
+        request, f"appointments:{user_id}", store.epoch,
+        lambda: store.owner_version("appointments", user_id),
+        lambda: {"appointments": store.by_owner("appointments", user_id)},
+        wait,
+    )
+
+@app.delete("/appointments/{appointment_id}", response_model=CancelAppointmentResponse)
+async def cancel_appointment(appointment_id: int):
+    store = get_state_store()
+    appointment = store.get("appointments", appointment_id)
+    if not appointment or not store.delete("appointments", appointment_id):
+        raise HTTPException(status_code=404, detail="Appointment not found")
+
+    response = {
+        "message": "Appointment cancelled successfully",
+        "appointmentId": appointment_id,
+        "remindersCancelled": reminder_scheduler.cancel_appointment(appointment_id),
+    }
+    if appointment.get("calendarEventId") and appointment.get("googleCredentials"):
+        response["calendarResult"] = calendar_service.delete_calendar_event(
+            appointment["googleCredentials"], appointment["calendarEventId"], appointment.get("calendarId")
+        )
+    return response
 
 # --- GOOGLE CALENDAR OAUTH ROUTES ---
 
-@app.get("/api/calendar/auth-url")
+@app.get("/api/calendar/auth-url", response_model=AuthUrlResponse)
 async def get_calendar_auth_url(user_id: str):
     try:
         auth_url, state = calendar_service.get_authorization_url(state=user_id)
@@ -223,7 +453,7 @@ async def get_calendar_auth_url(user_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/calendar/token")
+@app.post("/api/calendar/token", response_model=CalendarTokenResponse)
 async def exchange_calendar_token(request: CalendarTokenRequest):
     try:
         token_data = calendar_service.exchange_code_for_token(request.code)
@@ -231,6 +461,13 @@ async def exchange_calendar_token(request: CalendarTokenRequest):
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Failed to exchange token: {str(e)}")
 
+# --- OBSERVABILITY ---
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Prometheus scrape endpoint: stage latencies, request latencies and cache hit rates."""
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def home():
     return {"status": "MediBuddy & SafeDose Backend Running"}
\ No newline at end of file
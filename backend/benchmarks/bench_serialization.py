@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Serialization micro-benchmarks for large /doctors and /appointments payloads.
+
+Compares the ways a route can turn its return value into bytes:
+
+    stdlib     jsonable_encoder + json.dumps (FastAPI's default, no response model)
+    orjson     orjson.dumps on the plain dict (services.serialization.dumps)
+    model+orj  response-model validation, python-mode dump, then orjson
+    model      response-model validation + pydantic-core dump_json (FastAPI's path
+               when a route has a response model and the default response class)
+
+    cd backend
+    python -m benchmarks.bench_serialization --doctors 5000 --appointments 20000
+
+The doctor and appointment lists are validated on write, so their GET routes
+use the orjson path (http_cache.conditional_json, once per version); routes returning small, freshly built dicts keep their
+response models.
+"""
+import sys
+import json
+import timeit
+import argparse
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from benchmarks.fakes import install_fakes
+from benchmarks.run_benchmarks import BACKEND_DIR
+
+
+def build_payloads(doctors: int, appointments: int):
+    doctor_rows = [
+        {"id": i + 1, "name": f"Dr. Example {i}", "location": "Pune, Maharashtra", "speciality": "Cardiology",
+         "education": "MBBS, MD (Internal Medicine)", "ratings": 4.0 + (i % 10) / 10}
+        for i in range(doctors)
+    ]
+    appointment_rows = [
+        {"id": i + 1, "doctorId": i % 50 + 1, "doctorName": f"Dr. Example {i % 50}", "patientName": f"Patient {i}",
+         "patientEmail": f"patient{i}@example.com", "date": "2026-11-02", "time": "10:30", "userId": f"user{i % 500}",
+         "location": "City Clinic", "whatsapp": "+910000000000", "googleCredentials": None,
+         "createdAt": "2026-10-19T09:15:00", "calendarEventId": None, "calendarEventLink": None}
+        for i in range(appointments)
+    ]
+    return {"doctors": doctor_rows}, {"appointments": appointment_rows}
+
+
+def bench(name: str, payload: dict, model, repeat: int):
+    adapter = TypeAdapter(model)
+
+    def stdlib():
+        return json.dumps(jsonable_encoder(payload), ensure_ascii=False, separators=(",", ":")).encode()
+
+    def orjson_plain():
+        return orjson.dumps(payload)
+
+    def model_orjson():
+        return orjson.dumps(adapter.dump_python(adapter.validate_python(payload), mode="json"))
+
+    def model_json():
+        return adapter.dump_json(adapter.validate_python(payload))
+
+    size = len(orjson_plain())
+    print(f"\n{name}: {size / 1024:.0f}KB")
+    baseline = None
+    for label, func in (("stdlib", stdlib), ("orjson", orjson_plain), ("model+orj", model_orjson), ("model", model_json)):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        baseline = baseline or best
+        print(f"  {label:<10} {best * 1000:8.2f} ms   {baseline / best:5.1f}x")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--doctors", type=int, default=5000)
+    parser.add_argument("--appointments", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    install_fakes(latency_scale=0)
+    sys.path.insert(0, BACKEND_DIR)
+    from app import DoctorsResponse, AppointmentsResponse
+
+    doctors, appointments = build_payloads(args.doctors, args.appointments)
+    bench(f"GET /doctors ({args.doctors} doctors)", doctors, DoctorsResponse, args.repeat)
+    bench(f"GET /appointments ({args.appointments} appointments)", appointments, AppointmentsResponse, args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Memory profile of /api/diagnose under concurrent large PDF uploads.
+
+Builds a PDF padded to --size-mb with an incompressible attachment, fires
+--concurrency uploads at once through the in-process app (fakes for every
+external service) and reports the growth of the process's peak RSS. RSS
+counts what tracemalloc can't see: buffers pymupdf/PIL allocate in C and
+mmap'd upload pages that were touched. With streaming ingestion the peak
+should stay near concurrency x spool threshold rather than concurrency x
+upload size.
+
+--size-mb must fit under MAX_IMAGE_UPLOAD_MB (25 by default); raise the cap
+for bigger files:
+
+    cd backend
+    python -m benchmarks.bench_upload_memory --size-mb 20 --concurrency 4
+    MAX_IMAGE_UPLOAD_MB=64 python -m benchmarks.bench_upload_memory --size-mb 50
+
+Exits non-zero if the peak grows by more than --max-ratio of the combined
+upload size, or if an upload above the request cap is not rejected with 413.
+"""
+import os
+import gc
+import sys
+import asyncio
+import argparse
+import resource
+import tempfile
+
+from benchmarks.fakes import install_fakes
+from benchmarks.loadgen import ASGITransport
+from benchmarks.run_benchmarks import BACKEND_DIR, _multipart
+
+
+def _status_kb(field: str):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def reset_peak_rss():
+    """
+    Starts a fresh peak measurement. Returns the baseline to compare the peak
+    against: current RSS where the kernel can reset the high-water mark
+    (Linux), else the lifetime peak so far, which can understate growth.
+    """
+    gc.collect()
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        rss = _status_kb("VmRSS")
+        if rss is not None:
+            return rss
+    except OSError:
+        pass
+    return peak_rss()
+
+
+def peak_rss() -> int:
+    """Peak resident set size in bytes (VmHWM, or ru_maxrss where /proc is missing)."""
+    peak = _status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def build_pdf(size_bytes: int) -> bytes:
+    import pymupdf
+
+    doc = pymupdf.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), "Haemoglobin 13.2 g/dL  WBC 6.1 x10^9/L  Platelets 250 x10^9/L")
+    doc.embfile_add("raw_scan.bin", os.urandom(size_bytes))
+    data = doc.tobytes(deflate=False)
+    doc.close()
+    return data
+
+
+async def _run(args) -> int:
+    install_fakes(latency_scale=0)
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="medibuddy-bench-"))
+    from app import app
+    from services.upload_service import MAX_IMAGE_BYTES, MAX_REQUEST_BYTES, SPOOL_THRESHOLD
+
+    pdf = build_pdf(args.size_mb * 1024 * 1024)
+    if len(pdf) > MAX_IMAGE_BYTES:
+        print(f"--size-mb {args.size_mb} builds a {len(pdf) / 2**20:.1f}MB PDF, above the "
+              f"{MAX_IMAGE_BYTES // 2**20}MB image cap; set MAX_IMAGE_UPLOAD_MB higher")
+        return 2
+    requests = [
+        _multipart({"user_id": f"user{i}"}, {"image": ("report.pdf", "application/pdf", pdf)})
+        for i in range(args.concurrency)
+    ]
+    transport = ASGITransport(app)
+    await transport.startup()
+
+    # One tiny upload first, so lazy imports and pools aren't counted as growth
+    # (kept small: a big one would leave freed heap behind for the real run to reuse)
+    warmup_body, warmup_headers = _multipart(
+        {"user_id": "warmup"}, {"image": ("report.pdf", "application/pdf", build_pdf(64 * 1024))}
+    )
+    await transport.request("POST", "/api/diagnose", warmup_body, warmup_headers)
+
+    baseline = reset_peak_rss()
+    responses = await asyncio.gather(*(
+        transport.request("POST", "/api/diagnose", body, headers) for body, headers in requests
+    ))
+    peak = peak_rss()
+
+    oversized_body, oversized_headers = _multipart(
+        {"user_id": "user0"}, {"image": ("huge.pdf", "application/pdf", b"0" * (MAX_REQUEST_BYTES + 1))}
+    )
+    oversized = await transport.request("POST", "/api/diagnose", oversized_body, oversized_headers)
+    await transport.shutdown()
+
+    upload_total = len(pdf) * args.concurrency
+    growth = peak - baseline
+    ratio = growth / upload_total
+    statuses = sorted({r.status for r in responses})
+    print(f"uploads:          {args.concurrency} x {len(pdf) / 2**20:.1f}MB (statuses {statuses})")
+    print(f"spool threshold:  {SPOOL_THRESHOLD / 2**20:.1f}MB")
+    print(f"peak RSS growth:  {growth / 2**20:.1f}MB ({ratio:.1%} of combined upload size)")
+    print(f"oversized upload: HTTP {oversized.status}")
+
+    failed = False
+    if statuses != [200]:
+        print("FAIL: not every upload succeeded")
+        failed = True
+    if ratio > args.max_ratio:
+        print(f"FAIL: peak RSS growth above {args.max_ratio:.0%} of upload size")
+        failed = True
+    if oversized.status != 413:
+        print("FAIL: oversized upload was not rejected with 413")
+        failed = True
+    return 1 if failed else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size-mb", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--max-ratio", type=float, default=0.25,
+                        help="Allowed peak RSS growth as a fraction of the combined upload size")
+    return asyncio.run(_run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Multi-worker scale-out benchmark for the shared doctors/appointments state.
+
+Starts `uvicorn --workers N` for each N (fakes for every external service,
+state in a fresh SQLite file per run), drives it over real HTTP from several
+client processes, then checks that every worker saw the same records and that
+no ids were handed out twice:
+
+    cd backend
+    python -m benchmarks.bench_workers --workers 1 2 4 8 --requests 4000
+    STATE_BACKEND=redis REDIS_URL=redis://localhost:6379/0 python -m benchmarks.bench_workers
+
+Pass/fail is about correctness (shared records, unique ids), not speed.
+Throughput can only scale up to the number of cores on the box, and scaling
+has not been measured yet: the only recorded run was on a single-CPU build
+box, where throughput stayed flat from 1 to 8 workers. Run it on a multi-core
+machine before relying on any scaling figure.
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+from benchmarks.loadgen import HTTPTransport, run_load
+from benchmarks.run_benchmarks import BACKEND_DIR, build_scenarios
+
+STATE_SCENARIOS = ("/doctors", "/appointments")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_server(workers: int, port: int, latency_scale: float, workdir: str):
+    env = dict(os.environ, BENCH_LATENCY_SCALE=str(latency_scale), STATE_REDIS_PREFIX=f"bench{port}")
+    cmd = [sys.executable, "-m", "uvicorn", "benchmarks.fake_app:app", "--app-dir", BACKEND_DIR,
+           "--host", "127.0.0.1", "--port", str(port), "--workers", str(workers), "--log-level", "warning"]
+    return subprocess.Popen(cmd, cwd=workdir, env=env)
+
+
+def _wait_ready(base_url: str, server, timeout: float = 60.0):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"uvicorn exited with {server.returncode}")
+        try:
+            if httpx.get(base_url + "/").status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("uvicorn did not become ready")
+
+
+def _client_process(base_url: str, requests: int, concurrency: int) -> dict:
+    scenarios = [s for s in build_scenarios() if s.name.endswith(STATE_SCENARIOS) or "/appointments/" in s.name]
+
+    async def run():
+        transport = HTTPTransport(base_url, max_connections=concurrency)
+        await transport.startup()
+        try:
+            return await run_load(transport, scenarios, requests, concurrency)
+        finally:
+            await transport.shutdown()
+
+    return asyncio.run(run())
+
+
+def _merge(reports: list) -> dict:
+    """Sums throughput across client processes; latency percentiles are the worst process's."""
+    merged = {}
+    for report in reports:
+        for name, row in report.items():
+            if name.startswith("_"):
+                continue
+            into = merged.setdefault(name, {"requests": 0, "errors": 0, "throughput_rps": 0.0,
+                                            "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0})
+            into["requests"] += row["requests"]
+            into["errors"] += row["errors"]
+            into["throughput_rps"] += row["throughput_rps"]
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                into[key] = max(into[key], row[key])
+    return merged
+
+
+def _check_consistency(base_url: str, report: dict, users: int = 50) -> list:
+    """Every doctor/booking written through any worker must be visible once, with unique ids."""
+    import httpx
+
+    problems = []
+    doctors = httpx.get(base_url + "/doctors").json()["doctors"]
+    created = report["POST /doctors"]["requests"] - report["POST /doctors"]["errors"]
+    ids = [d["id"] for d in doctors]
+    if len(set(ids)) != len(ids):
+        problems.append("duplicate doctor ids")
+    if len(doctors) != created:
+        problems.append(f"{created} doctors created but {len(doctors)} listed")
+
+    booked = report["POST /appointments"]["requests"] - report["POST /appointments"]["errors"]
+    appointment_ids = []
+    for user in range(users):
+        appointment_ids += [a["id"] for a in httpx.get(f"{base_url}/appointments/user{user}").json()["appointments"]]
+    if len(set(appointment_ids)) != len(appointment_ids):
+        problems.append("duplicate appointment ids")
+    if len(appointment_ids) != booked:
+        problems.append(f"{booked} appointments booked but {len(appointment_ids)} listed")
+    return problems
+
+
+def run_for_workers(workers: int, args) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    workdir = tempfile.mkdtemp(prefix=f"medibuddy-workers{workers}-")
+    server = _start_server(workers, port, args.latency_scale, workdir)
+    try:
+        _wait_ready(base_url, server)
+        per_process = args.requests // args.client_procs
+        started = time.perf_counter()
+        with multiprocessing.Pool(args.client_procs) as pool:
+            reports = pool.starmap(_client_process, [(base_url, per_process, args.concurrency)] * args.client_procs)
+        elapsed = time.perf_counter() - started
+        merged = _merge(reports)
+        total = sum(row["requests"] for row in merged.values())
+        return {
+            "workers": workers,
+            "requests": total,
+            "errors": sum(row["errors"] for row in merged.values()),
+            "throughput_rps": round(total / elapsed, 1),
+            "p95_ms": max(row["p95_ms"] for row in merged.values()),
+            "problems": _check_consistency(base_url, merged),
+        }
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--requests", type=int, default=4000, help="Total requests per worker count")
+    parser.add_argument("--concurrency", type=int, default=32, help="In-flight requests per client process")
+    parser.add_argument("--client-procs", type=int, default=4, help="Load generator processes")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="Multiplier on the fakes' latencies (0 measures the app itself)")
+    args = parser.parse_args(argv)
+
+    print(f"{os.cpu_count()} CPUs available")
+    if max(args.workers) > (os.cpu_count() or 1):
+        print("note: more workers than CPUs, speedup past the CPU count is not expected")
+    print(f"{'workers':>8}{'reqs':>8}{'errs':>6}{'rps':>10}{'speedup':>9}{'p95 ms':>10}  consistency")
+    baseline = None
+    failed = False
+    for workers in args.workers:
+        row = run_for_workers(workers, args)
+        baseline = baseline or row["throughput_rps"]
+        failed = failed or bool(row["problems"])
+        print(f"{row['workers']:>8}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>10}"
+              f"{row['throughput_rps'] / baseline:>8.2f}x{row['p95_ms']:>10}  {'; '.join(row['problems']) or 'ok'}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,11 @@
+"""
+ASGI entrypoint for multi-process benchmarks: the real app with every external
+service faked. Used by bench_workers.py as `uvicorn benchmarks.fake_app:app`.
+"""
+import os
+
+from benchmarks.fakes import install_fakes
+
+install_fakes(seed=os.getpid(), latency_scale=float(os.getenv("BENCH_LATENCY_SCALE", "1.0")))
+
+from app import app  # noqa: E402  (must import after the fakes are installed)
@@ -0,0 +1,297 @@
+"""
+Local stand-ins for every external service the backend talks to.
+
+Each fake mimics just enough of the real SDK surface used in services/ and
+sleeps for a configurable latency (blocking, like the real sync SDKs) and
+fails at a configurable rate. install_fakes() plugs them in through
+services.clients.override().
+"""
+import json
+import time
+import random
+import itertools
+import threading
+from dataclasses import dataclass
+from datetime import datetime
+
+from services import clients
+
+
+class FakeServiceError(Exception):
+    """Raised by a fake when its configured error rate fires."""
+
+
+@dataclass
+class LatencyProfile:
+    mean_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def wait(self, rng: random.Random, service: str):
+        delay = self.mean_ms
+        if self.jitter_ms:
+            delay = max(0.0, rng.gauss(self.mean_ms, self.jitter_ms))
+        if delay:
+            time.sleep(delay / 1000.0)
+        if self.error_rate and rng.random() < self.error_rate:
+            raise FakeServiceError(f"{service}: injected failure")
+
+
+# Rough production latencies, used when a profile is not given explicitly
+DEFAULT_PROFILES = {
+    "firestore": LatencyProfile(mean_ms=15, jitter_ms=5),
+    "gemini": LatencyProfile(mean_ms=900, jitter_ms=250),
+    "groq_chat": LatencyProfile(mean_ms=1200, jitter_ms=300),
+    "groq_whisper": LatencyProfile(mean_ms=600, jitter_ms=150),
+    "tts": LatencyProfile(mean_ms=400, jitter_ms=100),
+    "calendar": LatencyProfile(mean_ms=150, jitter_ms=40),
+}
+
+
+class _Fake:
+    def __init__(self, service: str, profile: LatencyProfile = None, seed: int = None):
+        self._service = service
+        self._profile = profile or DEFAULT_PROFILES[service]
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def _call(self):
+        with self._rng_lock:
+            rng = random.Random(self._rng.random())
+        self._profile.wait(rng, self._service)
+
+
+def _namespace(**attrs):
+    return type("FakeObject", (), attrs)()
+
+
+# --- FIRESTORE ---
+
+class FakeSnapshot:
+    def __init__(self, doc_id: str, data: dict):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeQuery:
+    def __init__(self, collection, order_field=None, descending=False, limit=None):
+        self._collection = collection
+        self._order_field = order_field
+        self._descending = descending
+        self._limit = limit
+
+    def order_by(self, field, direction="ASCENDING"):
+        return FakeQuery(self._collection, field, direction == "DESCENDING", self._limit)
+
+    def limit(self, count):
+        return FakeQuery(self._collection, self._order_field, self._descending, count)
+
+    def stream(self):
+        self._collection._store._call()
+        with self._collection._store._lock:
+            items = list(self._collection._docs.items())
+        if self._order_field:
+            items.sort(key=lambda kv: kv[1].get(self._order_field), reverse=self._descending)
+        if self._limit is not None:
+            items = items[:self._limit]
+        return iter([FakeSnapshot(doc_id, data) for doc_id, data in items])
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeDocument:
+    def __init__(self, store, path: str):
+        self._store = store
+        self._path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name: str):
+        return self._store._collection(f"{self._path}/{name}")
+
+    def set(self, data: dict, merge: bool = False):
+        self._store._call()
+        parent, doc_id = self._path.rsplit("/", 1)
+        docs = self._store._collection(parent)._docs
+        with self._store._lock:
+            if merge and doc_id in docs:
+                docs[doc_id].update(data)
+            else:
+                docs[doc_id] = dict(data)
+
+    def get(self):
+        self._store._call()
+        parent, doc_id = self._path.rsplit("/", 1)
+        return FakeSnapshot(doc_id, self._store._collection(parent)._docs.get(doc_id))
+
+
+class FakeCollection(FakeQuery):
+    def __init__(self, store, path: str):
+        super().__init__(self)
+        self._store = store
+        self._path = path
+        self._docs = {}
+
+    def document(self, doc_id: str):
+        return FakeDocument(self._store, f"{self._path}/{doc_id}")
+
+    def add(self, data: dict):
+        self._store._call()
+        with self._store._lock:
+            doc_id = f"doc{next(self._store._ids)}"
+            self._docs[doc_id] = dict(data)
+        return datetime.now(), FakeDocument(self._store, f"{self._path}/{doc_id}")
+
+
+class FakeFirestore(_Fake):
+    """In-memory Firestore covering collection/document/add/set/get/order_by/limit/stream."""
+
+    def __init__(self, profile: LatencyProfile = None, seed: int = None):
+        super().__init__("firestore", profile, seed)
+        self._lock = threading.Lock()
+        self._collections = {}
+        self._ids = itertools.count(1)
+
+    def _collection(self, path: str):
+        with self._lock:
+            if path not in self._collections:
+                self._collections[path] = FakeCollection(self, path)
+            return self._collections[path]
+
+    def collection(self, name: str):
+        return self._collection(name)
+
+
+# --- GEMINI ---
+
+class FakeGemini(_Fake):
+    """Answers generate_content() with canned JSON shaped like the real prompts expect."""
+
+    def __init__(self, profile: LatencyProfile = None, seed: int = None):
+        super().__init__("gemini", profile, seed)
+        self.models = _namespace(generate_content=self.generate_content)
+
+    def generate_content(self, model: str, contents, config=None):
+        self._call()
+        prompt = contents if isinstance(contents, str) else json.dumps(contents)
+        if "drug_a" in prompt:
+            # Batch pair prompt (batch_analysis_service): one verdict per "- a + b" line
+            pairs = [line.strip()[2:].split(" + ") for line in prompt.splitlines() if line.strip().startswith("- ")]
+            text = json.dumps([
+                {"drug_a": a, "drug_b": b, "risk_level": "NONE", "clinical_info": "", "simple_explanation": ""}
+                for a, b in pairs
+            ])
+        elif "risk_level" in prompt:
+            text = json.dumps({
+                "risk_level": "MODERATE",
+                "interaction_count": 1,
+                "details": [{
+                    "risk_level": "MODERATE",
+                    "clinical_info": "Fake pharmacodynamic interference.",
+                    "simple_explanation": "Offline benchmark placeholder.",
+                }],
+            })
+        else:
+            text = json.dumps({"response_text": "Stay hydrated and take your meds on time! ✨"})
+        return _namespace(text=text)
+
+
+# --- GROQ ---
+
+class FakeGroq:
+    """Covers chat.completions.create (vision) and audio.transcriptions.create (Whisper)."""
+
+    def __init__(self, chat_profile: LatencyProfile = None, whisper_profile: LatencyProfile = None, seed: int = None):
+        self._chat = _Fake("groq_chat", chat_profile, seed)
+        self._whisper = _Fake("groq_whisper", whisper_profile, seed)
+        self.chat = _namespace(completions=_namespace(create=self._create_completion))
+        self.audio = _namespace(transcriptions=_namespace(create=self._create_transcription))
+
+    def _create_completion(self, model: str, messages: list, **kwargs):
+        self._chat._call()
+        message = _namespace(content="The document shows values within normal ranges. Consider a general physician.")
+        return _namespace(choices=[_namespace(message=message)])
+
+    def _create_transcription(self, file, model: str, **kwargs):
+        self._whisper._call()
+        return "I have had a mild headache for three days."
+
+
+# --- gTTS ---
+
+class FakeTTSEngine(_Fake):
+    """Callable with the gTTS constructor signature; save() writes a tiny placeholder MP3."""
+
+    def __init__(self, profile: LatencyProfile = None, seed: int = None):
+        super().__init__("tts", profile, seed)
+
+    def __call__(self, text: str, lang: str = "en", slow: bool = False):
+        engine = self
+
+        class _Speech:
+            def save(self, path: str):
+                engine._call()
+                with open(path, "wb") as f:
+                    f.write(b"ID3")
+
+        return _Speech()
+
+
+# --- GOOGLE CALENDAR ---
+
+class FakeCalendarBuilder(_Fake):
+    """Replaces googleapiclient build('calendar', 'v3', ...)."""
+
+    def __init__(self, profile: LatencyProfile = None, seed: int = None):
+        super().__init__("calendar", profile, seed)
+        self._ids = itertools.count(1)
+
+    def _request(self, result: dict):
+        def execute():
+            self._call()
+            return result
+        return _namespace(execute=execute)
+
+    def __call__(self, credentials):
+        event_id = lambda: f"fake_event_{next(self._ids)}"
+        return _namespace(
+            calendarList=lambda: _namespace(list=lambda pageToken=None: self._request(
+                {"items": [{"id": "fake_calendar", "summary": "MediBuddy App"}]})),
+            calendars=lambda: _namespace(insert=lambda body: self._request({"id": "fake_calendar"})),
+            events=lambda: _namespace(
+                insert=lambda calendarId, body: self._request(
+                    {"id": event_id(), "htmlLink": "https://calendar.example/fake"}),
+                delete=lambda calendarId, eventId: self._request({}),
+            ),
+        )
+
+
+def install_fakes(profiles: dict = None, seed: int = 0, latency_scale: float = 1.0, error_rate: float = None):
+    """
+    Installs a fake for every external client and returns them by name.
+    `profiles` overrides DEFAULT_PROFILES per service; `latency_scale` and
+    `error_rate` adjust every profile at once.
+    """
+    resolved = {}
+    for name, default in DEFAULT_PROFILES.items():
+        profile = (profiles or {}).get(name, default)
+        resolved[name] = LatencyProfile(
+            mean_ms=profile.mean_ms * latency_scale,
+            jitter_ms=profile.jitter_ms * latency_scale,
+            error_rate=profile.error_rate if error_rate is None else error_rate,
+        )
+
+    fakes = {
+        "firestore": FakeFirestore(resolved["firestore"], seed),
+        "gemini": FakeGemini(resolved["gemini"], seed),
+        "groq": FakeGroq(resolved["groq_chat"], resolved["groq_whisper"], seed),
+        "tts": FakeTTSEngine(resolved["tts"], seed),
+        "calendar": FakeCalendarBuilder(resolved["calendar"], seed),
+    }
+    for name, fake in fakes.items():
+        clients.override(name, fake)
+    return fakes
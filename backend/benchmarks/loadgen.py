@@ -0,0 +1,212 @@
+"""
+Closed-loop load generator.
+
+Requests are driven straight into the ASGI app in-process (no sockets), so a
+run only needs the app object and the fakes from benchmarks/fakes.py.
+HTTPTransport drives a real server instead (e.g. uvicorn with several workers).
+"""
+import time
+import json
+import asyncio
+from dataclasses import dataclass, field
+from urllib.parse import urlsplit
+
+
+@dataclass
+class Response:
+    status: int
+    headers: dict
+    body: bytes
+
+    def json(self):
+        return json.loads(self.body)
+
+
+class ASGITransport:
+    """Sends one HTTP request through an ASGI app and collects the full response."""
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, app):
+        self.app = app
+
+    async def startup(self):
+        self._lifespan_queue = asyncio.Queue()
+        self._lifespan_done = asyncio.Queue()
+
+        async def receive():
+            return await self._lifespan_queue.get()
+
+        async def send(message):
+            await self._lifespan_done.put(message)
+
+        self._lifespan_task = asyncio.create_task(self.app({"type": "lifespan", "asgi": {"version": "3.0"}}, receive, send))
+        await self._lifespan_queue.put({"type": "lifespan.startup"})
+        await self._lifespan_done.get()
+
+    async def shutdown(self):
+        await self._lifespan_queue.put({"type": "lifespan.shutdown"})
+        await self._lifespan_done.get()
+        await self._lifespan_task
+
+    async def request(self, method: str, url: str, body: bytes = b"", headers: dict = None) -> Response:
+        parts = urlsplit(url)
+        raw_headers = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in (headers or {}).items()]
+        raw_headers.append((b"content-length", str(len(body)).encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": method,
+            "scheme": "http",
+            "path": parts.path,
+            "raw_path": parts.path.encode(),
+            "query_string": parts.query.encode(),
+            "root_path": "",
+            "headers": raw_headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("benchmark", 80),
+        }
+        # Deliver the body in server-sized chunks, like uvicorn does
+        offsets = iter(range(0, max(len(body), 1), self.CHUNK_SIZE))
+
+        async def receive():
+            offset = next(offsets, None)
+            if offset is not None:
+                end = offset + self.CHUNK_SIZE
+                return {"type": "http.request", "body": body[offset:end], "more_body": end < len(body)}
+            # Park until cancelled, like a client that keeps the connection open
+            await asyncio.Future()
+
+        status = 500
+        response_headers = {}
+        chunks = []
+
+        async def send(message):
+            nonlocal status, response_headers
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers = {k.decode("latin-1"): v.decode("latin-1") for k, v in message.get("headers", [])}
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, send)
+        return Response(status, response_headers, b"".join(chunks))
+
+
+class HTTPTransport:
+    """Same interface as ASGITransport, over real keep-alive HTTP connections to `base_url`."""
+
+    def __init__(self, base_url: str, max_connections: int = 64, timeout: float = 60.0):
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._client = None
+
+    async def startup(self):
+        import httpx
+
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        self._client = httpx.AsyncClient(base_url=self.base_url, limits=limits, timeout=self.timeout)
+
+    async def shutdown(self):
+        await self._client.aclose()
+
+    async def request(self, method: str, url: str, body: bytes = b"", headers: dict = None) -> Response:
+        response = await self._client.request(method, url, content=body or None, headers=headers)
+        return Response(response.status_code, dict(response.headers), response.content)
+
+
+@dataclass
+class Scenario:
+    """One endpoint under load. build() returns (method, url, body, headers) for request number i."""
+    name: str
+    build: callable
+    weight: int = 1
+
+
+@dataclass
+class EndpointStats:
+    latencies: list = field(default_factory=list)
+    errors: int = 0
+
+    @staticmethod
+    def _percentile(sorted_values: list, pct: float) -> float:
+        if not sorted_values:
+            return 0.0
+        rank = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+        return sorted_values[rank]
+
+    def summary(self, elapsed: float) -> dict:
+        ordered = sorted(self.latencies)
+        return {
+            "requests": len(ordered),
+            "errors": self.errors,
+            "throughput_rps": round(len(ordered) / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(self._percentile(ordered, 50) * 1000, 2),
+            "p95_ms": round(self._percentile(ordered, 95) * 1000, 2),
+            "p99_ms": round(self._percentile(ordered, 99) * 1000, 2),
+        }
+
+
+async def run_load(transport, scenarios: list, total_requests: int, concurrency: int) -> dict:
+    """
+    Runs `total_requests` spread over `scenarios` (by weight) with `concurrency`
+    in-flight clients. Returns per-scenario throughput and latency percentiles.
+    """
+    schedule = []
+    for scenario in scenarios:
+        schedule.extend([scenario] * scenario.weight)
+
+    stats = {scenario.name: EndpointStats() for scenario in scenarios}
+    counter = iter(range(total_requests))
+
+    async def client():
+        for i in counter:
+            scenario = schedule[i % len(schedule)]
+            method, url, body, headers = scenario.build(i)
+            start = time.perf_counter()
+            try:
+                response = await transport.request(method, url, body, headers)
+                failed = response.status >= 500
+            except Exception:
+                failed = True
+            stats[scenario.name].latencies.append(time.perf_counter() - start)
+            if failed:
+                stats[scenario.name].errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    report = {name: endpoint.summary(elapsed) for name, endpoint in stats.items()}
+    total = sum(len(endpoint.latencies) for endpoint in stats.values())
+    report["_total"] = {"requests": total, "elapsed_s": round(elapsed, 3),
+                        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0}
+    return report
+
+
+def format_report(report: dict) -> str:
+    header = f"{'endpoint':<24}{'reqs':>7}{'errs':>6}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    lines = [header, "-" * len(header)]
+    for name, row in report.items():
+        if name.startswith("_"):
+            continue
+        lines.append(f"{name:<24}{row['requests']:>7}{row['errors']:>6}{row['throughput_rps']:>10}"
+                     f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    total = report.get("_total")
+    if total:
+        lines.append(f"total: {total['requests']} requests in {total['elapsed_s']}s ({total['throughput_rps']} req/s)")
+    return "\n".join(lines)
+
+
+def find_regressions(report: dict, baseline: dict, tolerance: float) -> list:
+    """Lists endpoints whose p95 grew by more than `tolerance` (0.2 == 20%) over the baseline."""
+    regressions = []
+    for name, row in report.items():
+        previous = baseline.get(name)
+        if name.startswith("_") or not previous or not previous.get("p95_ms"):
+            continue
+        if row["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {row['p95_ms']}ms")
+    return regressions
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the MediBuddy & SafeDose API.
+
+Every external service is replaced by a local fake (benchmarks/fakes.py), so
+this runs on a plain Linux box with no network or credentials:
+
+    cd backend
+    python -m benchmarks.run_benchmarks --requests 500 --concurrency 16 --latency-scale 0.01
+    python -m benchmarks.run_benchmarks --save baseline.json
+    python -m benchmarks.run_benchmarks --baseline baseline.json --tolerance 0.2
+
+Exits non-zero when --baseline is given and any endpoint's p95 regressed
+beyond the tolerance.
+"""
+import io
+import os
+import sys
+import json
+import uuid
+import asyncio
+import argparse
+import tempfile
+
+from benchmarks.fakes import install_fakes
+from benchmarks.loadgen import ASGITransport, Scenario, run_load, format_report, find_regressions
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _json_request(method: str, url: str, payload: dict = None):
+    body = json.dumps(payload).encode() if payload is not None else b""
+    return method, url, body, {"content-type": "application/json"}
+
+
+def _sample_png() -> bytes:
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new("RGB", (640, 480), (200, 30, 30)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def _multipart(fields: dict, files: dict):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content_type, data) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f'Content-Type: {content_type}\r\n\r\n'.encode() + data + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), {"content-type": f"multipart/form-data; boundary={boundary}"}
+
+
+def build_scenarios(users: int = 50) -> list:
+    image = _sample_png()
+    meds = [["warfarin", "ibuprofen"], ["metformin", "lisinopril", "atorvastatin"], ["aspirin", "clopidogrel"]]
+
+    def chat(i):
+        return _json_request("POST", "/api/chat", {
+            "user_id": f"user{i % users}",
+            "query": "Can I take my meds with food?",
+            "med_history": meds[i % len(meds)],
+            "user_profile": {"age": 54, "gender": "F", "conditions": ["hypertension"]},
+        })
+
+    def analyze(i):
+        return _json_request("POST", "/api/analyze", {"medication_list": meds[i % len(meds)]})
+
+    def diagnose(i):
+        body, headers = _multipart({"user_id": f"user{i % users}"}, {"image": ("scan.png", "image/png", image)})
+        return "POST", "/api/diagnose", body, headers
+
+    def add_doctor(i):
+        return _json_request("POST", "/doctors", {
+            "name": f"Dr. Bench {i}", "location": "Pune", "speciality": "Cardiology",
+            "education": "MBBS, MD", "ratings": 4.5,
+        })
+
+    def list_doctors(i):
+        return _json_request("GET", "/doctors")
+
+    def book(i):
+        return _json_request("POST", "/appointments", {
+            "doctorId": 1, "doctorName": "Dr. Bench", "patientName": f"Patient {i}",
+            "patientEmail": "patient@example.com", "date": "2026-11-02", "time": "10:30",
+            "userId": f"user{i % users}",
+        })
+
+    def list_appointments(i):
+        return _json_request("GET", f"/appointments/user{i % users}")
+
+    return [
+        Scenario("POST /api/chat", chat, weight=3),
+        Scenario("POST /api/analyze", analyze, weight=2),
+        Scenario("POST /api/diagnose", diagnose, weight=1),
+        Scenario("POST /doctors", add_doctor, weight=1),
+        Scenario("GET /doctors", list_doctors, weight=3),
+        Scenario("POST /appointments", book, weight=1),
+        Scenario("GET /appointments/{id}", list_appointments, weight=3),
+    ]
+
+
+async def _run(args) -> dict:
+    install_fakes(seed=args.seed, latency_scale=args.latency_scale, error_rate=args.error_rate)
+    # Run from a scratch directory so generated MP3s don't land in backend/static
+    sys.path.insert(0, BACKEND_DIR)
+    os.chdir(tempfile.mkdtemp(prefix="medibuddy-bench-"))
+    # Import after the fakes are installed so nothing reaches for real credentials
+    from app import app
+
+    scenarios = build_scenarios()
+    if args.only:
+        scenarios = [s for s in scenarios if any(key in s.name for key in args.only)]
+
+    transport = ASGITransport(app)
+    await transport.startup()
+    try:
+        return await run_load(transport, scenarios, args.requests, args.concurrency)
+    finally:
+        await transport.shutdown()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency-scale", type=float, default=1.0,
+                        help="Multiplier on the fakes' default latencies (0 for pure app overhead)")
+    parser.add_argument("--error-rate", type=float, default=None, help="Failure probability for every fake")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--only", nargs="*", help="Substrings of scenario names to run")
+    parser.add_argument("--save", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="Compare against a previously saved JSON report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+    # _run() switches to a scratch directory, so pin report paths first
+    args.save = os.path.abspath(args.save) if args.save else None
+    args.baseline = os.path.abspath(args.baseline) if args.baseline else None
+
+    report = asyncio.run(_run(args))
+    print(format_report(report))
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
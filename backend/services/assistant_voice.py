@@ -1,5 +1,5 @@
-from gtts import gTTS
 import os
+from services.clients import get_tts_engine
 
 def text_to_speech_with_gtts_old(text: str, output_path: str):
     """
@@ -7,7 +7,7 @@ def text_to_speech_with_gtts_old(text: str, output_path: str):
     """
     try:
         # Create gTTS object (English language)
-        tts = gTTS(text=text, lang='en', slow=False)
+        tts = get_tts_engine()(text=text, lang='en', slow=False)
         
         # Ensure the directory exists
         os.makedirs(os.path.dirname(output_path), exist_ok=True)
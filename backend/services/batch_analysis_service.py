@@ -0,0 +1,264 @@
+import os
+import asyncio
+import threading
+import numpy as np
+from google.genai import types
+from services.metrics import stage, record_cache
+from services.clients import get_gemini
+from services.json_repair import loads_lenient
+from services.schemas import normalize_risk_level
+from services.interaction_service import (
+    KNOWN_INTERACTIONS, RISK_LEVELS, RISK_SEVERITY, normalize_med_name
+)
+
+# --- CONFIG ---
+PAIRS_PER_PROMPT = int(os.getenv("BATCH_PAIRS_PER_PROMPT", "40"))
+MAX_CONCURRENT_PROMPTS = int(os.getenv("BATCH_MAX_CONCURRENT_PROMPTS", "4"))
+PAIR_CACHE_SIZE = int(os.getenv("BATCH_PAIR_CACHE_SIZE", "50000"))
+
+UNRESOLVED = -1
+
+# Model verdicts from earlier batches, keyed by the sorted (drug_a, drug_b) pair
+_pair_cache = {}
+_pair_cache_lock = threading.Lock()
+
+_triu_cache = {}
+
+
+def _triu(k: int):
+    """Upper-triangle index pairs for a k-drug regimen (memoized; regimens are short)."""
+    if k not in _triu_cache:
+        _triu_cache[k] = np.triu_indices(k, 1)
+    return _triu_cache[k]
+
+
+def _cache_pair(pair: tuple, detail: dict):
+    with _pair_cache_lock:
+        if len(_pair_cache) >= PAIR_CACHE_SIZE:
+            # Drop the oldest entry (dicts keep insertion order)
+            _pair_cache.pop(next(iter(_pair_cache)))
+        _pair_cache[pair] = detail
+
+
+def _ask_model_for_pairs(pairs: list) -> dict:
+    """One prompt covering many pairs. Returns {(a, b): detail} for the pairs the model answered."""
+    listing = "\n".join(f"- {a} + {b}" for a, b in pairs)
+    prompt = f"""
+    [CRITICAL TASK]
+    For each compound pair below, analyze the biochemical interaction.
+    Focus on pharmacokinetic and pharmacodynamic interference.
+    {listing}
+
+    Return a JSON list with one object per pair:
+    [
+      {{
+        "drug_a": "first compound",
+        "drug_b": "second compound",
+        "risk_level": "HIGH" | "MODERATE" | "LOW" | "NONE",
+        "clinical_info": "Technical mechanism (e.g. CYP450 inhibition, platelet interference).",
+        "simple_explanation": "One sentence summary for a lab technician."
+      }}
+    ]
+    """
+    config = types.GenerateContentConfig(
+        response_mime_type='application/json',
+        temperature=0.0,
+        safety_settings=[
+            types.SafetySetting(category='HARM_CATEGORY_DANGEROUS_CONTENT', threshold='BLOCK_NONE'),
+        ]
+    )
+    with stage("batch_analysis", "gemini"):
+        response = get_gemini().models.generate_content(
+            model="gemini-3-flash-preview",
+            contents=prompt,
+            config=config
+        )
+
+    parsed = loads_lenient(response.text) if response and response.text else []
+    if isinstance(parsed, dict):
+        parsed = parsed.get("pairs") or parsed.get("interactions") or []
+
+    answered = {}
+    for item in parsed:
+        if not isinstance(item, dict):
+            continue
+        a = normalize_med_name(str(item.get("drug_a", "")))
+        b = normalize_med_name(str(item.get("drug_b", "")))
+        level = normalize_risk_level(item.get("risk_level"))
+        if level is None:
+            # Left unresolved, so the regimen is reported as UNKNOWN rather than guessed
+            continue
+        answered[tuple(sorted((a, b)))] = {
+            "risk_level": level,
+            "clinical_info": item.get("clinical_info", ""),
+            "simple_explanation": item.get("simple_explanation", ""),
+        }
+    return answered
+
+
+async def _resolve_unknown_pairs(pairs: list) -> dict:
+    """Fans the unique unknown pairs out over chunked prompts with bounded concurrency."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_PROMPTS)
+
+    async def run_chunk(chunk):
+        async with semaphore:
+            try:
+                return await asyncio.to_thread(_ask_model_for_pairs, chunk)
+            except Exception as e:
+                print(f"DEBUG: Batch API Error: {e}")
+                return {}
+
+    chunks = [pairs[i:i + PAIRS_PER_PROMPT] for i in range(0, len(pairs), PAIRS_PER_PROMPT)]
+    resolved = {}
+    for answered in await asyncio.gather(*(run_chunk(chunk) for chunk in chunks)):
+        resolved.update(answered)
+    return resolved
+
+
+class _PairIndex:
+    """
+    All regimens of a batch mapped onto one drug vocabulary. A pair (i < j) is
+    encoded as i * n + j; every distinct code gets a slot in `scores`, and each
+    regimen keeps the slot positions of its pairs, so scoring and fan-out are
+    plain NumPy fancy indexing (memory grows with pairs, not vocabulary squared).
+    """
+
+    def __init__(self, regimens: list):
+        self.vocab = {}
+        index_lists = []
+        for meds in regimens:
+            indices = sorted({self.vocab.setdefault(normalize_med_name(m), len(self.vocab)) for m in meds})
+            index_lists.append(np.asarray(indices, dtype=np.int64))
+
+        self.names = list(self.vocab)
+        self.n = max(len(self.names), 1)
+
+        pair_codes = []
+        for indices in index_lists:
+            upper, lower = _triu(len(indices))
+            # Indices are sorted, so upper < lower elementwise
+            pair_codes.append(indices[upper] * self.n + indices[lower])
+
+        all_codes = np.concatenate(pair_codes) if pair_codes else np.empty(0, dtype=np.int64)
+        self.unique_codes, inverse = np.unique(all_codes, return_inverse=True)
+        self.positions = np.split(inverse, np.cumsum([len(codes) for codes in pair_codes])[:-1])
+        self.scores = np.full(len(self.unique_codes), UNRESOLVED, dtype=np.int8)
+        self.details = {}  # slot -> detail dict, for pairs that interact
+
+    def pair_names(self, slot: int) -> tuple:
+        """Alphabetically sorted drug names, the same key the pair cache and model answers use."""
+        i, j = divmod(int(self.unique_codes[slot]), self.n)
+        return tuple(sorted((self.names[i], self.names[j])))
+
+    def set_slot(self, slot: int, detail: dict):
+        level = RISK_SEVERITY[detail["risk_level"]]
+        self.scores[slot] = level
+        if level > 0:
+            self.details[slot] = detail
+
+    def apply_known(self):
+        """Scores every pair in the batch against KNOWN_INTERACTIONS in one vectorized lookup."""
+        known = []
+        for pair, detail in KNOWN_INTERACTIONS.items():
+            a, b = tuple(pair)
+            if a in self.vocab and b in self.vocab:
+                i, j = sorted((self.vocab[a], self.vocab[b]))
+                known.append((i * self.n + j, detail))
+        if not known or not len(self.unique_codes):
+            return
+
+        known.sort(key=lambda item: item[0])
+        known_codes = np.array([code for code, _ in known], dtype=np.int64)
+        known_levels = np.array([RISK_SEVERITY[d["risk_level"]] for _, d in known], dtype=np.int8)
+
+        hit = np.searchsorted(known_codes, self.unique_codes)
+        hit = np.minimum(hit, len(known_codes) - 1)
+        matched = known_codes[hit] == self.unique_codes
+        self.scores[matched] = known_levels[hit[matched]]
+        for slot in np.flatnonzero(matched).tolist():
+            self.details[slot] = known[hit[slot]][1]
+
+    def unresolved_slots(self) -> list:
+        return np.flatnonzero(self.scores == UNRESOLVED).tolist()
+
+    def regimen_is_resolved(self, idx: int) -> bool:
+        return not np.any(self.scores[self.positions[idx]] == UNRESOLVED)
+
+    def regimen_report(self, idx: int, patient_id, medication_list: list) -> dict:
+        slots = self.positions[idx]
+        scores = self.scores[slots]
+        top = int(scores.max()) if len(scores) else 0
+        if top == RISK_SEVERITY["HIGH"]:
+            risk_level = "HIGH"
+        elif np.any(scores == UNRESOLVED):
+            # A pair nobody could score may be worse than anything found so far
+            risk_level = "UNKNOWN"
+        else:
+            risk_level = RISK_LEVELS[top] if top > 0 else "LOW"
+
+        details = [
+            {**self.details[slot], "drugs": list(self.pair_names(slot))}
+            for slot in slots[scores > 0].tolist()
+        ]
+
+        return {
+            "patient_id": patient_id,
+            "medication_count": len(medication_list),
+            "risk_level": risk_level,
+            "interaction_count": len(details),
+            "details": details,
+            "medications": [
+                {"name": name, "normalized_name": name.lower().strip(), "category": "Medication"}
+                for name in medication_list
+            ],
+            "unresolved_pairs": [list(self.pair_names(slot)) for slot in slots[scores == UNRESOLVED].tolist()],
+        }
+
+
+async def screen_regimens(regimens: list):
+    """
+    Population screening. `regimens` is a list of (patient_id, medication_list).
+    Drug pairs are deduplicated across the whole batch; known pairs and cached
+    model verdicts are scored locally and only the remaining unique pairs go to
+    the model. Yields one report per patient (those needing no model call first),
+    then a final {"summary": ...} record.
+    """
+    index = _PairIndex([meds for _, meds in regimens])
+    index.apply_known()
+
+    # Cached verdicts from earlier batches
+    for slot in index.unresolved_slots():
+        cached = _pair_cache.get(index.pair_names(slot))
+        record_cache("interaction_pairs", cached is not None)
+        if cached is not None:
+            index.set_slot(slot, cached)
+
+    pending = []
+    for idx, (patient_id, meds) in enumerate(regimens):
+        if index.regimen_is_resolved(idx):
+            yield index.regimen_report(idx, patient_id, meds)
+        else:
+            pending.append(idx)
+
+    unknown_slots = index.unresolved_slots()
+    unknown_pairs = [index.pair_names(slot) for slot in unknown_slots]
+    if unknown_pairs:
+        answered = await _resolve_unknown_pairs(unknown_pairs)
+        for slot, pair in zip(unknown_slots, unknown_pairs):
+            detail = answered.get(pair)
+            if detail is not None:
+                _cache_pair(pair, detail)
+                index.set_slot(slot, detail)
+
+    for idx in pending:
+        patient_id, meds = regimens[idx]
+        yield index.regimen_report(idx, patient_id, meds)
+
+    yield {"summary": {
+        "patients": len(regimens),
+        "unique_drugs": len(index.names),
+        "unique_pairs": int(len(index.unique_codes)),
+        "model_pairs": len(unknown_pairs),
+        "model_prompts": -(-len(unknown_pairs) // PAIRS_PER_PROMPT),
+        "unresolved_pairs": len(index.unresolved_slots()),
+    }}
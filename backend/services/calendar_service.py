@@ -2,9 +2,10 @@ import os
 from datetime import datetime, timedelta
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 from dotenv import load_dotenv
+from services.metrics import timed
+from services.clients import build_calendar_service
 
 load_dotenv()
 
@@ -33,6 +34,7 @@ class GoogleCalendarService:
             }
         }
     
+    @timed("calendar", "auth_url")
     def get_authorization_url(self, state: str = None):
         """Generate Google OAuth authorization URL"""
         if not self.is_configured:
@@ -56,6 +58,7 @@ class GoogleCalendarService:
         
         return authorization_url, state
     
+    @timed("calendar", "token_exchange")
     def exchange_code_for_token(self, code: str):
         """Exchange authorization code for access token"""
         if not self.is_configured or code == "MOCK_CODE":
@@ -88,8 +91,20 @@ class GoogleCalendarService:
             'scopes': credentials.scopes
         }
     
-    def _get_or_create_medibuddy_calendar(self, service):
-        """Finds or creates a dedicated MediBuddy calendar"""
+    def _build_credentials(self, credentials_dict: dict):
+        # Fallback to env vars if missing in dict
+        return Credentials(
+            token=credentials_dict.get('token'),
+            refresh_token=credentials_dict.get('refresh_token'),
+            token_uri=credentials_dict.get('token_uri'),
+            client_id=credentials_dict.get('client_id') or self.client_config["web"]["client_id"],
+            client_secret=credentials_dict.get('client_secret') or self.client_config["web"]["client_secret"],
+            scopes=credentials_dict.get('scopes')
+        )
+
+    @timed("calendar", "calendar_lookup")
+    def _get_or_create_medibuddy_calendar(self, service, create: bool = True):
+        """Finds or creates a dedicated MediBuddy calendar (with create=False, falls back to primary instead)"""
         try:
             # List all calendars
             page_token = None
@@ -104,6 +119,9 @@ class GoogleCalendarService:
                 if not page_token:
                     break
             
+            if not create:
+                return 'primary'
+
             # If not found, create new calendar
             print("Creating new MediBuddy App calendar...")
             calendar = {
@@ -120,6 +138,7 @@ class GoogleCalendarService:
             traceback.print_exc()
             return 'primary'
 
+    @timed("calendar", "create_event")
     def create_calendar_event(self, credentials_dict: dict, appointment_data: dict):
         """Create a Google Calendar event"""
         print(f"Creating calendar event for: {appointment_data.get('patientName')}")
@@ -134,20 +153,7 @@ class GoogleCalendarService:
             }
 
         try:
-            # Fallback to env vars if missing in dict
-            client_id = credentials_dict.get('client_id') or self.client_config["web"]["client_id"]
-            client_secret = credentials_dict.get('client_secret') or self.client_config["web"]["client_secret"]
-
-            credentials = Credentials(
-                token=credentials_dict.get('token'),
-                refresh_token=credentials_dict.get('refresh_token'),
-                token_uri=credentials_dict.get('token_uri'),
-                client_id=client_id,
-                client_secret=client_secret,
-                scopes=credentials_dict.get('scopes')
-            )
-            
-            service = build('calendar', 'v3', credentials=credentials)
+            service = build_calendar_service(self._build_credentials(credentials_dict))
             
             # Get or create dedicated calendar
             calendar_id = self._get_or_create_medibuddy_calendar(service)
@@ -193,6 +199,7 @@ class GoogleCalendarService:
                 'success': True,
                 'event_id': event_result.get('id'),
                 'event_link': event_result.get('htmlLink'),
+                'calendar_id': calendar_id,
                 'message': 'Calendar event created successfully'
             }
             
@@ -209,24 +216,27 @@ class GoogleCalendarService:
                 'message': 'An error occurred while creating calendar event'
             }
     
-    def delete_calendar_event(self, credentials_dict: dict, event_id: str):
-        """Delete a Google Calendar event"""
+    @timed("calendar", "delete_event")
+    def delete_calendar_event(self, credentials_dict: dict, event_id: str, calendar_id: str = None):
+        """Delete a Google Calendar event from the calendar it was created on"""
+        if credentials_dict.get('token') == "mock_token":
+            return {'success': True, 'message': 'Calendar event deleted successfully (MOCK MODE)'}
+
         try:
-            credentials = Credentials(
-                token=credentials_dict.get('token'),
-                refresh_token=credentials_dict.get('refresh_token'),
-                token_uri=credentials_dict.get('token_uri'),
-                client_id=credentials_dict.get('client_id'),
-                client_secret=credentials_dict.get('client_secret'),
-                scopes=credentials_dict.get('scopes')
-            )
-            
-            service = build('calendar', 'v3', credentials=credentials)
-            service.events().delete(calendarId='primary', eventId=event_id).execute()
+            service = build_calendar_service(self._build_credentials(credentials_dict))
+
+            # Bookings made before the calendar id was stored: events go on the
+            # MediBuddy calendar when it exists, otherwise they fell back to primary
+            if not calendar_id:
+                calendar_id = self._get_or_create_medibuddy_calendar(service, create=False)
+
+            service.events().delete(calendarId=calendar_id, eventId=event_id).execute()
             
             return {'success': True, 'message': 'Calendar event deleted successfully'}
             
         except HttpError as error:
             return {'success': False, 'error': str(error)}
+        except Exception as e:
+            return {'success': False, 'error': str(e)}
 
 calendar_service = GoogleCalendarService()
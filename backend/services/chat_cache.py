@@ -0,0 +1,166 @@
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from services.metrics import record_cache
+
+# --- CONFIG ---
+CHAT_CACHE_ENABLED = os.getenv("CHAT_CACHE_ENABLED", "1") != "0"
+CHAT_CACHE_TTL_SECONDS = float(os.getenv("CHAT_CACHE_TTL_SECONDS", str(6 * 3600)))
+CHAT_CACHE_MAX_ENTRIES = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "5000"))
+# Max differing SimHash bits for two questions to count as the same question
+CHAT_CACHE_MAX_DISTANCE = int(os.getenv("CHAT_CACHE_MAX_DISTANCE", "3"))
+# Short messages are usually follow-ups that depend on the conversation, never cache them
+CHAT_CACHE_MIN_WORDS = int(os.getenv("CHAT_CACHE_MIN_WORDS", "4"))
+
+_BITS = 64
+# Pigeonhole: if two fingerprints differ in <= MAX_DISTANCE bits, at least one
+# of MAX_DISTANCE + 1 bands matches exactly, so lookups only scan those buckets
+_BANDS = max(CHAT_CACHE_MAX_DISTANCE + 1, 1)
+_BAND_BITS = _BITS // _BANDS
+
+_FILLER = {"a", "an", "the", "please", "pls", "plz", "hi", "hey", "hello", "um", "so", "just", "ok", "okay"}
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+def normalize_query(text: str) -> list:
+    return [w for w in _WORD.findall((text or "").lower()) if w not in _FILLER]
+
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "big")
+
+
+def simhash(words: list) -> int:
+    """64-bit SimHash over words (weight 1) and adjacent word pairs (weight 2, they carry word order)."""
+    features = [(w, 1) for w in words] + [(f"{a} {b}", 2) for a, b in zip(words, words[1:])]
+    weights = [0] * _BITS
+    for feature, weight in features:
+        h = _hash64(feature)
+        for bit in range(_BITS):
+            weights[bit] += weight if h >> bit & 1 else -weight
+    return sum(1 << bit for bit in range(_BITS) if weights[bit] > 0)
+
+
+def context_key(med_history: list, user_profile: dict = None, extra: str = "") -> str:
+    """
+    Hash of everything besides the question that shapes the answer (meds, profile,
+    past findings). Cached answers are generated without chat history, so users
+    with the same context can share them.
+    """
+    meds = sorted({m.strip().lower() for m in med_history or [] if m and m.strip()})
+    profile = user_profile or {}
+    parts = [
+        "|".join(meds),
+        str(profile.get("age")), str(profile.get("gender")),
+        "|".join(sorted(str(c).lower() for c in profile.get("conditions") or [])),
+        str(profile.get("height")), str(profile.get("weight")),
+        extra or "",
+    ]
+    return hashlib.sha1("\x1f".join(parts).encode()).hexdigest()
+
+
+def _bands(fingerprint: int):
+    mask = (1 << _BAND_BITS) - 1
+    return [(i, fingerprint >> (i * _BAND_BITS) & mask) for i in range(_BANDS)]
+
+
+class _Entry:
+    __slots__ = ("context", "fingerprint", "answer", "created_at")
+
+    def __init__(self, context: str, fingerprint: int, answer: str):
+        self.context = context
+        self.fingerprint = fingerprint
+        self.answer = answer
+        self.created_at = time.monotonic()
+
+
+class ChatAnswerCache:
+    """
+    Near-duplicate cache for chat answers. A hit needs the same context key and
+    a SimHash within max_distance bits; entries expire after ttl and the least
+    recently used ones are dropped past max_entries.
+    """
+
+    def __init__(self, ttl: float = CHAT_CACHE_TTL_SECONDS, max_entries: int = CHAT_CACHE_MAX_ENTRIES,
+                 max_distance: int = CHAT_CACHE_MAX_DISTANCE):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_distance = min(max_distance, _BANDS - 1)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # id -> _Entry, least recently used first
+        self._bands = {}  # (context, band, value) -> set of entry ids
+        self._next_id = 0
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        for band in _bands(entry.fingerprint):
+            bucket = self._bands.get((entry.context, *band))
+            if bucket:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._bands[(entry.context, *band)]
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        return now - entry.created_at > self.ttl
+
+    def accepts(self, query: str) -> bool:
+        """Whether answers to `query` are looked up and stored at all (short follow-ups never are)."""
+        return CHAT_CACHE_ENABLED and len(normalize_query(query)) >= CHAT_CACHE_MIN_WORDS
+
+    def get(self, context: str, query: str):
+        """Returns the cached answer for a near-identical question, or None."""
+        words = normalize_query(query)
+        if not CHAT_CACHE_ENABLED or len(words) < CHAT_CACHE_MIN_WORDS:
+            return None
+        fingerprint = simhash(words)
+        now = time.monotonic()
+        with self._lock:
+            candidates = set()
+            for band in _bands(fingerprint):
+                candidates |= self._bands.get((context, *band), set())
+
+            best, best_distance = None, self.max_distance + 1
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if self._expired(entry, now):
+                    self._remove(entry_id)
+                    continue
+                distance = (entry.fingerprint ^ fingerprint).bit_count()
+                if distance < best_distance:
+                    best, best_distance = entry_id, distance
+
+            if best is not None:
+                entry = self._entries[best]
+                self._entries.move_to_end(best)
+        record_cache("chat_answers", best is not None)
+        return entry.answer if best is not None else None
+
+    def put(self, context: str, query: str, answer: str):
+        words = normalize_query(query)
+        if not CHAT_CACHE_ENABLED or len(words) < CHAT_CACHE_MIN_WORDS or not answer:
+            return
+        fingerprint = simhash(words)
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(context, fingerprint, answer)
+            for band in _bands(fingerprint):
+                self._bands.setdefault((context, *band), set()).add(entry_id)
+
+            while self._entries:
+                oldest_id, oldest = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_entries and not self._expired(oldest, now):
+                    break
+                self._remove(oldest_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bands.clear()
+
+
+chat_answer_cache = ChatAnswerCache()
@@ -1,65 +1,34 @@
-import os
-import json
 import datetime
-from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google import genai
+from firebase_admin import firestore
 from google.genai import types
-from firebase_admin import credentials, initialize_app, _apps
-
-load_dotenv()
-
-
-# Get credentials from environment variable
-cred_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-
-if cred_json:
-    # Use the JSON string instead of a filename
-    cred_dict = json.loads(cred_json)
-    if not _apps:
-        cred = credentials.Certificate(cred_dict)
-        initialize_app(cred)
-else:
-    # Fallback for local development if you still have the file locally
-    cred = credentials.Certificate("hackwins-mind-flayers-firebase-adminsdk-fbsvc-ccc4812dec.json")
-    if not _apps:
-        initialize_app(cred)
-
-db = firestore.client()
-
-# 2. Initialize Gemini Client
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+from services.metrics import stage
+from services.clients import get_firestore, get_gemini
+from services.schemas import ChatReply
+from services.json_repair import parse_model_output
+from services.history_index import history_index
+from services.chat_cache import chat_answer_cache, context_key
+from services.med_report_service import med_reports, format_known_risks
 
 async def get_chat_response(user_id: str, user_text: str, med_history: list[str], user_profile: dict = None):
     """
     Complete logic for MediBuddy Chat:
     - Saves user input to Firestore
     - Pulls context history
+    - Reuses cached answers for near-duplicate FAQ questions
     - Handles Gemini API with robust error catching
     - Saves model response back to Firestore for real-time UI updates
     """
-    
+    db = get_firestore()
+    client = get_gemini()
+
     # --- FIREBASE: Save User Message ---
     # We save this first so it appears in the UI immediately via the onSnapshot listener
     chat_ref = db.collection("chats").document(user_id).collection("messages")
-    chat_ref.add({
-        "role": "user",
-        "text": user_text,
-        "timestamp": datetime.datetime.now(datetime.timezone.utc)
-    })
-
-    # --- FIREBASE: Fetch History for Context ---
-    # We limit to 7 to avoid "429 Quota Exhausted" errors on the free tier
-    docs = chat_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(7).stream()
-    
-    messages_for_gemini = []
-    for doc in reversed(list(docs)):
-        msg_data = doc.to_dict()
-        clean_role = "model" if msg_data.get("role") in ["model", "assistant"] else "user"
-        messages_for_gemini.append({
-            "role": clean_role,
-            "parts": [{"text": msg_data.get("text", "")}]
+    with stage("get_chat_response", "firestore_save_user"):
+        chat_ref.add({
+            "role": "user",
+            "text": user_text,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
         })
 
     # --- CONTEXT BUILDING ---
@@ -72,6 +41,17 @@ async def get_chat_response(user_id: str, user_text: str, med_history: list[str]
         )
 
     med_context = ", ".join(med_history) if med_history else "No medications listed."
+
+    # --- LOCAL INDEX: Past diagnoses relevant to this message ---
+    # Served from the on-disk FTS index, no Firestore round trips per chat
+    with stage("get_chat_response", "history_search"):
+        past_findings = history_index.relevant_context(user_id, user_text)
+    findings_context = f"\n    PAST FINDINGS (from earlier report/scan analyses):\n{past_findings}\n" if past_findings else ""
+
+    # --- PRECOMPUTED INTERACTIONS ---
+    # Report is built in the background when the med set changes; cite it if ready
+    known_risks = format_known_risks(med_reports.observe(user_id, med_history))
+    risks_context = f"\n    KNOWN INTERACTION RISKS (from the SafeDose checker):\n{known_risks}\n" if known_risks else ""
     
     # --- SYSTEM PROMPT ---
     system_prompt = f"""
@@ -79,36 +59,89 @@ async def get_chat_response(user_id: str, user_text: str, med_history: list[str]
     
     USER CONTEXT: {profile_summary}
     MEDICATIONS: {med_context}
-
+    {findings_context}{risks_context}
     TONE: Warm, supportive, and bubbly. Use emojis.
     
     RULES:
     1. Personalize advice based on the USER CONTEXT and MEDICATIONS.
     2. Keep responses between 2-4 sentences.
-    3. You MUST respond in JSON format: {{"response_text": "your_message_here"}}
+    3. If PAST FINDINGS are relevant, refer back to them briefly.
+    4. If the question touches on KNOWN INTERACTION RISKS, mention them.
+    5. You MUST respond in JSON format: {{"response_text": "your_message_here"}}
     """
 
+    # --- FAQ CACHE ---
+    # Near-identical questions asked with the same meds/profile/findings reuse
+    # an earlier answer instead of another Gemini call. Those answers are
+    # generated without the chat history, so one user's conversation never
+    # ends up in an answer served to another; short follow-ups keep the history.
+    cache_context = context_key(med_history, user_profile, past_findings + known_risks)
+    use_cache = chat_answer_cache.accepts(user_text)
+    ai_text = None
+    if use_cache:
+        with stage("get_chat_response", "faq_cache"):
+            ai_text = chat_answer_cache.get(cache_context, user_text)
+
+    if ai_text is None:
+        ai_text, cacheable = _ask_gemini(client, chat_ref, user_text, system_prompt, with_history=not use_cache)
+        if use_cache and cacheable:
+            chat_answer_cache.put(cache_context, user_text, ai_text)
+
+    # --- FIREBASE: Save AI Response ---
+    # This write triggers the frontend onSnapshot to display the message
+    with stage("get_chat_response", "firestore_save_model"):
+        chat_ref.add({
+            "role": "model",
+            "text": ai_text,
+            "timestamp": datetime.datetime.now(datetime.timezone.utc)
+        })
+
+    return {"text": ai_text, "role": "model"}
+
+
+def _ask_gemini(client, chat_ref, user_text: str, system_prompt: str, with_history: bool = True):
+    """
+    Runs the Gemini call, with recent chat history unless with_history is False.
+    Returns (ai_text, cacheable).
+    """
+    messages_for_gemini = [{"role": "user", "parts": [{"text": user_text}]}]
+    if with_history:
+        # --- FIREBASE: Fetch History for Context ---
+        # We limit to 7 to avoid "429 Quota Exhausted" errors on the free tier
+        with stage("get_chat_response", "firestore_history"):
+            docs = list(chat_ref.order_by("timestamp", direction=firestore.Query.DESCENDING).limit(7).stream())
+
+        messages_for_gemini = []
+        for doc in reversed(docs):
+            msg_data = doc.to_dict()
+            clean_role = "model" if msg_data.get("role") in ["model", "assistant"] else "user"
+            messages_for_gemini.append({
+                "role": clean_role,
+                "parts": [{"text": msg_data.get("text", "")}]
+            })
+
     ai_text = ""
+    cacheable = False
 
     try:
         # PRIMARY ATTEMPT: Gemini 1.5 Flash with JSON Mode
         # Using "gemini-1.5-flash" directly as the SDK handles the "models/" prefix
-        response = client.models.generate_content(
-            model="gemini-2.5-flash",
-            contents=messages_for_gemini,
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                temperature=0.7,
-                response_mime_type='application/json',
+        with stage("get_chat_response", "gemini"):
+            response = client.models.generate_content(
+                model="gemini-2.5-flash",
+                contents=messages_for_gemini,
+                config=types.GenerateContentConfig(
+                    system_instruction=system_prompt,
+                    temperature=0.7,
+                    response_mime_type='application/json',
+                )
             )
-        )
 
         if response and response.text:
-            try:
-                parsed_data = json.loads(response.text)
-                ai_text = parsed_data.get("response_text", response.text)
-            except json.JSONDecodeError:
-                ai_text = response.text
+            # Repairs fenced/trailing-comma/truncated JSON locally instead of showing it raw
+            reply = parse_model_output(response.text, ChatReply)
+            ai_text = reply.response_text if reply else response.text
+            cacheable = reply is not None
         else:
             ai_text = "I'm processing that... could you tell me a bit more? ✨"
 
@@ -118,22 +151,15 @@ async def get_chat_response(user_id: str, user_text: str, med_history: list[str]
         
         # SECONDARY ATTEMPT: Fallback to Basic Text (No JSON mode)
         try:
-            fallback_response = client.models.generate_content(
-                model="gemini-1.5-flash",
-                contents=[{"role": "user", "parts": [{"text": user_text}]}],
-                config=types.GenerateContentConfig(system_instruction=system_prompt)
-            )
+            with stage("get_chat_response", "gemini_fallback"):
+                fallback_response = client.models.generate_content(
+                    model="gemini-1.5-flash",
+                    contents=[{"role": "user", "parts": [{"text": user_text}]}],
+                    config=types.GenerateContentConfig(system_instruction=system_prompt)
+                )
             ai_text = fallback_response.text if fallback_response.text else "I'm having a little trouble connecting. ✨"
         except Exception as e2:
             print(f"DEBUG: Fallback Error: {str(e2)}")
             ai_text = "I'm offline for a quick second, but I'm still here for you! Try again shortly. ✨"
 
-    # --- FIREBASE: Save AI Response ---
-    # This write triggers the frontend onSnapshot to display the message
-    chat_ref.add({
-        "role": "model",
-        "text": ai_text,
-        "timestamp": datetime.datetime.now(datetime.timezone.utc)
-    })
-
-    return {"text": ai_text, "role": "model"}
\ No newline at end of file
+    return ai_text, cacheable
@@ -0,0 +1,125 @@
+import os
+import json
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Every external dependency the services talk to is created lazily through this
+# module, so importing the app no longer needs credentials or network access.
+# override() swaps in a stand-in (see benchmarks/fakes.py) without touching the services.
+
+_overrides = {}
+_instances = {}
+_lock = threading.Lock()
+
+
+def _init_firebase():
+    from firebase_admin import credentials, initialize_app, _apps
+
+    if _apps:
+        return
+    # Get credentials from environment variable
+    cred_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
+    if cred_json:
+        # Use the JSON string instead of a filename
+        cred = credentials.Certificate(json.loads(cred_json))
+    else:
+        # Fallback for local development if you still have the file locally
+        cred = credentials.Certificate("hackwins-mind-flayers-firebase-adminsdk-fbsvc-ccc4812dec.json")
+    initialize_app(cred)
+
+
+def _make_firestore():
+    from firebase_admin import firestore
+
+    _init_firebase()
+    return firestore.client()
+
+
+def _make_gemini():
+    from google import genai
+
+    return genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+
+def _make_groq():
+    from groq import Groq
+
+    return Groq(api_key=os.getenv("GROQ_API_KEY"))
+
+
+def _make_tts():
+    from gtts import gTTS
+
+    # The engine is a class: engine(text=..., lang=..., slow=...).save(path)
+    return gTTS
+
+
+def _make_calendar_builder():
+    from googleapiclient.discovery import build
+
+    return lambda credentials: build('calendar', 'v3', credentials=credentials)
+
+
+def _make_state_store():
+    from services.state_store import create_state_store
+
+    return create_state_store()
+
+
+_FACTORIES = {
+    "firestore": _make_firestore,
+    "gemini": _make_gemini,
+    "groq": _make_groq,
+    "tts": _make_tts,
+    "calendar": _make_calendar_builder,
+    "state": _make_state_store,
+}
+
+
+def get(name: str):
+    """Returns the override for `name` if one is installed, else the lazily built real client."""
+    if name in _overrides:
+        return _overrides[name]
+    instance = _instances.get(name)
+    if instance is None:
+        with _lock:
+            instance = _instances.get(name)
+            if instance is None:
+                instance = _instances[name] = _FACTORIES[name]()
+    return instance
+
+
+def override(name: str, instance):
+    if name not in _FACTORIES:
+        raise KeyError(f"Unknown client: {name}")
+    _overrides[name] = instance
+
+
+def reset_overrides():
+    _overrides.clear()
+
+
+def get_firestore():
+    return get("firestore")
+
+
+def get_gemini():
+    return get("gemini")
+
+
+def get_groq():
+    return get("groq")
+
+
+def get_tts_engine():
+    return get("tts")
+
+
+def build_calendar_service(credentials):
+    return get("calendar")(credentials)
+
+
+def get_state_store():
+    return get("state")
@@ -4,72 +4,68 @@ import io
 import pymupdf
 from datetime import datetime
 from PIL import Image
-from groq import Groq
-import firebase_admin
-from firebase_admin import credentials, firestore
 from services.user_voice import transcribe_with_groq
 from services.assistant_voice import text_to_speech_with_gtts_old
+from services.metrics import stage
+from services.clients import get_firestore, get_groq
+from services.upload_service import IngestedUpload, as_buffer, as_file
+from services.history_index import history_index
 from dotenv import load_dotenv
-import json
-from firebase_admin import credentials, initialize_app, _apps
 
 load_dotenv()
 
 BACKEND_URL = os.getenv("BACKEND_URL")
 
-# Get credentials from environment variable
-cred_json = os.getenv("GOOGLE_APPLICATION_CREDENTIALS_JSON")
-
-if cred_json:
-    # Use the JSON string instead of a filename
-    cred_dict = json.loads(cred_json)
-    if not _apps:
-        cred = credentials.Certificate(cred_dict)
-        initialize_app(cred)
-else:
-    # Fallback for local development if you still have the file locally
-    cred = credentials.Certificate("hackwins-mind-flayers-firebase-adminsdk-fbsvc-ccc4812dec.json")
-    if not _apps:
-        initialize_app(cred)
-
-db = firestore.client()
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-async def run_diagnosis(user_id: str, image_data: bytes, audio_data: bytes, image_mime: str):
-    # --- STEP 1: VOICE TRANSCRIPTION ---
-    user_query = "The user provided a document for analysis."
-    if audio_data:
-        temp_audio = f"temp_{user_id}_input.mp3"
-        with open(temp_audio, "wb") as f: f.write(audio_data)
-        try:
-            user_query = transcribe_with_groq("whisper-large-v3", temp_audio)
-        finally:
-            if os.path.exists(temp_audio): os.remove(temp_audio)
-
-    # --- STEP 2: MULTIMODAL ANALYSIS ---
+DEFAULT_QUERY = "The user provided a document for analysis."
+
+# --- STAGES ---
+# Each stage is a plain blocking function so the job workers (job_service) can
+# run them one by one, persisting partial results in between.
+
+def transcribe_stage(user_id: str, audio_data) -> str:
+    """STEP 1: VOICE TRANSCRIPTION. audio_data is raw bytes or an IngestedUpload."""
+    if isinstance(audio_data, IngestedUpload):
+        # Stream the spooled upload straight to Whisper, no temp copy
+        with stage("run_diagnosis", "transcription"):
+            return transcribe_with_groq("whisper-large-v3", audio_data.filename or "recording.mp3", audio_data.open())
+    if not audio_data:
+        return DEFAULT_QUERY
+
+    temp_audio = f"temp_{user_id}_input.mp3"
+    with open(temp_audio, "wb") as f: f.write(audio_data)
     try:
-        # 1. INITIALIZE MESSAGES FIRST (Fixes the NameError)
-        messages = [
-            {
-                "role": "system", 
-                "content": "You are a professional AI Diagnostic Assistant. Analyze the image or document provided. Provide a differential analysis and suggest specialists. Use one compassionate paragraph. No markdown."
-            }
-        ]
-
-        user_content = [{"type": "text", "text": user_query}]
-
-        if image_data:
-            # --- PDF TO IMAGE CONVERSION ---
-            if "pdf" in image_mime.lower():
-                doc = pymupdf.open(stream=image_data, filetype="pdf")
+        with stage("run_diagnosis", "transcription"):
+            return transcribe_with_groq("whisper-large-v3", temp_audio)
+    finally:
+        if os.path.exists(temp_audio): os.remove(temp_audio)
+
+
+def analysis_stage(user_query: str, image_data, image_mime: str) -> str:
+    """STEP 2: MULTIMODAL ANALYSIS. Raises on failure; run_diagnosis turns that into an error message."""
+    # 1. INITIALIZE MESSAGES FIRST (Fixes the NameError)
+    messages = [
+        {
+            "role": "system", 
+            "content": "You are a professional AI Diagnostic Assistant. Analyze the image or document provided. Provide a differential analysis and suggest specialists. Use one compassionate paragraph. No markdown."
+        }
+    ]
+
+    user_content = [{"type": "text", "text": user_query}]
+
+    if image_data:
+        # --- PDF TO IMAGE CONVERSION ---
+        if "pdf" in image_mime.lower():
+            with stage("run_diagnosis", "pdf_render"):
+                doc = pymupdf.open(stream=as_buffer(image_data), filetype="pdf")
                 page = doc[0]
                 pix = page.get_pixmap(matrix=pymupdf.Matrix(2, 2))
                 img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
                 doc.close()
-            else:
-                img = Image.open(io.BytesIO(image_data))
+        else:
+            img = Image.open(as_file(image_data))
 
-            # --- IMAGE OPTIMIZATION ---
+        # --- IMAGE OPTIMIZATION ---
+        with stage("run_diagnosis", "image_encode"):
             if img.mode != "RGB": img = img.convert("RGB")
             if img.width > 1200:
                 img.thumbnail((1200, 1200), Image.Resampling.LANCZOS)
@@ -77,45 +73,71 @@ async def run_diagnosis(user_id: str, image_data: bytes, audio_data: bytes, imag
             buffer = io.BytesIO()
             img.save(buffer, format="JPEG", quality=85)
             base64_image = base64.b64encode(buffer.getvalue()).decode('utf-8')
-            
-            user_content.append({
-                "type": "image_url",
-                "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
-            })
+        
+        user_content.append({
+            "type": "image_url",
+            "image_url": {"url": f"data:image/jpeg;base64,{base64_image}"}
+        })
 
-        # 2. APPEND THE CONSTRUCTED USER CONTENT
-        messages.append({"role": "user", "content": user_content})
+    # 2. APPEND THE CONSTRUCTED USER CONTENT
+    messages.append({"role": "user", "content": user_content})
 
-        # 3. CALL GROQ
-        completion = client.chat.completions.create(
+    # 3. CALL GROQ
+    with stage("run_diagnosis", "vision_inference"):
+        completion = get_groq().chat.completions.create(
             model="meta-llama/llama-4-scout-17b-16e-instruct", 
             messages=messages,
             temperature=0.3,
             max_tokens=600
         )
-        ai_text = completion.choices[0].message.content
+    return completion.choices[0].message.content
 
-        # --- STEP 3: VOICE GENERATION ---
-        os.makedirs("static", exist_ok=True)
-        filename = f"response_{user_id}_{int(datetime.now().timestamp())}.mp3"
-        output_audio_path = os.path.join("static", filename)
-        
+
+def voice_stage(user_id: str, ai_text: str) -> str:
+    """STEP 3: VOICE GENERATION. Returns the public URL of the MP3."""
+    os.makedirs("static", exist_ok=True)
+    filename = f"response_{user_id}_{int(datetime.now().timestamp())}.mp3"
+    output_audio_path = os.path.join("static", filename)
+    
+    with stage("run_diagnosis", "tts"):
         text_to_speech_with_gtts_old(ai_text, output_audio_path)
-        audio_url = f"{BACKEND_URL}/static/{filename}"
-
-        # --- STEP 4: SAVE TO FIREBASE ---
-        summary_preview = ai_text[:60].strip() + "..." 
-
-        history_data = {
-            "userId": user_id,
-            "timestamp": datetime.now(),
-            "userQuery": user_query,
-            "aiAnalysis": ai_text,
-            "summary": summary_preview, # New field
-            "audioUrl": audio_url,
-            "fileType": image_mime
-        }
-        db.collection("user_summary").document(user_id).collection("history").add(history_data)
+    return f"{BACKEND_URL}/static/{filename}"
+
+
+def save_stage(user_id: str, user_query: str, ai_text: str, audio_url: str, image_mime: str):
+    """STEP 4: SAVE TO FIREBASE."""
+    summary_preview = ai_text[:60].strip() + "..." 
+
+    history_data = {
+        "userId": user_id,
+        "timestamp": datetime.now(),
+        "userQuery": user_query,
+        "aiAnalysis": ai_text,
+        "summary": summary_preview, # New field
+        "audioUrl": audio_url,
+        "fileType": image_mime
+    }
+    with stage("run_diagnosis", "firestore_write"):
+        _, doc_ref = get_firestore().collection("user_summary").document(user_id).collection("history").add(history_data)
+
+    # Keep the local chat retrieval index in step with Firestore. The diagnosis is
+    # already saved, so an index failure must not fail the request (or leave a job
+    # unsaved, so it is saved again when resumed); chat just won't cite this entry.
+    try:
+        with stage("run_diagnosis", "history_index"):
+            history_index.add_entry(user_id, user_query, ai_text, history_data["timestamp"].timestamp(), doc_ref.id)
+    except Exception as e:
+        print(f"DEBUG: History index write failed: {str(e)}")
+
+
+async def run_diagnosis(user_id: str, image_data, audio_data, image_mime: str):
+    # image_data / audio_data are raw bytes or IngestedUpload handles (see upload_service)
+    user_query = transcribe_stage(user_id, audio_data)
+
+    try:
+        ai_text = analysis_stage(user_query, image_data, image_mime)
+        audio_url = voice_stage(user_id, ai_text)
+        save_stage(user_id, user_query, ai_text, audio_url, image_mime)
 
     except Exception as e:
         print(f"Detailed Backend Error: {str(e)}")
@@ -126,4 +148,4 @@ async def run_diagnosis(user_id: str, image_data: bytes, audio_data: bytes, imag
         "transcription": user_query,
         "analysis": ai_text,
         "audio_url": audio_url
-    }
\ No newline at end of file
+    }
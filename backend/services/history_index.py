@@ -0,0 +1,161 @@
+import os
+import re
+import time
+import hashlib
+import sqlite3
+import threading
+from firebase_admin import firestore
+from services.metrics import stage
+from services.clients import get_firestore
+
+# --- CONFIG ---
+HISTORY_INDEX_PATH = os.getenv("HISTORY_INDEX_PATH", os.path.join("data", "history_index.db"))
+HISTORY_TOP_K = int(os.getenv("HISTORY_TOP_K", "3"))
+# Rough budget for past findings in the chat prompt (~4 characters per token)
+HISTORY_CONTEXT_TOKENS = int(os.getenv("HISTORY_CONTEXT_TOKENS", "300"))
+# How many past diagnoses to pull from Firestore the first time a user is seen
+HISTORY_BACKFILL_LIMIT = int(os.getenv("HISTORY_BACKFILL_LIMIT", "200"))
+
+_STOPWORDS = {
+    "the", "and", "for", "are", "but", "not", "you", "your", "with", "can", "have", "has", "had", "was",
+    "what", "when", "how", "why", "who", "does", "did", "this", "that", "from", "they", "them", "about",
+    "should", "would", "could", "take", "any", "all", "its", "into", "also", "been", "will", "there", "my",
+}
+_WORD = re.compile(r"[a-z0-9]{3,}")
+
+
+def _owner_token(user_id: str) -> str:
+    # One opaque token per user, so "owner:<token>" narrows the MATCH inside FTS itself
+    return "u" + hashlib.sha1(user_id.encode()).hexdigest()[:20]
+
+
+def _match_terms(text: str, limit: int = 12) -> list:
+    seen = []
+    for word in _WORD.findall(text.lower()):
+        if word not in _STOPWORDS and word not in seen:
+            seen.append(word)
+    return seen[:limit]
+
+
+class HistoryIndex:
+    """
+    Local full-text index (SQLite FTS5, BM25 ranking) over every user's past
+    diagnoses. Updated incrementally by save_stage; a user's older Firestore
+    history is backfilled once, the first time their chat needs it.
+    """
+
+    def __init__(self, path: str = HISTORY_INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS history_docs (
+                    rowid INTEGER PRIMARY KEY,
+                    doc_id TEXT UNIQUE,
+                    owner TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    user_query TEXT,
+                    analysis TEXT
+                );
+                CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(
+                    owner, user_query, analysis,
+                    content='history_docs', content_rowid='rowid', tokenize='porter unicode61'
+                );
+                CREATE TRIGGER IF NOT EXISTS history_docs_ai AFTER INSERT ON history_docs BEGIN
+                    INSERT INTO history_fts(rowid, owner, user_query, analysis)
+                    VALUES (new.rowid, new.owner, new.user_query, new.analysis);
+                END;
+                CREATE TABLE IF NOT EXISTS backfilled_users (
+                    owner TEXT PRIMARY KEY,
+                    backfilled_at REAL NOT NULL
+                );
+            """)
+            self._conn = conn
+        return self._conn
+
+    def add_entry(self, user_id: str, user_query: str, analysis: str, created_at: float = None, doc_id: str = None):
+        """Indexes one diagnosis. Entries with a known doc_id are only indexed once."""
+        with self._lock:
+            self._db().execute(
+                "INSERT OR IGNORE INTO history_docs (doc_id, owner, created_at, user_query, analysis) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, _owner_token(user_id), created_at or time.time(), user_query or "", analysis or ""),
+            )
+
+    def _needs_backfill(self, owner: str) -> bool:
+        with self._lock:
+            row = self._db().execute("SELECT 1 FROM backfilled_users WHERE owner = ?", (owner,)).fetchone()
+        return row is None
+
+    def ensure_backfilled(self, user_id: str):
+        """One Firestore read per user, ever: imports history written before this index existed."""
+        owner = _owner_token(user_id)
+        if not self._needs_backfill(owner):
+            return
+
+        with stage("history_index", "firestore_backfill"):
+            docs = (
+                get_firestore().collection("user_summary").document(user_id).collection("history")
+                .order_by("timestamp", direction=firestore.Query.DESCENDING)
+                .limit(HISTORY_BACKFILL_LIMIT)
+                .stream()
+            )
+            for doc in docs:
+                data = doc.to_dict() or {}
+                timestamp = data.get("timestamp")
+                created_at = timestamp.timestamp() if hasattr(timestamp, "timestamp") else None
+                self.add_entry(user_id, data.get("userQuery"), data.get("aiAnalysis"), created_at, doc.id)
+
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO backfilled_users (owner, backfilled_at) VALUES (?, ?)", (owner, time.time())
+            )
+
+    def search(self, user_id: str, text: str, k: int = HISTORY_TOP_K) -> list:
+        """Top-k past diagnoses for this user ranked by BM25 against `text`."""
+        terms = _match_terms(text)
+        if not terms:
+            return []
+        query = f'owner:{_owner_token(user_id)} AND ({" OR ".join(f"{t}*" for t in terms)})'
+        with self._lock:
+            rows = self._db().execute(
+                """
+                SELECT d.created_at, d.user_query, d.analysis
+                FROM history_fts JOIN history_docs d ON d.rowid = history_fts.rowid
+                WHERE history_fts MATCH ?
+                ORDER BY bm25(history_fts, 0.0, 1.0, 2.0)
+                LIMIT ?
+                """,
+                (query, k),
+            ).fetchall()
+        return [{"created_at": r[0], "user_query": r[1], "analysis": r[2]} for r in rows]
+
+    def relevant_context(self, user_id: str, text: str, max_tokens: int = HISTORY_CONTEXT_TOKENS) -> str:
+        """Past findings relevant to `text`, formatted for the prompt and cut to `max_tokens`."""
+        try:
+            self.ensure_backfilled(user_id)
+            results = self.search(user_id, text)
+        except Exception as e:
+            print(f"DEBUG: History index error: {str(e)}")
+            return ""
+
+        budget = max_tokens * 4
+        lines = []
+        for item in results:
+            if budget < 40:
+                break
+            day = time.strftime("%Y-%m-%d", time.localtime(item["created_at"]))
+            line = f"- {day}: {' '.join(item['analysis'].split())}"
+            if len(line) > budget:
+                line = line[:budget - 3].rstrip() + "..."
+            lines.append(line)
+            budget -= len(line) + 1
+        return "\n".join(lines)
+
+
+history_index = HistoryIndex()
@@ -0,0 +1,212 @@
+import os
+import gzip
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+
+from starlette.responses import Response
+
+from services.metrics import record_cache
+from services.serialization import dumps
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# --- CONFIG ---
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+# Long-poll (?wait=N): longest a request is held, and how often the version is re-read meanwhile
+LONG_POLL_MAX_SECONDS = float(os.getenv("LONG_POLL_MAX_SECONDS", "30"))
+LONG_POLL_INTERVAL = float(os.getenv("LONG_POLL_INTERVAL", "0.25"))
+# Rendered (and compressed) bodies kept per ETag, so a version is serialized/compressed once
+BODY_CACHE_SIZE = int(os.getenv("HTTP_BODY_CACHE_SIZE", "256"))
+
+_COMPRESSIBLE = (b"application/json", b"text/", b"application/javascript", b"application/x-ndjson")
+
+
+class _LRU:
+    def __init__(self, size: int):
+        self.size = size
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+
+_bodies = _LRU(BODY_CACHE_SIZE)
+_compressed = _LRU(BODY_CACHE_SIZE)
+
+
+# --- ETAGS ---
+
+def make_etag(epoch: str, version: int) -> str:
+    # Maintained on write by the state store, so reads never hash the body.
+    # Weak, since gzip/brotli/identity encodings of a version share the tag.
+    return f'W/"{epoch}-{version}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison (RFC 9110 13.1.2): W/ prefixes are ignored for If-None-Match
+    candidates = (tag.strip() for tag in if_none_match.split(","))
+    return etag.removeprefix("W/") in (tag.removeprefix("W/") for tag in candidates)
+
+
+async def wait_for_change(get_version, seen: int, timeout: float) -> int:
+    """Re-reads the version until it moves past `seen` or `timeout` passes. Returns the latest version."""
+    deadline = time.monotonic() + timeout
+    version = seen
+    while version == seen and time.monotonic() < deadline:
+        await asyncio.sleep(min(LONG_POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+        version = get_version()
+    return version
+
+
+async def conditional_json(request, cache_key: str, epoch: str, get_version, build_payload, wait: float = 0):
+    """
+    JSON response with a version ETag. If-None-Match on the current version
+    gets a 304; with `wait` > 0 the request is held (long-poll) until the
+    version changes or the wait runs out.
+
+    The version is read before the payload, so a concurrent write can only make
+    the body newer than its tag, which costs the client one extra download.
+    """
+    version = get_version()
+    etag = make_etag(epoch, version)
+    if_none_match = request.headers.get("if-none-match")
+    if etag_matches(if_none_match, etag) and wait > 0:
+        version = await wait_for_change(get_version, version, min(wait, LONG_POLL_MAX_SECONDS))
+        etag = make_etag(epoch, version)
+
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    body = _bodies.get((cache_key, etag))
+    record_cache("http_bodies", body is not None)
+    if body is None:
+        body = dumps(build_payload())
+        _bodies.put((cache_key, etag), body)
+    return Response(body, media_type="application/json", headers=headers)
+
+
+# --- COMPRESSION ---
+
+def _pick_encoding(accept_encoding: str):
+    accepted = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def _compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Pure ASGI middleware: brotli (if installed) or gzip for complete responses
+    of at least `minimum_size` bytes. Streaming responses (SSE, NDJSON) pass
+    through untouched so their lines still flush immediately. Bodies carrying
+    an ETag are compressed once per version and encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+        encoding = _pick_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def compressing_send(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            raw_headers = list(start_message.get("headers", []))
+            headers = {name.lower(): value for name, value in raw_headers}
+            compressible = (
+                not message.get("more_body", False)
+                and len(body) >= self.minimum_size
+                and b"content-encoding" not in headers
+                and headers.get(b"content-type", b"").startswith(_COMPRESSIBLE)
+            )
+            passthrough = True
+            if not compressible:
+                await send(start_message)
+                await send(message)
+                return
+
+            etag = headers.get(b"etag")
+            key = (scope["path"], etag, encoding) if etag else None
+            compressed = _compressed.get(key) if key else None
+            if compressed is None:
+                compressed = _compress(body, encoding)
+                if key:
+                    _compressed.put(key, compressed)
+            vary = headers.get(b"vary")
+            raw_headers = [(k, v) for k, v in raw_headers if k.lower() not in (b"content-length", b"vary")]
+            raw_headers += [
+                (b"content-encoding", encoding.encode()),
+                (b"content-length", str(len(compressed)).encode()),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            await send({**start_message, "headers": raw_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, compressing_send)
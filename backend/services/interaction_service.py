@@ -1,19 +1,74 @@
-import os
-import json
-from google import genai
 from google.genai import types
-from dotenv import load_dotenv
+from services.metrics import stage
+from services.clients import get_gemini
+from services.schemas import DrugAnalysis
+from services.json_repair import parse_model_output
 
-load_dotenv()
+# Severity codes shared with the batch screener (batch_analysis_service)
+RISK_LEVELS = ("NONE", "LOW", "MODERATE", "HIGH")
+RISK_SEVERITY = {level: code for code, level in enumerate(RISK_LEVELS)}
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+# Well-established pairs answered locally without a model call
+KNOWN_INTERACTIONS = {
+    frozenset(("warfarin", "ibuprofen")): {
+        "risk_level": "HIGH",
+        "clinical_info": "NSAID-induced displacement of warfarin and anti-platelet effect.",
+        "simple_explanation": "Taking Warfarin and Ibuprofen together creates a major risk of internal bleeding."
+    },
+    frozenset(("warfarin", "aspirin")): {
+        "risk_level": "HIGH",
+        "clinical_info": "Additive anticoagulant and anti-platelet effect with gastric mucosal injury.",
+        "simple_explanation": "Warfarin with Aspirin sharply raises the risk of serious bleeding."
+    },
+    frozenset(("sildenafil", "nitroglycerin")): {
+        "risk_level": "HIGH",
+        "clinical_info": "PDE5 inhibition potentiates nitrate-mediated cGMP vasodilation.",
+        "simple_explanation": "Sildenafil with Nitroglycerin can cause a dangerous drop in blood pressure."
+    },
+    frozenset(("simvastatin", "clarithromycin")): {
+        "risk_level": "HIGH",
+        "clinical_info": "CYP3A4 inhibition raises simvastatin exposure (myopathy, rhabdomyolysis).",
+        "simple_explanation": "Clarithromycin can push Simvastatin to levels that damage muscles."
+    },
+    frozenset(("sertraline", "tramadol")): {
+        "risk_level": "HIGH",
+        "clinical_info": "Combined serotonergic activity; tramadol also lowers seizure threshold.",
+        "simple_explanation": "Sertraline with Tramadol can trigger serotonin syndrome."
+    },
+    frozenset(("lisinopril", "spironolactone")): {
+        "risk_level": "MODERATE",
+        "clinical_info": "ACE inhibition plus aldosterone antagonism reduces potassium excretion.",
+        "simple_explanation": "Lisinopril with Spironolactone can raise potassium to unsafe levels."
+    },
+    frozenset(("clopidogrel", "omeprazole")): {
+        "risk_level": "MODERATE",
+        "clinical_info": "CYP2C19 inhibition reduces activation of the clopidogrel prodrug.",
+        "simple_explanation": "Omeprazole can make Clopidogrel less effective at preventing clots."
+    },
+    frozenset(("aspirin", "clopidogrel")): {
+        "risk_level": "MODERATE",
+        "clinical_info": "Dual anti-platelet therapy; additive inhibition of platelet aggregation.",
+        "simple_explanation": "Aspirin with Clopidogrel increases bleeding risk and needs monitoring."
+    },
+}
 
-async def get_drug_analysis(medication_list: list[str]):
+
+def normalize_med_name(name: str) -> str:
     # Normalize input (e.g., 'ibuprofenn' -> 'ibuprofen')
-    meds = [m.lower().strip().rstrip('n') if m.lower().endswith('nn') else m.lower().strip() for m in medication_list]
+    return name.lower().strip().rstrip('n') if name.lower().endswith('nn') else name.lower().strip()
+
+
+async def get_drug_analysis(medication_list: list[str]):
+    analysis, _ = await analyze_medications(medication_list)
+    return analysis
+
+
+async def analyze_medications(medication_list: list[str]):
+    """Like get_drug_analysis, but returns (analysis, from_model); from_model is False for the offline fallback."""
+    meds = [normalize_med_name(m) for m in medication_list]
     
     if len(meds) < 2:
-        return {"risk_level": "LOW", "interaction_count": 0, "details": []}
+        return {"risk_level": "LOW", "interaction_count": 0, "details": []}, True
 
     # persona-shift: Use "biochemical researcher" to avoid medical advice filters
     prompt = f"""
@@ -24,7 +79,7 @@ async def get_drug_analysis(medication_list: list[str]):
 
     JSON SCHEMA:
     {{
-      "risk_level": "HIGH" | "MODERATE" | "LOW",
+      "risk_level": "HIGH" | "MODERATE" | "LOW" | "NONE",
       "interaction_count": 1,
       "details": [
         {{
@@ -46,17 +101,20 @@ async def get_drug_analysis(medication_list: list[str]):
         )
 
         # FIXED MODEL ID: Add the "-preview" suffix
-        response = client.models.generate_content(
-            model="gemini-3-flash-preview", 
-            contents=prompt,
-            config=config
-        )
+        with stage("get_drug_analysis", "gemini"):
+            response = get_gemini().models.generate_content(
+                model="gemini-3-flash-preview", 
+                contents=prompt,
+                config=config
+            )
 
-        if response.text:
-            return json.loads(response.text)
+        # Malformed JSON is repaired locally; unusable output falls back to the mock
+        analysis = parse_model_output(response.text, DrugAnalysis) if response.text else None
+        if analysis:
+            return analysis.model_dump(), True
         
         # If the API still returns nothing, use the fallback
-        return _get_mock_analysis(meds)
+        return _get_mock_analysis(meds), False
 
     except Exception as e:
         print(f"DEBUG: API Error: {e}")
@@ -66,26 +124,27 @@ async def get_drug_analysis(medication_list: list[str]):
 async def _try_legacy_model(meds, prompt, config):
     try:
         # Fallback to the most widely available stable model
-        response = client.models.generate_content(
-            model="gemini-1.5-flash", 
-            contents=prompt,
-            config=config
-        )
-        if response.text: return json.loads(response.text)
+        with stage("get_drug_analysis", "gemini_legacy"):
+            response = get_gemini().models.generate_content(
+                model="gemini-1.5-flash", 
+                contents=prompt,
+                config=config
+            )
+        analysis = parse_model_output(response.text, DrugAnalysis) if response.text else None
+        if analysis: return analysis.model_dump(), True
     except:
         pass
-    return _get_mock_analysis(meds)
+    return _get_mock_analysis(meds), False
 
 def _get_mock_analysis(meds: list[str]):
-    """Hardcoded safety for the Warfarin + Ibuprofen combo."""
-    if "warfarin" in meds and "ibuprofen" in meds:
-        return {
-            "risk_level": "HIGH",
-            "interaction_count": 1,
-            "details": [{
-                "risk_level": "HIGH",
-                "clinical_info": "NSAID-induced displacement of warfarin and anti-platelet effect.",
-                "simple_explanation": "Taking Warfarin and Ibuprofen together creates a major risk of internal bleeding."
-            }]
-        }
-    return {"risk_level": "LOW", "interaction_count": 0, "details": []}
\ No newline at end of file
+    """Offline safety net: answers from KNOWN_INTERACTIONS when the model is unavailable."""
+    unique = sorted(set(meds))
+    details = [
+        dict(KNOWN_INTERACTIONS[frozenset((a, b))])
+        for i, a in enumerate(unique) for b in unique[i + 1:]
+        if frozenset((a, b)) in KNOWN_INTERACTIONS
+    ]
+    if not details:
+        return {"risk_level": "LOW", "interaction_count": 0, "details": []}
+    risk_level = max((d["risk_level"] for d in details), key=RISK_SEVERITY.get)
+    return {"risk_level": risk_level, "interaction_count": len(details), "details": details}
\ No newline at end of file
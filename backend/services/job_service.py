@@ -0,0 +1,307 @@
+import os
+import time
+import uuid
+import asyncio
+import shutil
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from services.process import pid_alive
+from services.upload_service import IngestedUpload
+from services.serialization import dumps
+from services.diagnostic_service import DEFAULT_QUERY, transcribe_stage, analysis_stage, voice_stage, save_stage
+
+# --- CONFIG ---
+JOBS_DIR = os.getenv("DIAGNOSIS_JOBS_DIR", "jobs")
+DIAGNOSIS_WORKERS = int(os.getenv("DIAGNOSIS_WORKERS", "4"))
+MAX_PENDING_JOBS = int(os.getenv("DIAGNOSIS_MAX_PENDING", "100"))
+JOB_RETENTION_SECONDS = int(os.getenv("DIAGNOSIS_JOB_RETENTION_HOURS", "24")) * 3600
+
+# queued -> transcribing -> analyzing -> generating_audio -> saving -> done | failed
+FINAL_STATUSES = ("done", "failed")
+
+
+class JobQueueFull(Exception):
+    """Raised when MAX_PENDING_JOBS jobs are already waiting or running."""
+
+
+class DiagnosisJobStore:
+    """SQLite-backed job table, so queued and half-finished jobs survive a restart."""
+
+    def __init__(self, path: str):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                image_path TEXT, image_mime TEXT, image_name TEXT,
+                audio_path TEXT, audio_name TEXT,
+                transcription TEXT, analysis TEXT, audio_url TEXT,
+                saved INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                worker_pid INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status)")
+
+    def create(self, job: dict, max_active: int = None) -> bool:
+        """
+        Inserts a job. With `max_active`, the capacity check and the insert run
+        in one write transaction, so concurrent submits (from any worker process)
+        can't both take the last slot. Returns False if the queue was full.
+        """
+        now = time.time()
+        job = {**job, "created_at": now, "updated_at": now}
+        names = ", ".join(job)
+        marks = ", ".join("?" for _ in job)
+        final_marks = ", ".join("?" for _ in FINAL_STATUSES)
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if max_active is not None:
+                    active = self._conn.execute(
+                        f"SELECT COUNT(*) FROM jobs WHERE status NOT IN ({final_marks})", FINAL_STATUSES
+                    ).fetchone()[0]
+                    if active >= max_active:
+                        self._conn.execute("ROLLBACK")
+                        return False
+                self._conn.execute(f"INSERT INTO jobs ({names}) VALUES ({marks})", tuple(job.values()))
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+        return True
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row else None
+
+    def count_active(self) -> int:
+        marks = ", ".join("?" for _ in FINAL_STATUSES)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM jobs WHERE status NOT IN ({marks})", FINAL_STATUSES).fetchone()[0]
+
+    def claim_orphans(self, pid: int) -> list:
+        """
+        Takes over unfinished jobs whose worker process is gone. Returns their ids.
+        Called from start() before this process has submitted anything, so rows
+        stamped with `pid` itself belong to an earlier process that had the same
+        PID (the usual case when a container restarts) and are orphans too.
+        """
+        marks = ", ".join("?" for _ in FINAL_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, worker_pid FROM jobs WHERE status NOT IN ({marks})", FINAL_STATUSES
+            ).fetchall()
+            claimed = []
+            for row in rows:
+                owner = row["worker_pid"]
+                if owner is not None and owner != pid and pid_alive(owner):
+                    continue
+                # Conditional update so two restarting workers can't both claim a job
+                cursor = self._conn.execute(
+                    "UPDATE jobs SET worker_pid = ? WHERE id = ? AND worker_pid IS ?", (pid, row["id"], owner)
+                )
+                if cursor.rowcount:
+                    claimed.append(row["id"])
+        return claimed
+
+    def prune(self, older_than: float) -> list:
+        """Deletes finished jobs last touched before `older_than`. Returns their ids."""
+        marks = ", ".join("?" for _ in FINAL_STATUSES)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id FROM jobs WHERE status IN ({marks}) AND updated_at < ?", (*FINAL_STATUSES, older_than)
+            ).fetchall()
+            self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({marks}) AND updated_at < ?", (*FINAL_STATUSES, older_than)
+            )
+        return [row["id"] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def job_snapshot(job: dict) -> dict:
+    """Public view of a job: status plus whatever partial results exist so far."""
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "transcription": job["transcription"],
+        "analysis": job["analysis"],
+        "audio_url": job["audio_url"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+    }
+
+
+class DiagnosisJobQueue:
+    """
+    Runs run_diagnosis stages on a bounded thread pool. Uploads are copied into
+    JOBS_DIR/<job_id>/ and every stage result is persisted, so after a restart
+    unfinished jobs resume from the first stage that has no result yet.
+    """
+
+    def __init__(self, jobs_dir: str = JOBS_DIR, workers: int = DIAGNOSIS_WORKERS, max_pending: int = MAX_PENDING_JOBS):
+        self.jobs_dir = jobs_dir
+        self.workers = workers
+        self.max_pending = max_pending
+        self.store = None
+        self._executor = None
+
+    def start(self):
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self.store = DiagnosisJobStore(os.path.join(self.jobs_dir, "jobs.db"))
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="diagnosis")
+
+        for job_id in self.store.prune(time.time() - JOB_RETENTION_SECONDS):
+            shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+        recovered = self.store.claim_orphans(os.getpid())
+        for job_id in recovered:
+            self._executor.submit(self._process, job_id)
+        if recovered:
+            print(f"Resumed {len(recovered)} unfinished diagnosis job(s)")
+
+    def stop(self):
+        if self._executor:
+            # Queued jobs are dropped from memory only; they stay in the table and
+            # resume (like any interrupted job) on the next start
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _persist_upload(self, job_dir: str, name: str, upload: IngestedUpload):
+        if upload is None:
+            return None
+        path = os.path.join(job_dir, name)
+        with open(path, "wb") as f:
+            shutil.copyfileobj(upload.open(), f, 1024 * 1024)
+        return path
+
+    def submit(self, user_id: str, image: IngestedUpload = None, audio: IngestedUpload = None) -> dict:
+        """Blocking (copies the uploads and writes SQLite); call it off the event loop."""
+        # Cheap early rejection before copying uploads; create() makes the real check
+        if self.store.count_active() >= self.max_pending:
+            raise JobQueueFull()
+
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(self.jobs_dir, job_id)
+        os.makedirs(job_dir)
+        try:
+            created = self.store.create({
+                "id": job_id,
+                "user_id": user_id,
+                "status": "queued",
+                "image_path": self._persist_upload(job_dir, "image", image),
+                "image_mime": image.content_type if image else None,
+                "image_name": image.filename if image else None,
+                "audio_path": self._persist_upload(job_dir, "audio", audio),
+                "audio_name": audio.filename if audio else None,
+                "worker_pid": os.getpid(),
+            }, max_active=self.max_pending)
+        except BaseException:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise
+        if not created:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise JobQueueFull()
+        self._executor.submit(self._process, job_id)
+        return job_snapshot(self.store.get(job_id))
+
+    def get(self, job_id: str):
+        job = self.store.get(job_id)
+        return job_snapshot(job) if job else None
+
+    @staticmethod
+    def _open_upload(path: str, content_type: str, filename: str):
+        if not path:
+            return None
+        return IngestedUpload(open(path, "rb"), os.path.getsize(path), content_type, filename, owns_file=True)
+
+    def _process(self, job_id: str):
+        job = self.store.get(job_id)
+        if not job or job["status"] in FINAL_STATUSES:
+            return
+
+        image = self._open_upload(job["image_path"], job["image_mime"], job["image_name"])
+        audio = self._open_upload(job["audio_path"], None, job["audio_name"])
+        try:
+            transcription = job["transcription"]
+            if transcription is None:
+                self.store.update(job_id, status="transcribing")
+                transcription = transcribe_stage(job["user_id"], audio) if audio else DEFAULT_QUERY
+                self.store.update(job_id, transcription=transcription)
+
+            analysis = job["analysis"]
+            if analysis is None:
+                self.store.update(job_id, status="analyzing")
+                analysis = analysis_stage(transcription, image, job["image_mime"])
+                self.store.update(job_id, analysis=analysis)
+
+            audio_url = job["audio_url"]
+            if audio_url is None:
+                self.store.update(job_id, status="generating_audio")
+                audio_url = voice_stage(job["user_id"], analysis)
+                self.store.update(job_id, audio_url=audio_url)
+
+            if not job["saved"]:
+                self.store.update(job_id, status="saving")
+                save_stage(job["user_id"], transcription, analysis, audio_url, job["image_mime"])
+
+            self.store.update(job_id, status="done", saved=1)
+        except Exception as e:
+            print(f"Diagnosis job {job_id} failed: {str(e)}")
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            for upload in (image, audio):
+                if upload:
+                    upload.close()
+
+        shutil.rmtree(os.path.join(self.jobs_dir, job_id), ignore_errors=True)
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+async def job_events(queue: DiagnosisJobQueue, job_id: str, poll_interval: float = 0.5, keepalive: float = 15.0):
+    """
+    Server-Sent Events stream for one job: a `status` event each time the job
+    changes (so transcription, analysis and audio arrive as they finish), ending
+    after the final status. Reads the local job table, so any worker can serve it.
+    """
+    last_update = None
+    idle = 0.0
+    while True:
+        job = queue.get(job_id)
+        if job is None:
+            yield format_sse("error", {"detail": "Job not found"})
+            return
+        if job["updated_at"] != last_update:
+            last_update = job["updated_at"]
+            idle = 0.0
+            yield format_sse("status", job)
+            if job["status"] in FINAL_STATUSES:
+                return
+        elif idle >= keepalive:
+            idle = 0.0
+            yield ": keep-alive\n\n"
+        await asyncio.sleep(poll_interval)
+        idle += poll_interval
+
+
+job_queue = DiagnosisJobQueue()
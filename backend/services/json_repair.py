@@ -0,0 +1,129 @@
+import orjson
+from pydantic import BaseModel, ValidationError
+
+# LLM JSON comes back with predictable defects: markdown fences, prose around
+# the object, trailing commas, single quotes, Python literals, unquoted keys,
+# raw newlines in strings, or a reply cut off at max_tokens. repair_json()
+# fixes those locally in one pass so we never need a second model round trip.
+
+_LITERALS = {
+    "true": "true", "false": "false", "null": "null",
+    "True": "true", "False": "false", "None": "null", "NaN": "null", "undefined": "null",
+}
+# Opening quote -> closing quote, including the curly quotes models like to emit
+_QUOTES = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_CLOSERS = {"{": "}", "[": "]"}
+_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+def _drop_trailing_comma(out: list):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def repair_json(text: str) -> str:
+    """Best-effort rewrite of LLM output into strict JSON. Returns "" if no object/array is found."""
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return ""
+    i = min(starts)
+    n = len(text)
+
+    out = []
+    stack = []
+    quote = None  # closing delimiter of the active string, or None outside strings
+
+    while i < n:
+        ch = text[i]
+
+        if quote:
+            if ch == "\\" and i + 1 < n:
+                nxt = text[i + 1]
+                # \' is not a valid JSON escape
+                out.append("'" if nxt == "'" else ch + nxt)
+                i += 2
+                continue
+            if ch == quote:
+                out.append('"')
+                quote = None
+            elif ch == '"':
+                out.append('\\"')
+            elif ch in _ESCAPES:
+                out.append(_ESCAPES[ch])
+            elif ch < " ":
+                out.append(f"\\u{ord(ch):04x}")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch in _QUOTES:
+            quote = _QUOTES[ch]
+            out.append('"')
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            out.append(ch)
+        elif ch in "}]":
+            if not stack:
+                break
+            _drop_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                break
+        elif ch == "/" and i + 1 < n and text[i + 1] in "/*":
+            end = text.find("\n", i) if text[i + 1] == "/" else text.find("*/", i + 2)
+            i = n if end == -1 else end + (0 if text[i + 1] == "/" else 2)
+            continue
+        elif ch.isalpha() or ch == "_":
+            j = i
+            while j < n and (text[j].isalnum() or text[j] in "_-"):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k].isspace():
+                k += 1
+            if out and out[-1][-1:].isdigit():
+                # Exponent or suffix of a number (1e5), keep as-is
+                out.append(word)
+            elif word in _LITERALS and not (k < n and text[k] == ":"):
+                out.append(_LITERALS[word])
+            else:
+                # Unquoted key or bare word value
+                out.append(orjson.dumps(word).decode())
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    # Truncated reply: close the open string, then every open container
+    if quote:
+        out.append('"')
+    while stack:
+        _drop_trailing_comma(out)
+        if out and out[-1] == ":":
+            out.append("null")
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def loads_lenient(text: str):
+    """json.loads that falls back to repair_json(). Raises ValueError if nothing parseable remains."""
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        repaired = repair_json(text or "")
+        if not repaired:
+            raise ValueError("No JSON object found in model output")
+        return orjson.loads(repaired)
+
+
+def parse_model_output(text: str, schema: type[BaseModel]):
+    """Parses (repairing if needed) and validates LLM output. Returns a `schema` instance or None."""
+    try:
+        return schema.model_validate(loads_lenient(text))
+    except (ValueError, ValidationError) as e:
+        print(f"DEBUG: Unusable model output for {schema.__name__}: {str(e)[:200]}")
+        return None
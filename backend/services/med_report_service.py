@@ -0,0 +1,225 @@
+import os
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+
+from services.metrics import stage, record_cache
+from services.interaction_service import RISK_SEVERITY, analyze_medications, normalize_med_name
+
+# --- CONFIG ---
+MED_REPORTS_DB_PATH = os.getenv("MED_REPORTS_DB_PATH", os.path.join("data", "med_reports.db"))
+MED_REPORT_TTL_SECONDS = float(os.getenv("MED_REPORT_TTL_HOURS", "168")) * 3600
+MED_REPORT_WORKERS = int(os.getenv("MED_REPORT_WORKERS", "2"))
+# How many known risks chat quotes in its prompt
+MAX_PROMPT_RISKS = int(os.getenv("MED_REPORT_PROMPT_RISKS", "5"))
+# After a failed precompute the set is retried no sooner than this, doubling per failure
+MED_REPORT_RETRY_SECONDS = float(os.getenv("MED_REPORT_RETRY_SECONDS", "300"))
+MED_REPORT_RETRY_MAX_SECONDS = float(os.getenv("MED_REPORT_RETRY_MAX_HOURS", "6")) * 3600
+
+
+def med_set_key(medication_list: list) -> tuple:
+    """Normalized, de-duplicated, sorted med names: order and spelling noise don't change the set."""
+    return tuple(sorted({normalize_med_name(m) for m in medication_list or [] if m and m.strip()}))
+
+
+def med_set_fingerprint(meds: tuple) -> str:
+    return hashlib.sha1("\x1f".join(meds).encode()).hexdigest()
+
+
+class MedReportStore:
+    """
+    Interaction reports keyed by med-set fingerprint (shared by every user on
+    the same set), plus each user's current fingerprint. SQLite so all workers
+    share one copy.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reports (
+                fingerprint TEXT PRIMARY KEY,
+                meds TEXT NOT NULL,
+                report BLOB NOT NULL,
+                computed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS user_med_sets (
+                user_id TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS failures (
+                fingerprint TEXT PRIMARY KEY,
+                attempts INTEGER NOT NULL,
+                retry_at REAL NOT NULL
+            );
+        """)
+
+    def get_report(self, fingerprint: str, max_age: float):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT report FROM reports WHERE fingerprint = ? AND computed_at > ?",
+                (fingerprint, time.time() - max_age),
+            ).fetchone()
+        return orjson.loads(row[0]) if row else None
+
+    def put_report(self, fingerprint: str, meds: tuple, report: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO reports (fingerprint, meds, report, computed_at) VALUES (?, ?, ?, ?)",
+                (fingerprint, ",".join(meds), orjson.dumps(report), time.time()),
+            )
+            self._conn.execute("DELETE FROM failures WHERE fingerprint = ?", (fingerprint,))
+
+    def record_failure(self, fingerprint: str) -> float:
+        """Backs the set off exponentially. Returns when it may be retried."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT attempts FROM failures WHERE fingerprint = ?", (fingerprint,)).fetchone()
+            attempts = (row[0] if row else 0) + 1
+            retry_at = now + min(MED_REPORT_RETRY_SECONDS * 2 ** (attempts - 1), MED_REPORT_RETRY_MAX_SECONDS)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO failures (fingerprint, attempts, retry_at) VALUES (?, ?, ?)",
+                (fingerprint, attempts, retry_at),
+            )
+        return retry_at
+
+    def retry_due(self, fingerprint: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT retry_at FROM failures WHERE fingerprint = ?", (fingerprint,)).fetchone()
+        return row is None or row[0] <= time.time()
+
+    def set_user_fingerprint(self, user_id: str, fingerprint: str) -> bool:
+        """Records the user's current med set. Returns True if it differs from the last one seen."""
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO user_med_sets (user_id, fingerprint, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET fingerprint = excluded.fingerprint, updated_at = excluded.updated_at "
+                "WHERE user_med_sets.fingerprint != excluded.fingerprint",
+                (user_id, fingerprint, time.time()),
+            )
+        return cursor.rowcount > 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _storable(report: dict, from_model: bool) -> bool:
+    """Only model answers with an explicit risk level are stored; fallbacks are recomputed later."""
+    return from_model and (report or {}).get("risk_level") in RISK_SEVERITY
+
+
+class MedReportService:
+    """
+    Precomputes the interaction report whenever a user's medication set changes,
+    so chat can cite known risks and /api/analyze answers an unchanged list
+    without a model call. Only model-backed reports are stored; a set whose
+    precompute fails is retried with exponential backoff.
+    """
+
+    def __init__(self, path: str = MED_REPORTS_DB_PATH):
+        self.path = path
+        self._store = None
+        self._lock = threading.Lock()
+        self._inflight = set()
+        self._executor = None
+
+    def _db(self) -> MedReportStore:
+        if self._store is None:
+            with self._lock:
+                if self._store is None:
+                    self._store = MedReportStore(self.path)
+        return self._store
+
+    def cached(self, medication_list: list):
+        """The stored report for this med set, or None."""
+        meds = med_set_key(medication_list)
+        if len(meds) < 2:
+            return None
+        report = self._db().get_report(med_set_fingerprint(meds), MED_REPORT_TTL_SECONDS)
+        record_cache("interaction_reports", report is not None)
+        return report
+
+    async def analyze(self, medication_list: list) -> dict:
+        """/api/analyze path: stored report if the set is known, else a fresh analysis (stored when model-backed)."""
+        report = self.cached(medication_list)
+        if report is not None:
+            return report
+        report, from_model = await analyze_medications(medication_list)
+        meds = med_set_key(medication_list)
+        if _storable(report, from_model) and len(meds) >= 2:
+            self._db().put_report(med_set_fingerprint(meds), meds, report)
+        return report
+
+    def observe(self, user_id: str, medication_list: list):
+        """
+        Called with the meds a user sends to chat. Returns the stored report for
+        the set (None while it is still being computed). A missing report is
+        computed in the background when the user's set just changed, or else
+        once the set's failure backoff (if any) has passed, so a failing model
+        isn't called again on every chat.
+        """
+        meds = med_set_key(medication_list)
+        if len(meds) < 2:
+            return None
+        fingerprint = med_set_fingerprint(meds)
+        store = self._db()
+        with stage("med_reports", "lookup"):
+            changed = store.set_user_fingerprint(user_id, fingerprint)
+            report = store.get_report(fingerprint, MED_REPORT_TTL_SECONDS)
+        record_cache("interaction_reports", report is not None)
+        if report is None:
+            if changed:
+                print(f"DEBUG: Medication set changed for {user_id}, precomputing interaction report")
+                self._submit(fingerprint, meds)
+            elif store.retry_due(fingerprint):
+                self._submit(fingerprint, meds)
+        return report
+
+    def _submit(self, fingerprint: str, meds: tuple):
+        with self._lock:
+            if fingerprint in self._inflight:
+                return
+            self._inflight.add(fingerprint)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=MED_REPORT_WORKERS, thread_name_prefix="med-reports")
+            self._executor.submit(self._compute, fingerprint, meds)
+
+    def _compute(self, fingerprint: str, meds: tuple):
+        try:
+            # The model SDK call is blocking, so this runs on its own thread and event loop
+            with stage("med_reports", "precompute"):
+                report, from_model = asyncio.run(analyze_medications(list(meds)))
+            if _storable(report, from_model):
+                self._db().put_report(fingerprint, meds, report)
+            else:
+                self._db().record_failure(fingerprint)
+        except Exception as e:
+            print(f"DEBUG: Interaction precompute failed: {str(e)}")
+            self._db().record_failure(fingerprint)
+        finally:
+            with self._lock:
+                self._inflight.discard(fingerprint)
+
+    def stop(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def format_known_risks(report: dict, limit: int = MAX_PROMPT_RISKS) -> str:
+    """Prompt lines for the non-trivial interactions in a report ("" if there are none)."""
+    details = [d for d in (report or {}).get("details", []) if d.get("risk_level") not in ("NONE", "LOW")]
+    return "\n".join(f"- {d['risk_level']}: {d.get('simple_explanation') or d.get('clinical_info')}" for d in details[:limit])
+
+
+med_reports = MedReportService()
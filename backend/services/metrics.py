@@ -0,0 +1,214 @@
+import os
+import time
+import bisect
+import asyncio
+import threading
+from functools import wraps
+from contextlib import contextmanager
+
+# Set METRICS_ENABLED=false to turn every recording call into a no-op
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+
+# Bucket bounds (seconds) cover Firestore writes (~10ms) up to slow model calls (~30s)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram. observe() is a bisect plus three adds under a lock."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class MetricsRegistry:
+    """Holds every histogram and counter exposed at /metrics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_histograms = {}   # (operation, stage) -> Histogram
+        self.stage_errors = {}       # (operation, stage) -> int
+        self.request_histograms = {} # (method, route, status) -> Histogram
+        self.cache_counters = {}     # cache name -> [hits, misses]
+
+    def _histogram(self, table: dict, key: tuple) -> Histogram:
+        hist = table.get(key)
+        if hist is None:
+            with self._lock:
+                hist = table.setdefault(key, Histogram())
+        return hist
+
+    def record_stage(self, operation: str, stage: str, seconds: float, error: bool = False):
+        self._histogram(self.stage_histograms, (operation, stage)).observe(seconds)
+        if error:
+            with self._lock:
+                self.stage_errors[(operation, stage)] = self.stage_errors.get((operation, stage), 0) + 1
+
+    def record_request(self, method: str, route: str, status: int, seconds: float):
+        self._histogram(self.request_histograms, (method, route, str(status))).observe(seconds)
+
+    def record_cache(self, cache: str, hit: bool):
+        with self._lock:
+            counter = self.cache_counters.setdefault(cache, [0, 0])
+            counter[0 if hit else 1] += 1
+
+    def reset(self):
+        with self._lock:
+            self.stage_histograms.clear()
+            self.stage_errors.clear()
+            self.request_histograms.clear()
+            self.cache_counters.clear()
+
+    # --- PROMETHEUS TEXT FORMAT ---
+
+    def render(self) -> str:
+        # Worker threads add keys while we format; copy every table under the lock first
+        with self._lock:
+            stage_histograms = list(self.stage_histograms.items())
+            stage_errors = list(self.stage_errors.items())
+            request_histograms = list(self.request_histograms.items())
+            cache_counters = [(cache, tuple(counter)) for cache, counter in self.cache_counters.items()]
+
+        lines = []
+        self._render_histograms(
+            lines,
+            "medibuddy_stage_duration_seconds",
+            "Time spent in each stage of a service call.",
+            ("operation", "stage"),
+            stage_histograms,
+        )
+
+        lines.append("# HELP medibuddy_stage_errors_total Stages that raised an exception.")
+        lines.append("# TYPE medibuddy_stage_errors_total counter")
+        for (operation, stage), count in sorted(stage_errors):
+            lines.append(f'medibuddy_stage_errors_total{{operation="{operation}",stage="{stage}"}} {count}')
+
+        self._render_histograms(
+            lines,
+            "medibuddy_http_request_duration_seconds",
+            "End-to-end HTTP request latency per route.",
+            ("method", "route", "status"),
+            request_histograms,
+        )
+
+        lines.append("# HELP medibuddy_cache_requests_total Cache lookups by result.")
+        lines.append("# TYPE medibuddy_cache_requests_total counter")
+        ratios = []
+        for cache, (hits, misses) in sorted(cache_counters):
+            lines.append(f'medibuddy_cache_requests_total{{cache="{cache}",result="hit"}} {hits}')
+            lines.append(f'medibuddy_cache_requests_total{{cache="{cache}",result="miss"}} {misses}')
+            total = hits + misses
+            ratios.append(f'medibuddy_cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0.0}')
+        lines.append("# HELP medibuddy_cache_hit_ratio Fraction of cache lookups that were hits.")
+        lines.append("# TYPE medibuddy_cache_hit_ratio gauge")
+        lines.extend(ratios)
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines: list, name: str, help_text: str, label_names: tuple, table: list):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, hist in sorted(table, key=lambda item: item[0]):
+            labels = ",".join(f'{label}="{value}"' for label, value in zip(label_names, key))
+            counts, total_sum, total_count = hist.snapshot()
+            cumulative = 0
+            for bound, count in zip(hist.buckets, counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {total_count}')
+            lines.append(f"{name}_sum{{{labels}}} {total_sum}")
+            lines.append(f"{name}_count{{{labels}}} {total_count}")
+
+
+registry = MetricsRegistry()
+
+
+# --- RECORDING HELPERS ---
+
+@contextmanager
+def stage(operation: str, name: str):
+    """Times the enclosed block as one stage of `operation`."""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        registry.record_stage(operation, name, time.perf_counter() - start, error=True)
+        raise
+    registry.record_stage(operation, name, time.perf_counter() - start)
+
+
+def timed(operation: str, name: str = None):
+    """Decorator form of stage(); works on both sync and async functions."""
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(operation, stage_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(operation, stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_cache(cache: str, hit: bool):
+    if METRICS_ENABLED:
+        registry.record_cache(cache, hit)
+
+
+def render_prometheus() -> str:
+    return registry.render()
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware recording request latency per route template.
+    Unmatched paths (404s, static files) share one label to keep cardinality bounded.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_holder = {"status": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status_holder["status"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            registry.record_request(scope["method"], route_path, status_holder["status"], time.perf_counter() - start)
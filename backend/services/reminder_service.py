@@ -0,0 +1,418 @@
+import os
+import time
+import uuid
+import smtplib
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from email.message import EmailMessage
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+
+import orjson
+from dotenv import load_dotenv
+
+from services.metrics import stage
+from services.process import pid_alive
+from services.state_store import STATE_BACKEND
+from services.timing_wheel import TimingWheel
+
+load_dotenv()
+
+# --- CONFIG ---
+REMINDERS_ENABLED = os.getenv("REMINDERS_ENABLED", "1") != "0"
+# Host-local SQLite: the scheduler is single-host. Every worker on one host shares
+# this file, but with STATE_BACKEND=redis across hosts a booking's reminders live
+# only on the host that took it, and a cancel served by another host misses them.
+REMINDERS_DB_PATH = os.getenv("REMINDERS_DB_PATH", os.path.join("data", "reminders.db"))
+REMINDER_OFFSETS_MINUTES = [int(m) for m in os.getenv("REMINDER_OFFSETS_MINUTES", "1440,60").split(",") if m.strip()]
+# Appointment date/time are wall-clock values in the clinic's zone (same zone as the calendar events)
+REMINDER_TIMEZONE = ZoneInfo(os.getenv("REMINDER_TIMEZONE", "Asia/Kolkata"))
+# Only reminders due within this window are held in memory; the rest wait in SQLite
+REMINDER_LOAD_WINDOW = float(os.getenv("REMINDER_LOAD_WINDOW_HOURS", "6")) * 3600
+# Reminders missed while the server was down still go out if they are at most this late
+REMINDER_GRACE_SECONDS = float(os.getenv("REMINDER_GRACE_SECONDS", "3600"))
+REMINDER_BATCH_SIZE = int(os.getenv("REMINDER_BATCH_SIZE", "100"))
+REMINDER_MAX_ATTEMPTS = int(os.getenv("REMINDER_MAX_ATTEMPTS", "3"))
+REMINDER_RETRY_SECONDS = float(os.getenv("REMINDER_RETRY_SECONDS", "300"))
+REMINDER_SENDER_THREADS = int(os.getenv("REMINDER_SENDER_THREADS", "2"))
+# A send still marked 'sending' this long is assumed stuck even if its worker lives
+REMINDER_STALE_SEND_SECONDS = float(os.getenv("REMINDER_STALE_SEND_SECONDS", "600"))
+
+# pending -> sending -> sent | failed; pending -> cancelled | expired
+
+
+class ReminderStore:
+    """SQLite table of reminders indexed by due time, so startup loads only the upcoming window."""
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                id TEXT PRIMARY KEY,
+                appointment_id INTEGER NOT NULL,
+                channel TEXT NOT NULL,
+                recipient TEXT NOT NULL,
+                due_at REAL NOT NULL,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                payload BLOB NOT NULL,
+                updated_at REAL NOT NULL,
+                worker_pid INTEGER
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reminders_due ON reminders(status, due_at)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS reminders_appointment ON reminders(appointment_id)")
+
+    @staticmethod
+    def _row(row) -> dict:
+        reminder = dict(row)
+        reminder["payload"] = orjson.loads(reminder["payload"])
+        return reminder
+
+    def add_many(self, reminders: list):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO reminders (id, appointment_id, channel, recipient, due_at, status, payload, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)",
+                [(r["id"], r["appointment_id"], r["channel"], r["recipient"], r["due_at"],
+                  orjson.dumps(r["payload"]), now) for r in reminders],
+            )
+
+    def cancel_appointment(self, appointment_id: int) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "UPDATE reminders SET status = 'cancelled', updated_at = ? "
+                "WHERE appointment_id = ? AND status = 'pending' RETURNING id",
+                (time.time(), appointment_id),
+            ).fetchall()
+        return [row["id"] for row in rows]
+
+    def due_between(self, start: float, end: float) -> list:
+        """(id, due_at) of pending reminders with start < due_at <= end, straight off the due-time index."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, due_at FROM reminders WHERE status = 'pending' AND due_at > ? AND due_at <= ?",
+                (start, end),
+            ).fetchall()
+        return [(row["id"], row["due_at"]) for row in rows]
+
+    def claim(self, ids: list, pid: int) -> list:
+        """Moves pending reminders to 'sending'. Conditional, so only one worker process sends each."""
+        claimed = []
+        with self._lock:
+            for offset in range(0, len(ids), 500):
+                chunk = ids[offset:offset + 500]
+                marks = ", ".join("?" for _ in chunk)
+                rows = self._conn.execute(
+                    f"UPDATE reminders SET status = 'sending', worker_pid = ?, updated_at = ? "
+                    f"WHERE id IN ({marks}) AND status = 'pending' RETURNING *",
+                    (pid, time.time(), *chunk),
+                ).fetchall()
+                claimed.extend(self._row(row) for row in rows)
+        return claimed
+
+    def finish(self, ids: list, status: str):
+        with self._lock:
+            self._conn.executemany(
+                "UPDATE reminders SET status = ?, updated_at = ? WHERE id = ?",
+                [(status, time.time(), reminder_id) for reminder_id in ids],
+            )
+
+    def retry(self, reminder_id: str, due_at: float, attempts: int):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE reminders SET status = 'pending', due_at = ?, attempts = ?, updated_at = ? WHERE id = ?",
+                (due_at, attempts, time.time(), reminder_id),
+            )
+
+    def recover(self, now: float, pid: int):
+        """
+        Startup housekeeping: requeue sends interrupted by a dead worker, then
+        expire reminders missed beyond the grace period. Called before this
+        process has claimed anything, so rows stamped with `pid` itself come
+        from an earlier process that had the same PID and are requeued too.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, worker_pid, updated_at FROM reminders WHERE status = 'sending'"
+            ).fetchall()
+            for row in rows:
+                owner = row["worker_pid"]
+                stale = row["updated_at"] < now - REMINDER_STALE_SEND_SECONDS
+                if owner is not None and owner != pid and pid_alive(owner) and not stale:
+                    continue
+                # Conditional so two restarting workers don't both requeue (and later send) it
+                self._conn.execute(
+                    "UPDATE reminders SET status = 'pending', worker_pid = NULL, updated_at = ? "
+                    "WHERE id = ? AND status = 'sending' AND worker_pid IS ?",
+                    (now, row["id"], owner),
+                )
+            self._conn.execute(
+                "UPDATE reminders SET status = 'expired', updated_at = ? WHERE status = 'pending' AND due_at <= ?",
+                (now, now - REMINDER_GRACE_SECONDS),
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# --- SENDERS ---
+
+def format_reminder(reminder: dict) -> tuple:
+    """(subject, body) for a reminder."""
+    p = reminder["payload"]
+    subject = f"Reminder: appointment with {p.get('doctorName')} on {p.get('date')} at {p.get('time')}"
+    body = (
+        f"Hi {p.get('patientName')},\n\n"
+        f"This is a reminder of your appointment with {p.get('doctorName')} "
+        f"on {p.get('date')} at {p.get('time')}"
+        + (f" ({p.get('location')})" if p.get("location") else "") + ".\n\n— MediBuddy"
+    )
+    return subject, body
+
+
+class ReminderSender(ABC):
+    """Delivers a batch of reminders for one channel. send_batch() returns the ids that were delivered."""
+
+    channel = None
+
+    @abstractmethod
+    def send_batch(self, reminders: list) -> list:
+        ...
+
+
+class LogSender(ReminderSender):
+    """Prints reminders instead of sending them (development, or channels without a provider yet)."""
+
+    def __init__(self, channel: str):
+        self.channel = channel
+
+    def send_batch(self, reminders: list) -> list:
+        for reminder in reminders:
+            subject, _ = format_reminder(reminder)
+            print(f"REMINDER [{self.channel}] to {reminder['recipient']}: {subject}")
+        return [reminder["id"] for reminder in reminders]
+
+
+class SMTPSender(ReminderSender):
+    """Sends a whole batch over one SMTP connection (STARTTLS + login once)."""
+
+    channel = "email"
+
+    def __init__(self, server: str, port: int, sender: str, password: str):
+        self.server = server
+        self.port = port
+        self.sender = sender
+        self.password = password
+
+    def send_batch(self, reminders: list) -> list:
+        delivered = []
+        with smtplib.SMTP(self.server, self.port, timeout=30) as smtp:
+            smtp.starttls()
+            smtp.login(self.sender, self.password)
+            for reminder in reminders:
+                subject, body = format_reminder(reminder)
+                message = EmailMessage()
+                message["From"] = self.sender
+                message["To"] = reminder["recipient"]
+                message["Subject"] = subject
+                message.set_content(body)
+                try:
+                    smtp.send_message(message)
+                    delivered.append(reminder["id"])
+                except smtplib.SMTPException as e:
+                    print(f"DEBUG: Reminder email to {reminder['recipient']} failed: {str(e)}")
+        return delivered
+
+
+def default_senders() -> dict:
+    senders = {"whatsapp": LogSender("whatsapp")}
+    if os.getenv("SENDER_EMAIL") and os.getenv("SENDER_PASSWORD"):
+        senders["email"] = SMTPSender(
+            os.getenv("SMTP_SERVER", "smtp.gmail.com"), int(os.getenv("SMTP_PORT", "587")),
+            os.getenv("SENDER_EMAIL"), os.getenv("SENDER_PASSWORD"),
+        )
+    else:
+        senders["email"] = LogSender("email")
+    return senders
+
+
+# --- SCHEDULER ---
+
+def appointment_start(appointment: dict) -> float:
+    local = datetime.strptime(f"{appointment['date']} {appointment['time']}", "%Y-%m-%d %H:%M")
+    return local.replace(tzinfo=REMINDER_TIMEZONE).timestamp()
+
+
+class ReminderScheduler:
+    """
+    Appointment reminders on a hierarchical timing wheel.
+
+    Every reminder is persisted first; the wheel only holds those due within
+    REMINDER_LOAD_WINDOW and is topped up from the due-time index as time
+    passes, so startup never rescans bookings. A 1s ticker collects due
+    reminders, claims them in SQLite (safe with several workers) and hands them
+    to the channel's sender in batches on a small thread pool.
+
+    Single-host only: the reminder table is a local file, not part of the
+    shared state store (see REMINDERS_DB_PATH).
+    """
+
+    def __init__(self, path: str = REMINDERS_DB_PATH, senders: dict = None):
+        self.path = path
+        self.senders = senders or default_senders()
+        self._lock = threading.Lock()
+        self._store = None
+        self._wheel = None
+        self._loaded_until = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+
+    def register_sender(self, sender: ReminderSender):
+        self.senders[sender.channel] = sender
+
+    def start(self):
+        if not REMINDERS_ENABLED or self._thread:
+            return
+        if STATE_BACKEND != "sqlite":
+            print(f"WARNING: Reminders are kept per host in {self.path}; with STATE_BACKEND={STATE_BACKEND} "
+                  "a cancellation served by another host won't stop them")
+        now = time.time()
+        self._store = ReminderStore(self.path)
+        self._store.recover(now, os.getpid())
+        self._stop.clear()
+        self._executor = ThreadPoolExecutor(max_workers=REMINDER_SENDER_THREADS, thread_name_prefix="reminders")
+        with self._lock:
+            self._wheel = TimingWheel(now)
+            self._loaded_until = now - REMINDER_GRACE_SECONDS
+        self._dispatch(self._load_window(now))
+        self._thread = threading.Thread(target=self._run, name="reminder-scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self._thread:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self._executor.shutdown(wait=True)
+        self._store.close()
+        self._store = None
+
+    def _load_window(self, now: float) -> list:
+        """Pulls reminders entering the in-memory window into the wheel. Returns ids already due."""
+        until = now + REMINDER_LOAD_WINDOW
+        fired = []
+        # Held across the read so a booking saved meanwhile is either in `rows` or sees the new watermark
+        with self._lock:
+            with stage("reminders", "load_window"):
+                rows = self._store.due_between(self._loaded_until, until)
+            for reminder_id, due_at in rows:
+                fired += self._wheel.schedule(reminder_id, due_at, reminder_id)
+            self._loaded_until = until
+        return fired
+
+    def schedule_appointment(self, appointment: dict) -> int:
+        """Persists one reminder per offset and channel for a new booking. Returns how many were scheduled."""
+        if not self._store:
+            return 0
+        try:
+            start = appointment_start(appointment)
+        except (KeyError, TypeError, ValueError) as e:
+            # The booking is already saved; it just gets no reminders
+            print(f"DEBUG: No reminders for appointment {appointment.get('id')}: {str(e)}")
+            return 0
+        now = time.time()
+        recipients = {"email": appointment.get("patientEmail"), "whatsapp": appointment.get("whatsapp")}
+        payload = {k: appointment.get(k) for k in ("doctorName", "patientName", "date", "time", "location")}
+        reminders = [
+            {"id": uuid.uuid4().hex, "appointment_id": appointment["id"], "channel": channel,
+             "recipient": recipient, "due_at": start - minutes * 60, "payload": payload}
+            for minutes in REMINDER_OFFSETS_MINUTES
+            for channel, recipient in recipients.items()
+            if recipient and start - minutes * 60 > now
+        ]
+        if not reminders:
+            return 0
+        self._store.add_many(reminders)
+
+        fired = []
+        with self._lock:
+            for reminder in reminders:
+                if reminder["due_at"] <= self._loaded_until:
+                    fired += self._wheel.schedule(reminder["id"], reminder["due_at"], reminder["id"])
+        self._dispatch(fired)
+        return len(reminders)
+
+    def cancel_appointment(self, appointment_id: int) -> int:
+        """Cancels every pending reminder of a booking. Returns how many were cancelled."""
+        if not self._store:
+            return 0
+        ids = self._store.cancel_appointment(appointment_id)
+        with self._lock:
+            for reminder_id in ids:
+                self._wheel.cancel(reminder_id)
+        return len(ids)
+
+    def _run(self):
+        while not self._stop.wait(self._wheel.tick):
+            now = time.time()
+            try:
+                with self._lock:
+                    fired = self._wheel.advance(now)
+                if now + REMINDER_LOAD_WINDOW / 2 > self._loaded_until:
+                    fired += self._load_window(now)
+                self._dispatch(fired)
+            except Exception as e:
+                print(f"DEBUG: Reminder scheduler error: {str(e)}")
+
+    def _dispatch(self, ids: list):
+        if not ids:
+            return
+        claimed = self._store.claim(ids, os.getpid())
+        by_channel = {}
+        for reminder in claimed:
+            by_channel.setdefault(reminder["channel"], []).append(reminder)
+        for channel, reminders in by_channel.items():
+            for offset in range(0, len(reminders), REMINDER_BATCH_SIZE):
+                self._executor.submit(self._send, channel, reminders[offset:offset + REMINDER_BATCH_SIZE])
+
+    def _send(self, channel: str, reminders: list):
+        sender = self.senders.get(channel)
+        delivered = []
+        try:
+            if sender is None:
+                raise RuntimeError(f"No sender registered for channel '{channel}'")
+            with stage("reminders", f"send_{channel}"):
+                delivered = sender.send_batch(reminders)
+        except Exception as e:
+            print(f"DEBUG: Reminder batch on {channel} failed: {str(e)}")
+
+        self._store.finish(delivered, "sent")
+        delivered = set(delivered)
+        failed = []
+        for reminder in reminders:
+            if reminder["id"] in delivered:
+                continue
+            attempts = reminder["attempts"] + 1
+            if attempts >= REMINDER_MAX_ATTEMPTS:
+                failed.append(reminder["id"])
+                continue
+            due_at = time.time() + REMINDER_RETRY_SECONDS
+            self._store.retry(reminder["id"], due_at, attempts)
+            with self._lock:
+                if due_at <= self._loaded_until:
+                    self._wheel.schedule(reminder["id"], due_at, reminder["id"])
+        self._store.finish(failed, "failed")
+
+
+reminder_scheduler = ReminderScheduler()
@@ -0,0 +1,61 @@
+from typing import List, Literal
+from pydantic import BaseModel, Field, field_validator
+
+# Schemas for what the LLMs are asked to return. Validated by
+# json_repair.parse_model_output() and reused as API response models.
+
+# Same levels as interaction_service.RISK_LEVELS
+RiskLevel = Literal["HIGH", "MODERATE", "LOW", "NONE"]
+
+# Other words models use for a level
+_RISK_SYNONYMS = {
+    "CRITICAL": "HIGH", "SEVERE": "HIGH", "MAJOR": "HIGH", "CONTRAINDICATED": "HIGH", "DANGEROUS": "HIGH",
+    "MEDIUM": "MODERATE", "MODERATE": "MODERATE", "SIGNIFICANT": "MODERATE",
+    "MINOR": "LOW", "MILD": "LOW", "MINIMAL": "LOW",
+    "NO": "NONE", "NO INTERACTION": "NONE", "NONE KNOWN": "NONE", "NEGLIGIBLE": "NONE",
+}
+
+
+def normalize_risk_level(value):
+    """Maps a model's risk word onto RiskLevel. Returns None if it isn't recognized."""
+    if not isinstance(value, str):
+        return None
+    level = " ".join(value.replace("_", " ").split()).upper()
+    if level in ("HIGH", "MODERATE", "LOW", "NONE"):
+        return level
+    return _RISK_SYNONYMS.get(level)
+
+
+def _risk_level(value):
+    level = normalize_risk_level(value)
+    if level is None:
+        # Dropping the answer would fall back to the offline table, which can
+        # only under-report; an unrecognized level is treated as the worst case
+        print(f"DEBUG: Unrecognized risk level {value!r}, treating as HIGH")
+        return "HIGH"
+    return level
+
+
+# risk_level has no default on purpose: a reply without one (or cut off before
+# it) must fail validation and fall back, not read as a LOW-risk answer
+
+class InteractionDetail(BaseModel):
+    risk_level: RiskLevel
+    clinical_info: str = ""
+    simple_explanation: str = ""
+
+    _normalize_level = field_validator("risk_level", mode="before")(_risk_level)
+
+
+class DrugAnalysis(BaseModel):
+    """Shape requested from Gemini in get_drug_analysis()."""
+    risk_level: RiskLevel
+    interaction_count: int = Field(0, ge=0)
+    details: List[InteractionDetail] = []
+
+    _normalize_level = field_validator("risk_level", mode="before")(_risk_level)
+
+
+class ChatReply(BaseModel):
+    """Shape requested from Gemini in get_chat_response()."""
+    response_text: str
@@ -0,0 +1,9 @@
+import orjson
+
+ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def dumps(content) -> bytes:
+    """orjson with the options every caller needs (numpy values, non-string keys)."""
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
@@ -0,0 +1,340 @@
+import os
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+import orjson
+
+# Doctors and appointments live here instead of module-level lists, so every
+# uvicorn/gunicorn worker sees the same records and ids never collide.
+# Backends: "sqlite" (default, one WAL file shared by all local workers) or
+# "redis" (needs the redis package and REDIS_URL, for multi-host deployments).
+
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite")
+STATE_DB_PATH = os.getenv("STATE_DB_PATH", os.path.join("data", "state.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_REDIS_PREFIX = os.getenv("STATE_REDIS_PREFIX", "medibuddy")
+# Per-worker cache of decoded per-owner lists (e.g. appointments by user)
+OWNER_CACHE_SIZE = int(os.getenv("STATE_OWNER_CACHE_SIZE", "1024"))
+
+
+class StateStore(ABC):
+    """
+    Shared record store with atomic id allocation.
+
+    Every write bumps a per-collection version (and a per-owner version when
+    the record has an owner) in the backend. Reads are served from this
+    worker's cache while the version is unchanged, so a write made by any
+    worker is visible to the next read on every other worker. The versions
+    also back the ETags of the read endpoints (see http_cache).
+    """
+
+    def __init__(self):
+        self._cache_lock = threading.Lock()
+        self._all_cache = {}  # collection -> (version, rows)
+        self._owner_cache = OrderedDict()  # (collection, owner) -> (version, rows)
+
+    # --- backend primitives ---
+
+    @abstractmethod
+    def next_id(self, collection: str) -> int:
+        ...
+
+    @abstractmethod
+    def version(self, collection: str) -> int:
+        ...
+
+    @abstractmethod
+    def owner_version(self, collection: str, owner: str) -> int:
+        ...
+
+    @property
+    @abstractmethod
+    def epoch(self) -> str:
+        """Random id of this store's data; versions only compare within one epoch."""
+        ...
+
+    @abstractmethod
+    def _put(self, collection: str, record: dict, owner: str = None):
+        ...
+
+    @abstractmethod
+    def _delete(self, collection: str, record_id: int) -> bool:
+        ...
+
+    @abstractmethod
+    def _load_all(self, collection: str) -> list:
+        ...
+
+    @abstractmethod
+    def _load_owner(self, collection: str, owner: str) -> list:
+        ...
+
+    @abstractmethod
+    def _load_one(self, collection: str, record_id: int):
+        ...
+
+    def close(self):
+        pass
+
+    # --- public API ---
+
+    def add(self, collection: str, record: dict, owner: str = None) -> dict:
+        """Stores `record`, allocating record["id"] first if it has none. Returns the record."""
+        if record.get("id") is None:
+            record["id"] = self.next_id(collection)
+        self._put(collection, record, owner)
+        return record
+
+    def delete(self, collection: str, record_id: int) -> bool:
+        return self._delete(collection, record_id)
+
+    def get(self, collection: str, record_id: int):
+        return self._load_one(collection, record_id)
+
+    def all(self, collection: str) -> list:
+        """Every record in `collection` by id. The list is shared with the cache, don't mutate it."""
+        version = self.version(collection)
+        cached = self._all_cache.get(collection)
+        if cached and cached[0] == version:
+            return cached[1]
+        rows = self._load_all(collection)
+        with self._cache_lock:
+            self._all_cache[collection] = (version, rows)
+        return rows
+
+    def by_owner(self, collection: str, owner: str) -> list:
+        """Records stored with this owner, by id. Shared with the cache, don't mutate it."""
+        version = self.owner_version(collection, owner)
+        key = (collection, owner)
+        with self._cache_lock:
+            cached = self._owner_cache.get(key)
+            if cached and cached[0] == version:
+                self._owner_cache.move_to_end(key)
+                return cached[1]
+        rows = self._load_owner(collection, owner)
+        with self._cache_lock:
+            self._owner_cache[key] = (version, rows)
+            self._owner_cache.move_to_end(key)
+            while len(self._owner_cache) > OWNER_CACHE_SIZE:
+                self._owner_cache.popitem(last=False)
+        return rows
+
+
+class SQLiteStateStore(StateStore):
+    """All workers on one host share a WAL-mode SQLite file; ids come from a counter row updated under BEGIN IMMEDIATE."""
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        super().__init__()
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _db(self):
+        # Connections must not cross a fork (gunicorn preload), reopen per process
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS collections (
+                    name TEXT PRIMARY KEY,
+                    next_id INTEGER NOT NULL DEFAULT 0,
+                    version INTEGER NOT NULL DEFAULT 0
+                );
+                CREATE TABLE IF NOT EXISTS records (
+                    collection TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    owner TEXT,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (collection, id)
+                );
+                CREATE INDEX IF NOT EXISTS records_owner ON records (collection, owner);
+                CREATE TABLE IF NOT EXISTS owner_versions (
+                    collection TEXT NOT NULL,
+                    owner TEXT NOT NULL,
+                    version INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (collection, owner)
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+            """)
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex[:12],))
+            self._epoch = conn.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+            self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+    def _write(self, statements):
+        """Runs (sql, params) pairs in one IMMEDIATE transaction; returns the last statement's rows."""
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for sql, params in statements:
+                    cursor = db.execute(sql, params)
+                    result = cursor.fetchall()
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+        return result
+
+    def next_id(self, collection: str) -> int:
+        rows = self._write([
+            ("INSERT OR IGNORE INTO collections (name) VALUES (?)", (collection,)),
+            ("UPDATE collections SET next_id = next_id + 1 WHERE name = ? RETURNING next_id", (collection,)),
+        ])
+        return rows[0][0]
+
+    def version(self, collection: str) -> int:
+        with self._lock:
+            row = self._db().execute("SELECT version FROM collections WHERE name = ?", (collection,)).fetchone()
+        return row[0] if row else 0
+
+    def owner_version(self, collection: str, owner: str) -> int:
+        with self._lock:
+            row = self._db().execute(
+                "SELECT version FROM owner_versions WHERE collection = ? AND owner = ?", (collection, owner)
+            ).fetchone()
+        return row[0] if row else 0
+
+    @property
+    def epoch(self) -> str:
+        with self._lock:
+            self._db()
+        return self._epoch
+
+    def _put(self, collection: str, record: dict, owner: str = None):
+        statements = [
+            ("INSERT OR IGNORE INTO collections (name) VALUES (?)", (collection,)),
+            ("INSERT OR REPLACE INTO records (collection, id, owner, data) VALUES (?, ?, ?, ?)",
+             (collection, record["id"], owner, orjson.dumps(record))),
+            ("UPDATE collections SET version = version + 1, next_id = MAX(next_id, ?) WHERE name = ?",
+             (record["id"], collection)),
+        ]
+        if owner is not None:
+            statements.append((
+                "INSERT INTO owner_versions (collection, owner, version) VALUES (?, ?, 1) "
+                "ON CONFLICT(collection, owner) DO UPDATE SET version = version + 1",
+                (collection, owner),
+            ))
+        self._write(statements)
+
+    def _delete(self, collection: str, record_id: int) -> bool:
+        # changes() is the DELETE's row count, so the version only moves when something was removed
+        rows = self._write([
+            ("UPDATE owner_versions SET version = version + 1 WHERE collection = ? "
+             "AND owner = (SELECT owner FROM records WHERE collection = ? AND id = ?)",
+             (collection, collection, record_id)),
+            ("DELETE FROM records WHERE collection = ? AND id = ?", (collection, record_id)),
+            ("UPDATE collections SET version = version + 1 WHERE name = ? AND changes() > 0 RETURNING version",
+             (collection,)),
+        ])
+        return bool(rows)
+
+    def _select(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            rows = self._db().execute(sql, params).fetchall()
+        return [orjson.loads(row[0]) for row in rows]
+
+    def _load_all(self, collection: str) -> list:
+        return self._select("SELECT data FROM records WHERE collection = ? ORDER BY id", (collection,))
+
+    def _load_owner(self, collection: str, owner: str) -> list:
+        return self._select(
+            "SELECT data FROM records WHERE collection = ? AND owner = ? ORDER BY id", (collection, owner)
+        )
+
+    def _load_one(self, collection: str, record_id: int):
+        rows = self._select("SELECT data FROM records WHERE collection = ? AND id = ?", (collection, record_id))
+        return rows[0] if rows else None
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class RedisStateStore(StateStore):
+    """Redis-compatible backend for workers spread over several hosts (INCR ids, MULTI writes)."""
+
+    def __init__(self, url: str = REDIS_URL, prefix: str = STATE_REDIS_PREFIX):
+        super().__init__()
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("STATE_BACKEND=redis needs the 'redis' package (pip install redis)") from e
+        self._redis = redis.Redis.from_url(url)
+        self._prefix = prefix
+        self._redis.setnx(f"{prefix}:epoch", uuid.uuid4().hex[:12])
+        self._epoch = self._redis.get(f"{prefix}:epoch").decode()
+
+    def _key(self, collection: str, *parts) -> str:
+        return ":".join((self._prefix, collection) + parts)
+
+    def next_id(self, collection: str) -> int:
+        return int(self._redis.incr(self._key(collection, "next_id")))
+
+    def version(self, collection: str) -> int:
+        return int(self._redis.get(self._key(collection, "version")) or 0)
+
+    def owner_version(self, collection: str, owner: str) -> int:
+        return int(self._redis.get(self._key(collection, "owner_version", owner)) or 0)
+
+    @property
+    def epoch(self) -> str:
+        return self._epoch
+
+    def _put(self, collection: str, record: dict, owner: str = None):
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hset(self._key(collection, "records"), record["id"], orjson.dumps(record))
+        if owner is not None:
+            pipe.hset(self._key(collection, "owners"), record["id"], owner)
+            pipe.sadd(self._key(collection, "owner", owner), record["id"])
+            pipe.incr(self._key(collection, "owner_version", owner))
+        pipe.incr(self._key(collection, "version"))
+        pipe.execute()
+
+    def _delete(self, collection: str, record_id: int) -> bool:
+        owner = self._redis.hget(self._key(collection, "owners"), record_id)
+        pipe = self._redis.pipeline(transaction=True)
+        pipe.hdel(self._key(collection, "records"), record_id)
+        if owner is not None:
+            pipe.hdel(self._key(collection, "owners"), record_id)
+            pipe.srem(self._key(collection, "owner", owner.decode()), record_id)
+            pipe.incr(self._key(collection, "owner_version", owner.decode()))
+        removed = pipe.execute()[0]
+        if removed:
+            self._redis.incr(self._key(collection, "version"))
+        return bool(removed)
+
+    @staticmethod
+    def _decode(values) -> list:
+        rows = [orjson.loads(v) for v in values if v is not None]
+        return sorted(rows, key=lambda r: r["id"])
+
+    def _load_all(self, collection: str) -> list:
+        return self._decode(self._redis.hvals(self._key(collection, "records")))
+
+    def _load_owner(self, collection: str, owner: str) -> list:
+        ids = list(self._redis.smembers(self._key(collection, "owner", owner)))
+        return self._decode(self._redis.hmget(self._key(collection, "records"), ids)) if ids else []
+
+    def _load_one(self, collection: str, record_id: int):
+        value = self._redis.hget(self._key(collection, "records"), record_id)
+        return orjson.loads(value) if value is not None else None
+
+    def close(self):
+        self._redis.close()
+
+
+def create_state_store() -> StateStore:
+    if STATE_BACKEND == "redis":
+        return RedisStateStore()
+    if STATE_BACKEND == "sqlite":
+        return SQLiteStateStore()
+    raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
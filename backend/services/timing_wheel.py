@@ -0,0 +1,99 @@
+import math
+
+# Seconds / minutes / hours / days; anything further out waits in an overflow
+# bucket that is re-examined once per top-level slot.
+DEFAULT_LEVELS = (60, 60, 24, 30)
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel (Varghese & Lauck). schedule() and cancel() are
+    O(1) dict operations; advance() does O(1) work per tick plus the timers
+    that cascade down a level or fire.
+
+    Each level has `size` slots that each cover the whole span of the level
+    below it. A timer sits in the lowest level whose range reaches it and is
+    moved down when the wheel's clock enters its slot.
+    """
+
+    def __init__(self, now: float, tick: float = 1.0, levels: tuple = DEFAULT_LEVELS):
+        self.tick = tick
+        self.levels = levels
+        self._spans = []  # ticks covered by one slot at each level
+        span = 1
+        for size in levels:
+            self._spans.append(span)
+            span *= size
+        self._current = math.floor(now / tick)
+        self._slots = [[{} for _ in range(size)] for size in levels]
+        self._overflow = {}
+        self._where = {}  # key -> the dict (slot or overflow) holding it
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def _place(self, key, due_tick: int, payload, fired: list):
+        if due_tick <= self._current:
+            fired.append(payload)
+            self._where.pop(key, None)
+            return
+        for level, size in enumerate(self.levels):
+            span = self._spans[level]
+            if due_tick // span - self._current // span < size:
+                bucket = self._slots[level][(due_tick // span) % size]
+                break
+        else:
+            bucket = self._overflow
+        bucket[key] = (due_tick, payload)
+        self._where[key] = bucket
+
+    def schedule(self, key, due: float, payload) -> list:
+        """
+        Adds (or moves) a timer. Returns [payload] if `due` is already past,
+        since the caller should fire it right away, else [].
+        """
+        self.cancel(key)
+        fired = []
+        self._place(key, math.ceil(due / self.tick), payload, fired)
+        return fired
+
+    def cancel(self, key) -> bool:
+        bucket = self._where.pop(key, None)
+        if bucket is None:
+            return False
+        del bucket[key]
+        return True
+
+    def advance(self, now: float) -> list:
+        """Moves the clock to `now` and returns the payloads of every timer that came due."""
+        target = math.floor(now / self.tick)
+        fired = []
+        while self._current < target:
+            self._current += 1
+            # Cascade from the top so timers can fall through several levels in one tick
+            top_span = self._spans[-1] * self.levels[-1]
+            if self._current % top_span == 0 and self._overflow:
+                pending, self._overflow = self._overflow, {}
+                for key, (due_tick, payload) in pending.items():
+                    self._place(key, due_tick, payload, fired)
+            for level in range(len(self.levels) - 1, 0, -1):
+                span = self._spans[level]
+                if self._current % span:
+                    continue
+                index = (self._current // span) % self.levels[level]
+                bucket = self._slots[level][index]
+                if bucket:
+                    self._slots[level][index] = {}
+                    for key, (due_tick, payload) in bucket.items():
+                        self._place(key, due_tick, payload, fired)
+            index = self._current % self.levels[0]
+            bucket = self._slots[0][index]
+            if bucket:
+                self._slots[0][index] = {}
+                for key, (_, payload) in bucket.items():
+                    self._where.pop(key, None)
+                    fired.append(payload)
+        return fired
@@ -0,0 +1,179 @@
+import io
+import os
+import json
+import mmap
+from fastapi import HTTPException, UploadFile
+from starlette.formparsers import MultiPartParser
+
+# --- LIMITS ---
+# Per-file caps, checked before anything is decoded
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_MB", "25")) * 1024 * 1024
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_MB", "10")) * 1024 * 1024
+# Whole multipart body cap, enforced while the body is still streaming in
+MAX_REQUEST_BYTES = MAX_IMAGE_BYTES + MAX_AUDIO_BYTES + 64 * 1024
+# Uploads above this size are served from disk through mmap instead of RAM
+SPOOL_THRESHOLD = int(os.getenv("UPLOAD_SPOOL_THRESHOLD_KB", "1024")) * 1024
+
+# Starlette's multipart parser streams each file part into a SpooledTemporaryFile;
+# align its in-memory cap with ours so big parts roll to disk as they arrive.
+MultiPartParser.spool_max_size = SPOOL_THRESHOLD
+
+
+def _is_image_type(content_type: str) -> bool:
+    return content_type.startswith("image/") or content_type == "application/pdf"
+
+
+def _is_audio_type(content_type: str) -> bool:
+    # MediaRecorder blobs sometimes come through as video/webm
+    return content_type.startswith("audio/") or content_type == "video/webm"
+
+
+UPLOAD_KINDS = {
+    "image": (_is_image_type, MAX_IMAGE_BYTES),
+    "audio": (_is_audio_type, MAX_AUDIO_BYTES),
+}
+
+
+class IngestedUpload:
+    """
+    A validated upload that stays where the multipart parser spooled it.
+    Small files are kept as bytes; large ones are mmap'd from the spool file,
+    so the PDF/image stages read them without another full copy in memory.
+    """
+
+    def __init__(self, fileobj, size: int, content_type: str, filename: str = None, owns_file: bool = False):
+        self.size = size
+        self.content_type = content_type
+        self.filename = filename
+        self._fileobj = fileobj
+        self._owns_file = owns_file
+        self._data = None
+        self._mmap = None
+
+        fileobj.seek(0)
+        if size > SPOOL_THRESHOLD:
+            if hasattr(fileobj, "rollover"):
+                fileobj.rollover()
+            self._mmap = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._data = fileobj.read()
+
+    @property
+    def on_disk(self) -> bool:
+        return self._mmap is not None
+
+    def getbuffer(self):
+        """Zero-copy view of the contents (bytes or a memoryview over the mmap)."""
+        return memoryview(self._mmap) if self._mmap is not None else self._data
+
+    def open(self):
+        """Seekable binary file positioned at the start, for readers that stream."""
+        if self._mmap is not None:
+            self._fileobj.seek(0)
+            return self._fileobj
+        return io.BytesIO(self._data)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A consumer still holds a view; the map is released when it is collected
+                pass
+            self._mmap = None
+        self._data = None
+        if self._owns_file:
+            self._fileobj.close()
+
+
+async def ingest_upload(upload: UploadFile, kind: str) -> IngestedUpload:
+    """
+    Validates content type and size of a multipart upload without reading it
+    into memory. Raises HTTPException(415/413) on bad input.
+    """
+    accepts, max_bytes = UPLOAD_KINDS[kind]
+    content_type = (upload.content_type or "").split(";")[0].strip().lower()
+    if not accepts(content_type):
+        raise HTTPException(status_code=415, detail=f"Unsupported {kind} type: {content_type or 'unknown'}")
+
+    size = upload.size
+    if size is None:
+        upload.file.seek(0, os.SEEK_END)
+        size = upload.file.tell()
+    if size == 0:
+        raise HTTPException(status_code=400, detail=f"Empty {kind} upload")
+    if size > max_bytes:
+        raise HTTPException(status_code=413, detail=f"{kind.capitalize()} exceeds {max_bytes // (1024 * 1024)}MB limit")
+
+    return IngestedUpload(upload.file, size, content_type, upload.filename)
+
+
+def as_buffer(data):
+    """Accepts raw bytes or an IngestedUpload and returns something pymupdf can open."""
+    return data.getbuffer() if isinstance(data, IngestedUpload) else data
+
+
+def as_file(data):
+    """Accepts raw bytes or an IngestedUpload and returns a readable binary file."""
+    return data.open() if isinstance(data, IngestedUpload) else io.BytesIO(data)
+
+
+class UploadLimitMiddleware:
+    """
+    Rejects oversized upload requests with 413 before the multipart parser
+    spools them: first on Content-Length, then by counting streamed bytes
+    for chunked bodies.
+    """
+
+    def __init__(self, app, paths: tuple = ("/api/diagnose",), max_bytes: int = MAX_REQUEST_BYTES):
+        self.app = app
+        self.paths = paths
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                await self._reject(send)
+                return
+
+        received = 0
+        response_started = False
+        rejected = False
+
+        async def limited_receive():
+            nonlocal received, rejected
+            if rejected:
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Answer now and make the app see a disconnect so parsing stops
+                    rejected = True
+                    if not response_started:
+                        await self._reject(send)
+                    return {"type": "http.disconnect"}
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if rejected:
+                return
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        await self.app(scope, limited_receive, tracking_send)
+
+    async def _reject(self, send):
+        body = json.dumps({"detail": f"Upload exceeds {self.max_bytes // (1024 * 1024)}MB limit"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
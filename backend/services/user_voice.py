@@ -1,19 +1,21 @@
 import os
-from groq import Groq
-from dotenv import load_dotenv
+from services.clients import get_groq
 
-load_dotenv()
-
-# Initialize Groq client
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
-
-def transcribe_with_groq(model_name: str, audio_file_path: str):
+def transcribe_with_groq(model_name: str, audio_file_path: str, audio_file=None):
     """
     Converts audio files to text using Groq's Whisper-large-v3.
+    Pass an open binary `audio_file` to stream an upload as-is; `audio_file_path`
+    then only supplies the filename Groq uses to detect the format.
     """
     try:
+        if audio_file is not None:
+            return get_groq().audio.transcriptions.create(
+                file=(os.path.basename(audio_file_path), audio_file),
+                model=model_name,
+                response_format="text",
+            )
         with open(audio_file_path, "rb") as file:
-            transcription = client.audio.transcriptions.create(
+            transcription = get_groq().audio.transcriptions.create(
                 file=(audio_file_path, file.read()),
                 model=model_name,
                 response_format="text",
@@ -21,4 +23,4 @@ def transcribe_with_groq(model_name: str, audio_file_path: str):
             return transcription
     except Exception as e:
         print(f"Transcription Error: {str(e)}")
-        return "Could not transcribe audio."
\ No newline at end of file
+        return "Could not transcribe audio."
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from services import batch_analysis_service
+from services.batch_analysis_service import _PairIndex, screen_regimens
+
+
+@pytest.fixture(autouse=True)
+def empty_pair_cache(monkeypatch):
+    monkeypatch.setattr(batch_analysis_service, "_pair_cache", {})
+
+
+def collect(regimens):
+    async def run():
+        return [record async for record in screen_regimens(regimens)]
+    return asyncio.run(run())
+
+
+def test_pairs_are_shared_across_patients():
+    index = _PairIndex([
+        ["Warfarin", "Ibuprofen", "Metformin"],
+        ["ibuprofen", "WARFARIN "],
+        ["metformin", "warfarin"],
+    ])
+
+    # {warfarin, ibuprofen, metformin} has three distinct pairs between them
+    assert len(index.unique_codes) == 3
+    assert len(index.names) == 3
+    shared = index.positions[0].tolist()
+    assert index.positions[1].tolist()[0] in shared
+    assert index.positions[2].tolist()[0] in shared
+
+
+def test_known_pairs_are_scored_without_the_model():
+    index = _PairIndex([["warfarin", "ibuprofen"], ["aspirin", "clopidogrel"]])
+    index.apply_known()
+
+    assert index.unresolved_slots() == []
+    assert index.regimen_report(0, "p1", ["warfarin", "ibuprofen"])["risk_level"] == "HIGH"
+    assert index.regimen_report(1, "p2", ["aspirin", "clopidogrel"])["risk_level"] == "MODERATE"
+
+
+def test_unresolved_pairs_are_not_reported_as_low():
+    index = _PairIndex([["metformin", "atorvastatin"], ["warfarin", "ibuprofen", "metformin"]])
+    index.apply_known()
+
+    report = index.regimen_report(0, "p1", ["metformin", "atorvastatin"])
+    assert report["risk_level"] == "UNKNOWN"
+    assert report["unresolved_pairs"] == [["atorvastatin", "metformin"]]
+
+    # A known HIGH pair can't be outranked by whatever the open pairs turn out to be
+    assert index.regimen_report(1, "p2", ["warfarin", "ibuprofen", "metformin"])["risk_level"] == "HIGH"
+
+
+def test_each_unique_pair_goes_to_the_model_once(monkeypatch):
+    asked = []
+
+    def fake_model(pairs):
+        asked.extend(pairs)
+        return {pair: {"risk_level": "LOW", "clinical_info": "", "simple_explanation": ""} for pair in pairs}
+
+    monkeypatch.setattr(batch_analysis_service, "_ask_model_for_pairs", fake_model)
+    records = collect([
+        ("p1", ["metformin", "atorvastatin"]),
+        ("p2", ["Atorvastatin", "Metformin"]),
+        ("p3", ["metformin", "atorvastatin", "warfarin", "ibuprofen"]),
+    ])
+
+    # warfarin + ibuprofen is known; the other five pairs are asked about once each
+    assert len(asked) == len(set(asked)) == 5
+    reports = {r["patient_id"]: r for r in records if "patient_id" in r}
+    assert reports["p1"]["risk_level"] == reports["p2"]["risk_level"] == "LOW"
+    assert reports["p3"]["risk_level"] == "HIGH"
+    assert records[-1]["summary"]["unique_pairs"] == 6
+    assert records[-1]["summary"]["unresolved_pairs"] == 0
+
+
+def test_pairs_the_model_skips_stay_unknown(monkeypatch):
+    monkeypatch.setattr(batch_analysis_service, "_ask_model_for_pairs", lambda pairs: {})
+    records = collect([("p1", ["metformin", "atorvastatin"])])
+
+    assert records[0]["risk_level"] == "UNKNOWN"
+    assert records[-1]["summary"]["unresolved_pairs"] == 1
+
+
+
+def test_model_risk_words_are_normalized(monkeypatch):
+    class Response:
+        text = (
+            '[{"drug_a": "Metformin", "drug_b": "Atorvastatin", "risk_level": "severe"},'
+            ' {"drug_a": "metformin", "drug_b": "lisinopril", "risk_level": "none"},'
+            ' {"drug_a": "atorvastatin", "drug_b": "lisinopril", "risk_level": "???"}]'
+        )
+
+    class Models:
+        def generate_content(self, **kwargs):
+            return Response()
+
+    class Client:
+        models = Models()
+
+    monkeypatch.setattr(batch_analysis_service, "get_gemini", lambda: Client())
+    answered = batch_analysis_service._ask_model_for_pairs(
+        [("atorvastatin", "metformin"), ("lisinopril", "metformin"), ("atorvastatin", "lisinopril")]
+    )
+
+    assert answered[("atorvastatin", "metformin")]["risk_level"] == "HIGH"
+    assert answered[("lisinopril", "metformin")]["risk_level"] == "NONE"
+    # Unrecognized words are left for the UNKNOWN path instead of guessed
+    assert ("atorvastatin", "lisinopril") not in answered
+
+
+def test_oversized_regimens_are_rejected():
+    from fastapi.testclient import TestClient
+
+    from app import app
+
+    client = TestClient(app)
+    ok = client.post("/api/analyze/batch", json={"regimens": [{"patient_id": "p1", "medication_list": ["warfarin", "ibuprofen"]}]})
+    assert ok.status_code == 200
+
+    meds = [f"drug{i}" for i in range(1000)]
+    response = client.post("/api/analyze/batch", json={"regimens": [{"patient_id": "p1", "medication_list": meds}]})
+    assert response.status_code == 422
+    assert response.json()["detail"][0]["loc"][-1] == "medication_list"
@@ -0,0 +1,72 @@
+import pytest
+
+from services import chat_cache
+from services.chat_cache import ChatAnswerCache, context_key, normalize_query, simhash
+
+QUESTION = "Can I take ibuprofen with my blood pressure medication?"
+
+
+@pytest.fixture
+def cache():
+    return ChatAnswerCache(ttl=60, max_entries=100, max_distance=3)
+
+
+def test_near_duplicate_question_hits(cache):
+    key = context_key(["Lisinopril"])
+    cache.put(key, QUESTION, "answer")
+
+    assert cache.get(key, "can i take ibuprofen with my blood pressure medication") == "answer"
+    assert cache.get(key, "Hey, can I take Ibuprofen with my blood pressure medication??") == "answer"
+
+
+def test_different_question_misses(cache):
+    key = context_key(["Lisinopril"])
+    cache.put(key, QUESTION, "answer")
+
+    assert cache.get(key, "Can I take ibuprofen with my thyroid medication?") is None
+    assert cache.get(key, "What are the side effects of lisinopril at night?") is None
+
+
+def test_fingerprint_distance():
+    base = simhash(normalize_query(QUESTION))
+    same = simhash(normalize_query("please " + QUESTION.upper()))
+    other = simhash(normalize_query("Is it safe to drink alcohol while on metformin?"))
+
+    assert base == same
+    assert (base ^ other).bit_count() > 3
+
+
+def test_answers_are_shared_only_within_the_same_context(cache):
+    cache.put(context_key(["Lisinopril"]), QUESTION, "answer")
+
+    # Another user on the same meds and profile shares the answer
+    assert cache.get(context_key(["LISINOPRIL"]), QUESTION) == "answer"
+    assert cache.get(context_key(["Lisinopril", "Metformin"]), QUESTION) is None
+    assert cache.get(context_key(["Lisinopril"], {"age": 70}), QUESTION) is None
+    # Med order and case don't change the context
+    assert cache.get(context_key([" lisinopril "]), QUESTION) == "answer"
+
+
+def test_short_follow_ups_are_not_cached(cache):
+    key = context_key([])
+    assert not cache.accepts("and that one?")
+    assert cache.accepts(QUESTION)
+    cache.put(key, "and that one?", "answer")
+    assert cache.get(key, "and that one?") is None
+
+
+def test_expired_and_evicted_entries(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(chat_cache.time, "monotonic", lambda: clock[0])
+    cache = ChatAnswerCache(ttl=60, max_entries=2, max_distance=3)
+    key = context_key([])
+
+    cache.put(key, QUESTION, "first")
+    clock[0] += 61
+    assert cache.get(key, QUESTION) is None
+
+    cache.put(key, "what is a normal resting heart rate", "a")
+    cache.put(key, "how much water should I drink daily", "b")
+    cache.put(key, "is it safe to exercise after eating", "c")
+    assert cache.get(key, "what is a normal resting heart rate") is None
+    assert cache.get(key, "is it safe to exercise after eating") == "c"
@@ -0,0 +1,93 @@
+import asyncio
+
+import pytest
+
+from services import chat_service
+from services.chat_cache import ChatAnswerCache
+
+QUESTION = "Can I take ibuprofen with my blood pressure medication?"
+
+
+class FakeMessages:
+    def __init__(self, history):
+        self.saved = list(history)
+        self.history_reads = 0
+
+    def add(self, doc):
+        self.saved.append(doc)
+
+    def order_by(self, *args, **kwargs):
+        self.history_reads += 1
+        return self
+
+    def limit(self, n):
+        return self
+
+    def stream(self):
+        return [type("Doc", (), {"to_dict": lambda self, d=doc: d})() for doc in reversed(self.saved)]
+
+
+class FakeFirestore:
+    def __init__(self):
+        self.chats = {}
+
+    # collection("chats").document(uid).collection("messages") -> that user's FakeMessages
+    def collection(self, name):
+        return self if name == "chats" else self.messages(self.user_id)
+
+    def document(self, user_id):
+        self.user_id = user_id
+        return self
+
+    def messages(self, user_id, history=()):
+        return self.chats.setdefault(user_id, FakeMessages(history))
+
+
+class FakeGemini:
+    def __init__(self):
+        self.calls = []
+        self.models = self
+
+    def generate_content(self, model, contents, config):
+        self.calls.append(contents)
+        return type("Response", (), {"text": f'{{"response_text": "answer {len(self.calls)}"}}'})()
+
+
+@pytest.fixture
+def chat(monkeypatch):
+    db, gemini = FakeFirestore(), FakeGemini()
+    monkeypatch.setattr(chat_service, "get_firestore", lambda: db)
+    monkeypatch.setattr(chat_service, "get_gemini", lambda: gemini)
+    monkeypatch.setattr(chat_service.history_index, "relevant_context", lambda user_id, text: "")
+    monkeypatch.setattr(chat_service.med_reports, "observe", lambda user_id, meds: None)
+    monkeypatch.setattr(chat_service, "chat_answer_cache", ChatAnswerCache(ttl=60, max_entries=10))
+    return db, gemini
+
+
+def ask(user_id, text, meds=("Lisinopril",)):
+    return asyncio.run(chat_service.get_chat_response(user_id, text, list(meds)))["text"]
+
+
+def test_cacheable_answers_are_generated_without_chat_history(chat):
+    db, gemini = chat
+    db.messages("u1", [{"role": "user", "text": "my private earlier message"}])
+
+    assert ask("u1", QUESTION) == "answer 1"
+    sent = str(gemini.calls[0])
+    assert "my private earlier message" not in sent
+    assert db.messages("u1").history_reads == 0
+
+    # Same meds and profile, different user: served from the cache
+    assert ask("u2", QUESTION.lower()) == "answer 1"
+    assert len(gemini.calls) == 1
+    assert ask("u3", QUESTION, meds=("Metformin",)) == "answer 2"
+
+
+def test_follow_ups_use_history_and_are_not_cached(chat):
+    db, gemini = chat
+    db.messages("u1", [{"role": "user", "text": QUESTION}, {"role": "model", "text": "answer 0"}])
+
+    assert ask("u1", "and ibuprofen?") == "answer 1"
+    assert db.messages("u1").history_reads == 1
+    assert QUESTION in str(gemini.calls[0])
+    assert ask("u1", "and ibuprofen?") == "answer 2"
@@ -0,0 +1,204 @@
+import asyncio
+import gzip
+
+import orjson
+import pytest
+
+from services import http_cache
+from services.http_cache import CompressionMiddleware, conditional_json, etag_matches, make_etag
+
+
+class FakeRequest:
+    def __init__(self, if_none_match=None):
+        self.headers = {"if-none-match": if_none_match} if if_none_match else {}
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches(monkeypatch):
+    monkeypatch.setattr(http_cache, "_bodies", http_cache._LRU(16))
+    monkeypatch.setattr(http_cache, "_compressed", http_cache._LRU(16))
+    monkeypatch.setattr(http_cache, "LONG_POLL_INTERVAL", 0.01)
+
+
+def test_etag_matching():
+    etag = make_etag("abc", 3)
+    assert etag == 'W/"abc-3"'
+    assert etag_matches('W/"abc-3"', etag)
+    assert etag_matches('"abc-3"', etag)
+    assert etag_matches('"x-1", W/"abc-3"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('W/"abc-2"', etag)
+    assert not etag_matches('W/"other-3"', etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches("", etag)
+
+
+def call(request, version, payload=None, wait=0, calls=None):
+    def build():
+        if calls is not None:
+            calls.append(1)
+        return payload or {"items": [1, 2, 3]}
+    return asyncio.run(conditional_json(request, "items", "abc", lambda: version[0], build, wait))
+
+
+def test_full_response_then_304():
+    version, calls = [1], []
+    response = call(FakeRequest(), version, calls=calls)
+    assert response.status_code == 200
+    assert response.headers["etag"] == 'W/"abc-1"'
+    assert orjson.loads(response.body) == {"items": [1, 2, 3]}
+
+    response = call(FakeRequest('W/"abc-1"'), version, calls=calls)
+    assert response.status_code == 304
+    assert response.body == b""
+
+    # Same version from another client: served from the body cache, not rebuilt
+    call(FakeRequest(), version, calls=calls)
+    assert len(calls) == 1
+
+
+def test_stale_etag_gets_the_new_version():
+    version = [2]
+    response = call(FakeRequest('W/"abc-1"'), version)
+    assert response.status_code == 200
+    assert response.headers["etag"] == 'W/"abc-2"'
+
+
+def test_long_poll_wakes_up_on_change():
+    version = [1]
+
+    async def run():
+        async def bump():
+            await asyncio.sleep(0.05)
+            version[0] = 2
+        bumper = asyncio.create_task(bump())
+        started = asyncio.get_running_loop().time()
+        response = await conditional_json(
+            FakeRequest('W/"abc-1"'), "items", "abc", lambda: version[0], lambda: {"v": version[0]}, wait=5
+        )
+        await bumper
+        return response, asyncio.get_running_loop().time() - started
+
+    response, elapsed = asyncio.run(run())
+    assert response.status_code == 200
+    assert response.headers["etag"] == 'W/"abc-2"'
+    assert orjson.loads(response.body) == {"v": 2}
+    assert elapsed < 1
+
+
+def test_long_poll_times_out_with_304():
+    response = call(FakeRequest('W/"abc-1"'), [1], wait=0.05)
+    assert response.status_code == 304
+
+
+# --- CompressionMiddleware ---
+
+def make_app(body_chunks, content_type=b"application/json", extra_headers=()):
+    async def app(scope, receive, send):
+        headers = [(b"content-type", content_type), *extra_headers]
+        if len(body_chunks) == 1:
+            headers.append((b"content-length", str(len(body_chunks[0])).encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        for i, chunk in enumerate(body_chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(body_chunks) - 1})
+    return app
+
+
+def drive(app, accept_encoding="gzip", path="/items"):
+    messages = []
+    headers = [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else []
+    scope = {"type": "http", "path": path, "headers": headers}
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(CompressionMiddleware(app, minimum_size=100)(scope, receive, send))
+    start = messages[0]
+    body = b"".join(m.get("body", b"") for m in messages[1:])
+    return dict(start["headers"]), body, messages
+
+
+BIG = orjson.dumps({"items": list(range(500))})
+
+
+def test_large_json_is_gzipped_with_vary():
+    headers, body, _ = drive(make_app([BIG]))
+    assert headers[b"content-encoding"] == b"gzip"
+    assert headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(body)
+    assert gzip.decompress(body) == BIG
+
+
+def test_existing_vary_is_extended():
+    headers, _, _ = drive(make_app([BIG], extra_headers=[(b"vary", b"Origin")]))
+    assert headers[b"vary"] == b"Origin, Accept-Encoding"
+
+
+def test_small_bodies_and_other_types_pass_through():
+    headers, body, _ = drive(make_app([b'{"ok": true}']))
+    assert b"content-encoding" not in headers and body == b'{"ok": true}'
+
+    headers, body, _ = drive(make_app([b"\x89PNG" * 100], content_type=b"image/png"))
+    assert b"content-encoding" not in headers
+
+
+def test_no_accept_encoding_passes_through():
+    headers, body, _ = drive(make_app([BIG]), accept_encoding="")
+    assert b"content-encoding" not in headers and body == BIG
+
+    headers, _, _ = drive(make_app([BIG]), accept_encoding="gzip;q=0")
+    assert b"content-encoding" not in headers
+
+
+def test_streamed_responses_are_not_buffered():
+    chunks = [b'{"line": %d}\n' % i * 20 for i in range(5)]
+    headers, body, messages = drive(make_app(chunks, content_type=b"application/x-ndjson"))
+    assert b"content-encoding" not in headers
+    # Every chunk is forwarded as its own message, in order
+    assert [m["body"] for m in messages[1:]] == chunks
+    assert body == b"".join(chunks)
+
+
+def test_compressed_body_is_reused_per_etag(monkeypatch):
+    compressed = []
+    real = http_cache._compress
+    monkeypatch.setattr(http_cache, "_compress", lambda body, enc: compressed.append(enc) or real(body, enc))
+    app = make_app([BIG], extra_headers=[(b"etag", b'W/"abc-1"')])
+    first = drive(app)[1]
+    second = drive(app)[1]
+    assert first == second
+    assert compressed == ["gzip"]
+
+
+def test_doctors_route_end_to_end(tmp_path):
+    from fastapi.testclient import TestClient
+
+    from app import app
+    from services import clients
+    from services.state_store import SQLiteStateStore
+
+    store = SQLiteStateStore(str(tmp_path / "state.db"))
+    clients.override("state", store)
+    try:
+        for i in range(30):
+            store.add("doctors", {"name": f"Dr. Example {i}", "location": "Pune", "speciality": "Cardiology"})
+        client = TestClient(app)
+
+        first = client.get("/doctors", headers={"Accept-Encoding": "gzip"})
+        assert first.status_code == 200
+        assert first.headers["content-encoding"] == "gzip"
+        assert len(first.json()["doctors"]) == 30
+
+        again = client.get("/doctors", headers={"If-None-Match": first.headers["etag"]})
+        assert again.status_code == 304
+
+        store.add("doctors", {"name": "Dr. New", "location": "Pune", "speciality": "Dermatology"})
+        changed = client.get("/doctors", headers={"If-None-Match": first.headers["etag"]})
+        assert changed.status_code == 200
+        assert len(changed.json()["doctors"]) == 31
+    finally:
+        clients.reset_overrides()
+        store.close()
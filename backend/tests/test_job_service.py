@@ -0,0 +1,82 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from services.job_service import DiagnosisJobQueue, DiagnosisJobStore, JobQueueFull
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    processed = []
+    queue = DiagnosisJobQueue(jobs_dir=str(tmp_path), workers=1, max_pending=2)
+    monkeypatch.setattr(queue, "_process", processed.append)
+    queue.processed = processed
+    yield queue
+    queue.stop()
+    if queue.store:
+        queue.store.close()
+
+
+def seed(path, job_id, status, worker_pid):
+    store = DiagnosisJobStore(path)
+    store.create({"id": job_id, "user_id": "u1", "status": status, "worker_pid": worker_pid})
+    store.close()
+
+
+def dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def wait_for(processed, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while len(processed) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_jobs_left_by_a_process_with_the_same_pid_are_resumed(queue, tmp_path):
+    # A restarted container worker usually comes back with the same PID
+    seed(str(tmp_path / "jobs.db"), "same-pid", "analyzing", os.getpid())
+    seed(str(tmp_path / "jobs.db"), "dead-pid", "transcribing", dead_pid())
+    seed(str(tmp_path / "jobs.db"), "finished", "done", os.getpid())
+
+    queue.start()
+    wait_for(queue.processed, 2)
+
+    assert sorted(queue.processed) == ["dead-pid", "same-pid"]
+    assert queue.store.get("same-pid")["worker_pid"] == os.getpid()
+
+
+def test_jobs_of_a_live_worker_are_left_alone(queue, tmp_path):
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        seed(str(tmp_path / "jobs.db"), "busy", "analyzing", other.pid)
+        queue.start()
+        assert queue.store.get("busy")["worker_pid"] == other.pid
+        assert queue.processed == []
+    finally:
+        other.kill()
+        other.wait()
+
+
+def test_create_enforces_the_pending_limit(tmp_path):
+    store = DiagnosisJobStore(str(tmp_path / "jobs.db"))
+    assert store.create({"id": "a", "user_id": "u", "status": "queued"}, max_active=2)
+    assert store.create({"id": "b", "user_id": "u", "status": "analyzing"}, max_active=2)
+    assert not store.create({"id": "c", "user_id": "u", "status": "queued"}, max_active=2)
+    store.update("a", status="done")
+    assert store.create({"id": "c", "user_id": "u", "status": "queued"}, max_active=2)
+    store.close()
+
+
+def test_submit_raises_when_full(queue):
+    queue.start()
+    queue.submit("u1")
+    queue.submit("u1")
+    with pytest.raises(JobQueueFull):
+        queue.submit("u1")
+    assert len([d for d in os.listdir(queue.jobs_dir) if d != "jobs.db" and not d.startswith("jobs.db")]) == 2
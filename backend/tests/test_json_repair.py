@@ -0,0 +1,74 @@
+import pytest
+
+from services.json_repair import loads_lenient, parse_model_output, repair_json
+from services.schemas import DrugAnalysis
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('```json\n{"a": 1}\n```', {"a": 1}),
+    ('Sure! Here it is: {"a": [1, 2]} Hope that helps.', {"a": [1, 2]}),
+    ('{"a": 1, "b": [1, 2,],}', {"a": 1, "b": [1, 2]}),
+    ("{'a': 'it\\'s'}", {"a": "it's"}),
+    ('{"a": True, "b": None, "c": False}', {"a": True, "b": None, "c": False}),
+    ('{risk_level: "HIGH", count: 2}', {"risk_level": "HIGH", "count": 2}),
+    ('{"a": "line one\nline two"}', {"a": "line one\nline two"}),
+    ('{“a”: “b”}', {"a": "b"}),
+    ('{"a": 1 // note\n, "b": /* gone */ 2}', {"a": 1, "b": 2}),
+    ('{"a": 1e3}', {"a": 1000.0}),
+])
+def test_common_defects_are_repaired(text, expected):
+    assert loads_lenient(text) == expected
+
+
+def test_truncated_reply_is_closed():
+    assert loads_lenient('{"details": [{"risk_level": "HIGH", "clinical_info": "CYP3A4 inhib') == {
+        "details": [{"risk_level": "HIGH", "clinical_info": "CYP3A4 inhib"}]
+    }
+    assert loads_lenient('{"a": [1, 2, {"b":') == {"a": [1, 2, {"b": None}]}
+
+
+def test_valid_json_is_untouched():
+    text = '{"a": "x, y}", "b": [1, {"c": "\\"q\\""}]}'
+    assert repair_json(text) == text
+
+
+def test_no_json_at_all():
+    assert repair_json("I can't help with that.") == ""
+    with pytest.raises(ValueError):
+        loads_lenient("I can't help with that.")
+
+
+def test_parse_model_output_validates_against_the_schema():
+    analysis = parse_model_output(
+        "```json\n{'risk_level': 'severe', 'interaction_count': 1, 'details': [{'risk_level': 'minor',},]}\n```",
+        DrugAnalysis,
+    )
+    assert analysis.risk_level == "HIGH"
+    assert analysis.details[0].risk_level == "LOW"
+
+
+def test_parse_model_output_keeps_none_level():
+    analysis = parse_model_output('{"risk_level": "NONE", "interaction_count": 0, "details": []}', DrugAnalysis)
+    assert analysis.risk_level == "NONE"
+
+
+def test_parse_model_output_rejects_unusable_output():
+    assert parse_model_output("no json here", DrugAnalysis) is None
+    assert parse_model_output('{"interaction_count": -1}', DrugAnalysis) is None
+
+
+def test_missing_risk_level_is_rejected():
+    assert parse_model_output("{}", DrugAnalysis) is None
+    assert parse_model_output('{"interaction_count": 0, "details": []}', DrugAnalysis) is None
+
+
+def test_reply_truncated_before_risk_level_is_rejected():
+    truncated = '{"interaction_count": 2, "details": [{"clinical_info": "Severe bleeding risk from additive anti'
+    assert loads_lenient(truncated) == {
+        "interaction_count": 2, "details": [{"clinical_info": "Severe bleeding risk from additive anti"}]
+    }
+    assert parse_model_output(truncated, DrugAnalysis) is None
+
+    # Top-level level present but a detail cut off before its own
+    partial = '{"risk_level": "LOW", "interaction_count": 1, "details": [{"clinical_info": "CYP3A4'
+    assert parse_model_output(partial, DrugAnalysis) is None
@@ -0,0 +1,75 @@
+import pytest
+
+from services import med_report_service
+from services.med_report_service import MedReportService, med_set_fingerprint, med_set_key
+
+MEDS = ["Warfarin", "Metformin"]
+MODEL_REPORT = {"risk_level": "MODERATE", "interaction_count": 0, "details": []}
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    svc = MedReportService(str(tmp_path / "reports.db"))
+    submitted = []
+    # Run precomputes inline instead of on the thread pool
+    monkeypatch.setattr(svc, "_submit", lambda fingerprint, meds: (submitted.append(fingerprint),
+                                                                   svc._compute(fingerprint, meds)))
+    svc.submitted = submitted
+    yield svc
+    svc._db().close()
+
+
+def fake_analysis(monkeypatch, result):
+    calls = []
+
+    async def analyze(medication_list):
+        calls.append(medication_list)
+        return result
+
+    monkeypatch.setattr(med_report_service, "analyze_medications", analyze)
+    return calls
+
+
+def test_model_report_is_stored_and_reused(service, monkeypatch):
+    calls = fake_analysis(monkeypatch, (MODEL_REPORT, True))
+
+    assert service.observe("u1", MEDS) is None
+    assert service.observe("u1", MEDS) == MODEL_REPORT
+    assert service.observe("u2", list(reversed(MEDS))) == MODEL_REPORT
+    assert len(calls) == 1
+
+
+def test_fallback_reports_are_not_stored(service, monkeypatch):
+    fake_analysis(monkeypatch, ({"risk_level": "LOW", "interaction_count": 0, "details": []}, False))
+    service.observe("u1", MEDS)
+    assert service.cached(MEDS) is None
+
+
+def test_failing_set_backs_off_instead_of_retrying_every_chat(service, monkeypatch):
+    calls = fake_analysis(monkeypatch, ({"risk_level": "LOW", "interaction_count": 0, "details": []}, False))
+
+    for _ in range(5):
+        service.observe("u1", MEDS)
+    assert len(calls) == 1
+
+    # Another user switching to the set is a change, and recomputes right away
+    service.observe("u2", MEDS)
+    assert len(calls) == 2
+
+    fingerprint = med_set_fingerprint(med_set_key(MEDS))
+    store = service._db()
+    first = store.record_failure(fingerprint)
+    second = store.record_failure(fingerprint)
+    assert second - first >= med_report_service.MED_REPORT_RETRY_SECONDS
+
+    # Once the backoff has passed the set is tried again, and success clears it
+    monkeypatch.setattr(store, "retry_due", lambda fp: True)
+    fake_analysis(monkeypatch, (MODEL_REPORT, True))
+    service.observe("u1", MEDS)
+    assert service.cached(MEDS) == MODEL_REPORT
+
+
+def test_single_medication_needs_no_report(service, monkeypatch):
+    calls = fake_analysis(monkeypatch, (MODEL_REPORT, True))
+    assert service.observe("u1", ["Warfarin"]) is None
+    assert calls == [] and service.submitted == []
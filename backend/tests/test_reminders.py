@@ -0,0 +1,123 @@
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+from services import reminder_service
+from services.reminder_service import LogSender, ReminderScheduler, ReminderSender, ReminderStore
+
+
+def reminder(reminder_id, due_at, appointment_id=1):
+    return {"id": reminder_id, "appointment_id": appointment_id, "channel": "email",
+            "recipient": "p@example.com", "due_at": due_at, "payload": {"doctorName": "Dr. A"}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReminderStore(str(tmp_path / "reminders.db"))
+    yield store
+    store.close()
+
+
+def status(store, reminder_id):
+    with store._lock:
+        return store._conn.execute("SELECT status FROM reminders WHERE id = ?", (reminder_id,)).fetchone()[0]
+
+
+def dead_pid() -> int:
+    proc = subprocess.Popen([sys.executable, "-c", "pass"])
+    proc.wait()
+    return proc.pid
+
+
+def test_sends_interrupted_by_a_restart_are_requeued_right_away(store):
+    now = time.time()
+    store.add_many([reminder("same", now - 30), reminder("dead", now - 30)])
+    store.claim(["same"], os.getpid())
+    store.claim(["dead"], dead_pid())
+
+    # A minute later, well inside the old 10 minute staleness window
+    store.recover(now + 60, os.getpid())
+    assert status(store, "same") == "pending"
+    assert status(store, "dead") == "pending"
+    assert sorted(r for r, _ in store.due_between(now - 3600, now + 3600)) == ["dead", "same"]
+
+
+def test_live_workers_keep_their_sends(store):
+    other = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+    try:
+        now = time.time()
+        store.add_many([reminder("busy", now)])
+        store.claim(["busy"], other.pid)
+        store.recover(now + 60, os.getpid())
+        assert status(store, "busy") == "sending"
+        # ...unless the send has been stuck for too long
+        store.recover(now + reminder_service.REMINDER_STALE_SEND_SECONDS + 1, os.getpid())
+        assert status(store, "busy") == "pending"
+    finally:
+        other.kill()
+        other.wait()
+
+
+def test_requeued_sends_still_respect_the_grace_period(store):
+    now = time.time()
+    store.add_many([reminder("old", now - reminder_service.REMINDER_GRACE_SECONDS - 60)])
+    store.claim(["old"], dead_pid())
+    store.recover(now, os.getpid())
+    assert status(store, "old") == "expired"
+
+
+def test_cancel_only_touches_pending_reminders(store):
+    now = time.time()
+    store.add_many([reminder("a", now + 60), reminder("b", now + 120), reminder("c", now + 60, appointment_id=2)])
+    store.claim(["b"], os.getpid())
+    assert store.cancel_appointment(1) == ["a"]
+    assert status(store, "c") == "pending"
+
+
+class RecordingSender(ReminderSender):
+    channel = "email"
+
+    def __init__(self):
+        self.sent = []
+
+    def send_batch(self, reminders):
+        self.sent.extend(r["id"] for r in reminders)
+        return [r["id"] for r in reminders]
+
+
+def test_scheduler_delivers_requeued_reminders_on_start(tmp_path):
+    path = str(tmp_path / "reminders.db")
+    store = ReminderStore(path)
+    now = time.time()
+    store.add_many([reminder("r1", now - 30)])
+    store.claim(["r1"], os.getpid())
+    store.close()
+
+    sender = RecordingSender()
+    scheduler = ReminderScheduler(path, senders={"email": sender, "whatsapp": LogSender("whatsapp")})
+    scheduler.start()
+    try:
+        deadline = time.monotonic() + 2
+        while not sender.sent and time.monotonic() < deadline:
+            time.sleep(0.01)
+    finally:
+        scheduler.stop()
+    assert sender.sent == ["r1"]
+
+
+def test_sender_must_implement_send_batch():
+    with pytest.raises(TypeError):
+        ReminderSender()
+
+
+def test_unparseable_booking_gets_no_reminders(tmp_path):
+    scheduler = ReminderScheduler(str(tmp_path / "reminders.db"), senders={})
+    scheduler.start()
+    try:
+        booking = {"id": 1, "date": "2030-01-02", "time": "10:30 AM", "patientEmail": "p@example.com"}
+        assert scheduler.schedule_appointment(booking) == 0
+    finally:
+        scheduler.stop()
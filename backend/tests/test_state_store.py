@@ -0,0 +1,135 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from services.state_store import SQLiteStateStore, StateStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "state.db")
+
+
+@pytest.fixture
+def store(path):
+    store = SQLiteStateStore(path)
+    yield store
+    store.close()
+
+
+def _allocate(path, count, queue):
+    store = SQLiteStateStore(path)
+    queue.put([store.next_id("appointments") for _ in range(count)])
+    store.close()
+
+
+def test_next_id_is_unique_across_threads(store):
+    ids = []
+    lock = threading.Lock()
+
+    def allocate():
+        got = [store.next_id("doctors") for _ in range(50)]
+        with lock:
+            ids.extend(got)
+
+    threads = [threading.Thread(target=allocate) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(ids) == list(range(1, 401))
+
+
+def test_next_id_is_unique_across_processes(path):
+    SQLiteStateStore(path).epoch  # create the schema once up front
+    ctx = multiprocessing.get_context("spawn")
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=_allocate, args=(path, 40, queue)) for _ in range(4)]
+    for p in procs:
+        p.start()
+    ids = [i for _ in procs for i in queue.get(timeout=60)]
+    for p in procs:
+        p.join()
+    assert sorted(ids) == list(range(1, 161))
+
+
+def test_ids_are_not_reused_after_delete_or_explicit_ids(store):
+    first = store.add("doctors", {"name": "A"})
+    assert first["id"] == 1
+    assert store.delete("doctors", 1)
+    assert store.add("doctors", {"name": "B"})["id"] == 2
+    store.add("doctors", {"id": 10, "name": "C"})
+    assert store.add("doctors", {"name": "D"})["id"] == 11
+
+
+def test_put_and_delete_bump_versions(store):
+    assert store.version("appointments") == 0
+    assert store.owner_version("appointments", "u1") == 0
+
+    store.add("appointments", {"date": "2030-01-01"}, owner="u1")
+    assert store.version("appointments") == 1
+    assert store.owner_version("appointments", "u1") == 1
+    assert store.owner_version("appointments", "u2") == 0
+
+    store.add("appointments", {"date": "2030-01-02"}, owner="u2")
+    assert store.version("appointments") == 2
+    assert store.owner_version("appointments", "u1") == 1
+
+    assert store.delete("appointments", 1)
+    assert store.version("appointments") == 3
+    assert store.owner_version("appointments", "u1") == 2
+    assert store.owner_version("appointments", "u2") == 1
+
+
+def test_delete_of_missing_id_is_a_no_op(store):
+    store.add("appointments", {"date": "2030-01-01"}, owner="u1")
+    versions = store.version("appointments"), store.owner_version("appointments", "u1")
+
+    assert store.delete("appointments", 99) is False
+    assert store.delete("appointments", 1) is True
+    assert store.delete("appointments", 1) is False
+    assert store.delete("nothing-here", 1) is False
+    assert store.version("appointments") == versions[0] + 1
+    assert store.owner_version("appointments", "u1") == versions[1] + 1
+
+
+def test_reads_see_writes_from_another_worker(path):
+    # Two stores on one file stand in for two uvicorn workers with their own caches
+    a, b = SQLiteStateStore(path), SQLiteStateStore(path)
+    try:
+        a.add("doctors", {"name": "A"})
+        a.add("appointments", {"date": "2030-01-01"}, owner="u1")
+        assert [d["name"] for d in b.all("doctors")] == ["A"]
+        assert len(b.by_owner("appointments", "u1")) == 1
+
+        a.add("doctors", {"name": "B"})
+        a.delete("appointments", 1)
+        assert [d["name"] for d in b.all("doctors")] == ["A", "B"]
+        assert b.by_owner("appointments", "u1") == []
+        assert a.epoch == b.epoch
+    finally:
+        a.close()
+        b.close()
+
+
+def test_get_and_by_owner(store):
+    store.add("appointments", {"date": "2030-01-01"}, owner="u1")
+    store.add("appointments", {"date": "2030-01-02"}, owner="u2")
+    store.add("appointments", {"date": "2030-01-03"}, owner="u1")
+    assert store.get("appointments", 2)["date"] == "2030-01-02"
+    assert store.get("appointments", 9) is None
+    assert [r["id"] for r in store.by_owner("appointments", "u1")] == [1, 3]
+
+
+def test_epoch_is_per_database(tmp_path):
+    a = SQLiteStateStore(str(tmp_path / "a.db"))
+    b = SQLiteStateStore(str(tmp_path / "b.db"))
+    assert a.epoch != b.epoch
+    a.close()
+    b.close()
+
+
+def test_state_store_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
@@ -0,0 +1,85 @@
+import random
+
+from services.timing_wheel import TimingWheel
+
+LEVELS = (4, 4, 4)  # 64-tick range, so tests cross every level and the overflow bucket
+
+
+def run(wheel, start, end):
+    """Advances one tick at a time and returns {tick: [payloads fired]}."""
+    fired = {}
+    for now in range(start + 1, end + 1):
+        due = wheel.advance(now)
+        if due:
+            fired[now] = sorted(due)
+    return fired
+
+
+def test_timers_fire_at_their_due_tick_across_levels():
+    wheel = TimingWheel(0, levels=LEVELS)
+    dues = [1, 3, 4, 5, 15, 16, 17, 63, 64, 65, 200]
+    for due in dues:
+        assert wheel.schedule(f"t{due}", due, due) == []
+
+    fired = run(wheel, 0, 250)
+    assert fired == {due: [due] for due in dues}
+    assert len(wheel) == 0
+
+
+def test_random_timers_fire_in_order_and_exactly_once():
+    rng = random.Random(7)
+    wheel = TimingWheel(1000, levels=LEVELS)
+    dues = {f"t{i}": 1000 + rng.randint(1, 300) for i in range(200)}
+    for key, due in dues.items():
+        wheel.schedule(key, due, key)
+
+    fired = run(wheel, 1000, 1400)
+    for tick, keys in fired.items():
+        assert all(dues[key] == tick for key in keys)
+    assert sorted(k for keys in fired.values() for k in keys) == sorted(dues)
+
+
+def test_fractional_due_rounds_up_and_big_jumps_fire_everything():
+    wheel = TimingWheel(0.5, levels=LEVELS)
+    wheel.schedule("a", 2.2, "a")
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+
+    wheel.schedule("b", 10, "b")
+    wheel.schedule("c", 100, "c")
+    assert sorted(wheel.advance(500)) == ["b", "c"]
+
+
+def test_past_due_is_returned_immediately():
+    wheel = TimingWheel(100, levels=LEVELS)
+    assert wheel.schedule("late", 99, "late") == ["late"]
+    assert wheel.schedule("now", 100, "now") == ["now"]
+    assert "late" not in wheel and len(wheel) == 0
+
+
+def test_cancel_removes_timer_at_any_level():
+    wheel = TimingWheel(0, levels=LEVELS)
+    for due in (2, 20, 70):
+        wheel.schedule(due, due, due)
+    assert wheel.cancel(20)
+    assert not wheel.cancel(20)
+    assert 20 not in wheel and len(wheel) == 2
+
+    assert run(wheel, 0, 100) == {2: [2], 70: [70]}
+
+
+def test_cancel_after_cascade():
+    wheel = TimingWheel(0, levels=LEVELS)
+    wheel.schedule("k", 40, "k")
+    wheel.advance(32)  # moved down out of the top level by now
+    assert "k" in wheel
+    assert wheel.cancel("k")
+    assert run(wheel, 32, 80) == {}
+
+
+def test_reschedule_replaces_the_old_timer():
+    wheel = TimingWheel(0, levels=LEVELS)
+    wheel.schedule("k", 10, "first")
+    wheel.schedule("k", 30, "second")
+    assert len(wheel) == 1
+    assert run(wheel, 0, 40) == {30: ["second"]}
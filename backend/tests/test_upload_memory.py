@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_benchmark(*args, **env):
+    return subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_upload_memory", *args],
+        cwd=BACKEND_DIR, env={**os.environ, **env}, capture_output=True, text=True, timeout=300,
+    )
+
+
+def test_concurrent_uploads_are_not_held_in_memory():
+    # Own process, so the RSS high-water mark belongs to this run alone
+    result = run_benchmark("--size-mb", "16", "--concurrency", "3")
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "statuses [200]" in result.stdout
+    assert "oversized upload: HTTP 413" in result.stdout
+
+
+def test_buffering_uploads_in_memory_is_caught():
+    # A spool threshold above the upload size keeps every upload in RAM
+    result = run_benchmark("--size-mb", "16", "--concurrency", "3", UPLOAD_SPOOL_THRESHOLD_KB="65536")
+    assert result.returncode == 1, result.stdout + result.stderr
+    assert "FAIL: peak RSS growth" in result.stdout
+
+
+def test_size_above_the_image_cap_is_reported():
+    result = run_benchmark("--size-mb", "8", MAX_IMAGE_UPLOAD_MB="4")
+    assert result.returncode == 2
+    assert "set MAX_IMAGE_UPLOAD_MB higher" in result.stdout